@@ -5,6 +5,7 @@ import plotly.graph_objects as go
 from datetime import datetime
 import json
 import io
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,11 +16,17 @@ from components.sidebar import render_sidebar
 from components.chat import render_chat_interface
 from components.charts import render_data_visualizations
 from components.analytics import render_advanced_analytics as render_analytics
+from components.ingestion_status import POLLING_SUPPORTED, POLL_INTERVAL, render_ingestion_status
+from components.index_advisor import render_index_advisor
 from utils.database import DatabaseManager
 from utils.llm_handler import LLMHandler
 from utils.data_processor import DataProcessor
 from utils.validators import validate_csv_file
-from config import APP_CONFIG
+from utils.ingestion import IngestionCache, ensure_table, table_name_for, with_sketches
+from utils.jobs import IngestionWorker
+from utils.index_advisor import IndexAdvisor
+from utils.dataset_cache import DatasetCache, dataset_key
+from config import APP_CONFIG, INDEX_ADVISOR_CONFIG
 
 # Page configuration
 st.set_page_config(
@@ -46,6 +53,9 @@ def initialize_session_state():
         "query_history": [],
         "user_preferences": {},
         "analytics_cache": {},
+        "ingestion_cache": None,
+        "ingestion_jobs": {},
+        "ingestion_pending": False,
         "database_connected": False
     }
 
@@ -53,6 +63,9 @@ def initialize_session_state():
         if key not in st.session_state:
             st.session_state[key] = default_value
 
+    if st.session_state.ingestion_cache is None:
+        st.session_state.ingestion_cache = IngestionCache()
+
 # Main application
 def main():
     load_css()
@@ -78,12 +91,14 @@ def main():
     # Pass the selected model to the LLMHandler
     llm_handler = LLMHandler(model_name=selected_options.get('model_choice', 'Gemini Pro'))
     data_processor = DataProcessor()
+    dataset_cache = DatasetCache()
+    index_advisor = get_index_advisor(db_manager.db_path) if INDEX_ADVISOR_CONFIG['enabled'] else None
 
 
     # Main content area
     if uploaded_files:
         # File processing
-        processed_data = handle_file_upload(uploaded_files, db_manager, data_processor)
+        processed_data = handle_file_upload(uploaded_files, db_manager, data_processor, dataset_cache)
 
         if processed_data:
             # Create tabs for different features
@@ -92,7 +107,12 @@ def main():
             ])
 
             with tab1:
-                render_chat_interface(processed_data, llm_handler, db_manager)
+                # Chat queries the database, so it waits for the full tables
+                loaded_data = [data for data in processed_data if not data.get('sampled')]
+                if loaded_data:
+                    render_chat_interface(loaded_data, llm_handler, db_manager)
+                else:
+                    st.info("💬 AI Chat becomes available once the full dataset has loaded.")
 
             with tab2:
                 render_data_visualizations(processed_data)
@@ -101,34 +121,100 @@ def main():
                 render_analytics(processed_data)
 
             with tab4:
-                render_settings_panel()
+                render_settings_panel(db_manager, index_advisor)
+
+        # Without fragments the page itself has to poll running jobs
+        if st.session_state.ingestion_pending and not POLLING_SUPPORTED:
+            time.sleep(POLL_INTERVAL)
+            st.rerun()
     else:
         render_welcome_screen()
 
-def handle_file_upload(uploaded_files, db_manager, data_processor):
-    """Process uploaded files and return processed data"""
+@st.cache_resource
+def get_ingestion_worker(db_path):
+    """Background ingestion worker shared across sessions"""
+    return IngestionWorker(db_path)
+
+@st.cache_resource
+def get_index_advisor(db_path):
+    """Background index advisor shared across sessions"""
+    advisor = IndexAdvisor(DatabaseManager(db_path))
+    advisor.start()
+    return advisor
+
+def handle_file_upload(uploaded_files, db_manager, data_processor, dataset_cache=None):
+    """Process uploaded files and return the ones that are ready
+
+    New files are ingested in the background; their progress is shown while
+    already-finished datasets are returned for the tabs. Large files still
+    loading are returned as a random sample, flagged with 'sampled'.
+    """
     try:
-        processed_files = []
+        cache = st.session_state.ingestion_cache
+        jobs = st.session_state.ingestion_jobs
+        worker = get_ingestion_worker(db_manager.db_path)
+        dataset_cache = dataset_cache or DatasetCache()
+        settings_key = data_processor.get_settings_key()
+        live_keys = []
+        pending_jobs = []
+        sampled_jobs = []
+        samples = {}
 
         for file in uploaded_files:
-            # Validate file
-            if validate_csv_file(file):
-                # Process file
-                df = pd.read_csv(file)
-                processed_df = data_processor.clean_and_process(df, file.name)
-
-                # Store in database
-                table_name = f"data_{file.name.split('.')[0].lower()}"
-                db_manager.store_dataframe(processed_df, table_name)
-
-                processed_files.append({
-                    'name': file.name,
-                    'table': table_name,
-                    'dataframe': processed_df,
-                    'stats': data_processor.get_basic_stats(processed_df)
-                })
+            # Reuse the processed result when the content and settings are unchanged
+            cache_key = cache.make_key(file, settings_key)
+            live_keys.append(cache_key)
+            if cache.get(cache_key) is not None:
+                continue
+
+            # Then try the on-disk columnar cache from earlier sessions
+            source_key = dataset_key(cache_key[1], settings_key, table_name_for(file.name))
+            cached_entry = dataset_cache.load(source_key)
+            if cached_entry is not None:
+                ensure_table(cached_entry, db_manager, source_key)
+                cache.put(cache_key, with_sketches(cached_entry, db_manager))
+                continue
 
+            # Collect the result of a background job submitted on an earlier run
+            if cache_key in jobs:
+                job_id = jobs[cache_key]
+                entry = worker.take_result(job_id, source_key)
+                if entry is not None:
+                    entry['fingerprint'] = cache_key[1]
+                    cache.put(cache_key, with_sketches(entry, db_manager))
+                    del jobs[cache_key]
+                    continue
+
+                job = db_manager.get_ingestion_jobs([job_id])
+                if job and job[0]['state'] == 'failed':
+                    st.error(f"Error processing {file.name}: {job[0]['error_message']}")
+                else:
+                    pending_jobs.append(job_id)
+                    sample = worker.get_sample(job_id)
+                    if sample is not None:
+                        samples[cache_key] = sample
+                        sampled_jobs.append(job_id)
+                continue
+
+            # Validate file; the sniff result is handed on to the parser
+            sniff = validate_csv_file(file)
+            if sniff:
+                jobs[cache_key] = worker.submit(file, data_processor.settings, sniff, source_key)
+                pending_jobs.append(jobs[cache_key])
+
+        if pending_jobs:
+            render_ingestion_status(pending_jobs, db_manager, sampled_jobs)
+
+        processed_files = [
+            cache.get(key) if cache.get(key) is not None else samples.get(key)
+            for key in live_keys
+        ]
+        processed_files = [entry for entry in processed_files if entry is not None]
+        cache.retain(live_keys)
+        for key in [k for k in jobs if k not in live_keys]:
+            del jobs[key]
         st.session_state.processed_files = processed_files
+        st.session_state.ingestion_pending = bool(pending_jobs)
         return processed_files
 
     except Exception as e:
@@ -169,11 +255,21 @@ def render_welcome_screen():
         with col2:
             st.info("Upload your CSV files to get started with real data analysis")
 
-def render_settings_panel():
+def render_settings_panel(db_manager, index_advisor=None):
     """Render application settings"""
     st.subheader("⚙️ Application Settings")
     st.info("Settings panel is under construction.")
 
+    st.markdown("### ⚡ Query Cache")
+    cache_stats = db_manager.query_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Cached Results", cache_stats['entries'])
+    col2.metric("Hits", cache_stats['hits'])
+    col3.metric("Misses", cache_stats['misses'])
+    col4.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+
+    render_index_advisor(db_manager, index_advisor)
+
 def load_sample_data():
     """Load a sample dataset."""
     st.info("Sample data loading is under construction.")
@@ -6,6 +6,10 @@ from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 import plotly.express as px
 import plotly.graph_objects as go
+from components.charts import sketch_box
+from components.ingestion_status import render_sample_badge
+from utils.data_processor import DataProcessor
+from utils.sketch import QuantileSketch
 
 def render_advanced_analytics(processed_data):
     """Render advanced analytics and insights"""
@@ -31,14 +35,15 @@ def render_advanced_analytics(processed_data):
         return
     
     df = selected_data['dataframe']
+    render_sample_badge(selected_data)
     
     # Analytics tabs
-    tab1, tab2, tab3, tab4 = st.tabs([
-        "📊 Statistical Summary", "🎯 Clustering", "📈 Trends", "🔍 Outliers"
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+        "📊 Statistical Summary", "🎯 Clustering", "📈 Trends", "🔍 Outliers", "🧹 Cleaning"
     ])
     
     with tab1:
-        render_statistical_summary(df)
+        render_statistical_summary(df, selected_data.get('row_hashes'), selected_data.get('profile'))
     
     with tab2:
         render_clustering_analysis(df)
@@ -47,10 +52,47 @@ def render_advanced_analytics(processed_data):
         render_trend_analysis(df)
     
     with tab4:
-        render_outlier_detection(df)
+        render_outlier_detection(df, selected_data.get('sketches'))
+    
+    with tab5:
+        render_cleaning_report(selected_data)
+
+def render_cleaning_report(data):
+    """Per-stage timing and memory of the cleaning run, with its log"""
+    
+    st.markdown("### 🧹 Cleaning Pipeline")
+    
+    metrics = data.get('stage_metrics') or []
+    if metrics:
+        table = pd.DataFrame([{
+            'Stage': m['stage'],
+            'Seconds': round(m['seconds'], 3),
+            'Rows in': m['rows_in'],
+            'Rows out': m['rows_out'],
+            'Cells changed': m['cells_touched'],
+            'Memory before (MB)': round(m['memory_before'] / 1024**2, 2),
+            'Memory after (MB)': round(m['memory_after'] / 1024**2, 2)
+        } for m in metrics])
+        st.dataframe(table, use_container_width=True, hide_index=True)
+        
+        fig = px.bar(table, x='Stage', y='Seconds', title="Time per Cleaning Stage")
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("Stage metrics are recorded for files cleaned in memory; large files are cleaned in chunks.")
+    
+    with st.expander("Processing log"):
+        for line in data.get('processing_log', []):
+            st.text(line)
 
-def render_statistical_summary(df):
-    """Comprehensive statistical summary"""
+def render_statistical_summary(df, row_hashes=None, profile=None):
+    """Comprehensive statistical summary
+    
+    Figures come from the dataset `profile` built at ingest; datasets
+    without one are profiled here, using `row_hashes` for duplicates.
+    """
+    
+    profile = profile or DataProcessor().build_profile(df, row_hashes)
+    columns = profile['columns']
     
     col1, col2 = st.columns(2)
     
@@ -58,12 +100,12 @@ def render_statistical_summary(df):
         st.markdown("**📊 Dataset Overview**")
         
         overview_metrics = {
-            "Total Records": len(df),
-            "Total Columns": len(df.columns),
-            "Numeric Columns": len(df.select_dtypes(include=['number']).columns),
-            "Categorical Columns": len(df.select_dtypes(include=['object']).columns),
-            "Missing Values": df.isnull().sum().sum(),
-            "Duplicate Rows": df.duplicated().sum()
+            "Total Records": profile['row_count'],
+            "Total Columns": profile['column_count'],
+            "Numeric Columns": profile['numeric_columns'],
+            "Categorical Columns": profile['categorical_columns'],
+            "Missing Values": profile['missing_values'],
+            "Duplicate Rows": profile['duplicate_rows']
         }
         
         for metric, value in overview_metrics.items():
@@ -73,7 +115,10 @@ def render_statistical_summary(df):
         st.markdown("**🎯 Data Quality Metrics**")
         
         # Completeness
-        completeness = (1 - df.isnull().sum() / len(df)) * 100
+        completeness = pd.Series({
+            col: (1 - column['nulls'] / profile['row_count']) * 100 if profile['row_count'] else 0.0
+            for col, column in columns.items()
+        }, dtype='float64')
         avg_completeness = completeness.mean()
         
         st.metric("Average Completeness", f"{avg_completeness:.1f}%")
@@ -90,24 +135,20 @@ def render_statistical_summary(df):
             st.plotly_chart(fig, use_container_width=True)
     
     # Detailed statistics for numeric columns
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    if len(numeric_cols) > 0:
+    numeric_stats = {
+        col: column for col, column in columns.items() if column['kind'] == 'numeric'
+    }
+    if numeric_stats:
         st.markdown("**📈 Numeric Column Statistics**")
         
-        # Enhanced describe
-        desc_stats = df[numeric_cols].describe()
-        
-        # Add additional statistics
-        additional_stats = pd.DataFrame({
+        # Describe columns plus shape statistics
+        full_stats = pd.DataFrame({
             col: {
-                'skewness': stats.skew(df[col].dropna()),
-                'kurtosis': stats.kurtosis(df[col].dropna()),
-                'cv': df[col].std() / df[col].mean() if df[col].mean() != 0 else 0
-            } for col in numeric_cols
-        }).T
-        
-        # Combine statistics
-        full_stats = pd.concat([desc_stats.T, additional_stats], axis=1)
+                **{key: column[key] for key in
+                   ('count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max', 'skewness', 'kurtosis')},
+                'cv': column['std'] / column['mean'] if column['mean'] and column['std'] is not None else 0
+            } for col, column in numeric_stats.items()
+        }, dtype='float64').T
         st.dataframe(full_stats.round(3))
 
 def render_clustering_analysis(df):
@@ -279,8 +320,12 @@ def render_trend_analysis(df):
                 trend_direction = "📈 Increasing" if slope > 0 else "📉 Decreasing"
                 st.metric("Direction", trend_direction)
 
-def render_outlier_detection(df):
-    """Detect and visualize outliers"""
+def render_outlier_detection(df, sketches=None):
+    """Detect and visualize outliers
+    
+    `sketches` are the dataset's stored column sketches; when one exists for
+    the selected column, quartiles, median and box whiskers come from it.
+    """
     
     st.markdown("**🔍 Outlier Detection**")
     
@@ -302,10 +347,15 @@ def render_outlier_detection(df):
         st.warning("No data available after removing missing values")
         return
     
+    sketch = QuantileSketch.from_dict(sketches[selected_col]) if sketches and selected_col in sketches else None
+    
     # Detect outliers based on method
     if method == "IQR":
-        Q1 = data.quantile(0.25)
-        Q3 = data.quantile(0.75)
+        if sketch is not None:
+            Q1, Q3 = sketch.quantile([0.25, 0.75])
+        else:
+            Q1 = data.quantile(0.25)
+            Q3 = data.quantile(0.75)
         IQR = Q3 - Q1
         lower_bound = Q1 - 1.5 * IQR
         upper_bound = Q3 + 1.5 * IQR
@@ -317,7 +367,7 @@ def render_outlier_detection(df):
         outliers = data[z_scores > threshold]
         
     else:  # Modified Z-Score
-        median = np.median(data)
+        median = sketch.quantile(0.5) if sketch is not None else np.median(data)
         mad = np.median(np.abs(data - median))
         modified_z_scores = 0.6745 * (data - median) / mad
         threshold = st.slider("Modified Z-Score Threshold", 2.0, 5.0, 3.5, 0.1)
@@ -341,13 +391,25 @@ def render_outlier_detection(df):
     # Visualization
     fig = go.Figure()
     
-    # Box plot
-    fig.add_trace(go.Box(
-        y=data,
-        name=selected_col,
-        boxpoints='outliers',
-        marker_color='blue'
-    ))
+    # Box plot; a sketch-drawn box only needs the outlier points themselves
+    box = sketch_box(sketches, selected_col)
+    if box is not None:
+        box.marker.color = 'blue'
+        fig.add_trace(box)
+        fig.add_trace(go.Scatter(
+            x=[selected_col] * len(outliers),
+            y=outliers,
+            mode='markers',
+            name='Outliers',
+            marker_color='blue'
+        ))
+    else:
+        fig.add_trace(go.Box(
+            y=data,
+            name=selected_col,
+            boxpoints='outliers',
+            marker_color='blue'
+        ))
     
     fig.update_layout(
         title=f"Outlier Detection: {selected_col} ({method} Method)",
@@ -3,6 +3,8 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 from datetime import datetime
+from components.ingestion_status import render_sample_badge
+from utils.sketch import QuantileSketch
 
 def render_data_visualizations(processed_data):
     """Render comprehensive data visualizations"""
@@ -28,6 +30,7 @@ def render_data_visualizations(processed_data):
         return
     
     df = selected_data['dataframe']
+    render_sample_badge(selected_data)
     
     # Visualization tabs
     viz_tab1, viz_tab2, viz_tab3, viz_tab4 = st.tabs([
@@ -35,7 +38,7 @@ def render_data_visualizations(processed_data):
     ])
     
     with viz_tab1:
-        render_basic_charts(df)
+        render_basic_charts(df, selected_data.get('sketches'))
     
     with viz_tab2:
         render_advanced_analytics(df)
@@ -46,14 +49,27 @@ def render_data_visualizations(processed_data):
     with viz_tab4:
         render_custom_visualizations(df)
 
-def render_basic_charts(df):
+def sketch_box(sketches, column):
+    """Box trace drawn from a column's stored quantile sketch, or None
+
+    Only the five summary numbers reach the browser instead of every value.
+    """
+    if not sketches or column not in sketches:
+        return None
+    sketch = QuantileSketch.from_dict(sketches[column])
+    if sketch.count == 0:
+        return None
+    summary = sketch.box_stats()
+    return go.Box(x=[column], name=column, **{key: [value] for key, value in summary.items()})
+
+def render_basic_charts(df, sketches=None):
     """Render basic chart types"""
     
     col1, col2 = st.columns(2)
     
     # Column type analysis
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns.tolist()
     
     with col1:
         st.markdown("**📈 Numeric Data Charts**")
@@ -68,7 +84,12 @@ def render_basic_charts(df):
             st.plotly_chart(fig_hist, use_container_width=True)
             
             # Box plot
-            fig_box = px.box(df, y=selected_numeric, title=f"Box Plot - {selected_numeric}")
+            box = sketch_box(sketches, selected_numeric)
+            if box is not None:
+                fig_box = go.Figure(box)
+                fig_box.update_layout(title=f"Box Plot - {selected_numeric}")
+            else:
+                fig_box = px.box(df, y=selected_numeric, title=f"Box Plot - {selected_numeric}")
             fig_box.update_layout(height=300)
             st.plotly_chart(fig_box, use_container_width=True)
     
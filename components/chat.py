@@ -3,8 +3,13 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import pandas as pd # Added missing import
 
+# Questions run here so the script thread stays responsive while a query runs
+_question_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-question")
+
 def render_chat_interface(processed_data, llm_handler, db_manager):
     """Render advanced chat interface with AI capabilities"""
 
@@ -16,7 +21,7 @@ def render_chat_interface(processed_data, llm_handler, db_manager):
     # Display chat history
     with chat_container:
         for i, message in enumerate(st.session_state.messages):
-            render_message(message, i)
+            render_message(message, i, db_manager)
 
     # Chat input
     col1, col2 = st.columns([4, 1])
@@ -45,7 +50,7 @@ def render_chat_interface(processed_data, llm_handler, db_manager):
         )
         del st.session_state.quick_question
 
-def render_message(message, index):
+def render_message(message, index, db_manager):
     """Render individual chat message with enhanced styling"""
 
     if message["role"] == "user":
@@ -61,6 +66,7 @@ def render_message(message, index):
             # Display results if available
             if "results" in message:
                 render_query_results(message["results"], message.get("query_type", "table"))
+                render_row_count(message, index, db_manager)
 
             # Display visualizations if available
             if "visualization" in message:
@@ -95,15 +101,26 @@ def handle_user_input(user_input, processed_data, llm_handler, db_manager):
         "timestamp": datetime.now()
     })
 
+    # A question still running from an earlier run of this session is abandoned
+    previous = st.session_state.get('question_cancel')
+    if previous is not None:
+        previous.set()
+    cancel_event = threading.Event()
+    st.session_state.question_cancel = cancel_event
+
     # Show typing indicator
     with st.spinner("🤖 HealthGenAI is analyzing..."):
 
         try:
             # Determine query type and process
-            query_result = llm_handler.process_natural_language_query(
-                user_input,
-                processed_data,
-                db_manager
+            query_result = run_cancellable(
+                lambda: llm_handler.process_natural_language_query(
+                    user_input,
+                    processed_data,
+                    db_manager,
+                    cancel_event=cancel_event
+                ),
+                cancel_event
             )
 
             # Create response message
@@ -117,6 +134,7 @@ def handle_user_input(user_input, processed_data, llm_handler, db_manager):
             # Add results if available
             if "data" in query_result and query_result["data"] is not None:
                 response_message["results"] = query_result["data"]
+                response_message["sql_query"] = query_result.get("sql_query")
 
             # Add visualization if suggested
             if query_result.get("suggest_visualization"):
@@ -149,6 +167,28 @@ def handle_user_input(user_input, processed_data, llm_handler, db_manager):
     # Rerun to show new messages
     st.rerun()
 
+def run_cancellable(func, cancel_event):
+    """Run func in a worker thread, setting cancel_event if this run is stopped
+
+    Streamlit stops a script run (for instance when a new question is
+    submitted) by raising in the script thread at its next Streamlit call,
+    so the wait keeps updating an elapsed-time caption.
+    """
+    future = _question_executor.submit(func)
+    status = st.empty()
+    started = time.time()
+    try:
+        while True:
+            try:
+                return future.result(timeout=0.25)
+            except FutureTimeout:
+                status.caption(f"⏱️ Running for {time.time() - started:.0f}s")
+    except BaseException:
+        cancel_event.set()
+        raise
+    finally:
+        status.empty()
+
 def render_query_results(results, query_type):
     """Render query results with appropriate formatting"""
 
@@ -162,6 +202,11 @@ def render_query_results(results, query_type):
     else:
         df = results
 
+    if df.attrs.get('total_rows'):
+        st.caption(f"✂️ Showing the first {len(df):,} of {df.attrs['total_rows']:,} rows.")
+    elif df.attrs.get('truncated'):
+        st.caption(f"✂️ Showing the first {len(df):,} rows; the query returned more.")
+
     # Display based on query type
     if query_type == "count" or len(df) == 1:
         # Show as metric
@@ -189,6 +234,26 @@ def render_query_results(results, query_type):
                 mime="text/csv"
             )
 
+def render_row_count(message, index, db_manager):
+    """Offer to count all rows of a cut-off result
+
+    Counting runs the query again in full, so it is only done on request.
+    """
+    df = message["results"]
+    if not isinstance(df, pd.DataFrame) or not df.attrs.get('truncated') or df.attrs.get('total_rows'):
+        return
+    if not message.get("sql_query"):
+        return
+
+    if st.button("🔢 Count all rows", key=f"count_{index}"):
+        try:
+            with st.spinner("Counting rows..."):
+                df.attrs['total_rows'] = db_manager.count_rows(message["sql_query"])
+        except Exception as e:
+            st.warning(f"Could not count the rows: {str(e)}")
+            return
+        st.rerun()
+
 def show_suggested_questions(processed_data):
     """Show suggested questions based on data"""
 
@@ -230,7 +295,7 @@ def generate_smart_suggestions(processed_data):
                 f"Find outliers in {col}"
             ])
 
-        categorical_cols = df.select_dtypes(include=['object']).columns
+        categorical_cols = df.select_dtypes(include=['object', 'category', 'string']).columns
         if len(categorical_cols) > 0:
             col = categorical_cols[0]
             suggestions.extend([
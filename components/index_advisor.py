@@ -0,0 +1,40 @@
+import json
+
+import streamlit as st
+
+
+def render_index_advisor(db_manager, advisor=None):
+    """Render the index advisor's decisions with their measured latencies"""
+    st.markdown("### 🗂️ Index Advisor")
+    st.caption(
+        "Indexes are created in the background for columns the chat's queries "
+        "filter, join, group or sort on, and kept only when they make those queries faster."
+    )
+
+    if advisor is not None and st.button("Analyze query workload now"):
+        with st.spinner("Analyzing recorded queries..."):
+            decisions = advisor.run_once()
+        if decisions is None:
+            st.info("The advisor is already running in the background.")
+        elif not decisions:
+            st.info("No index changes recommended for the current workload.")
+
+    history = db_manager.get_index_recommendations()
+    if history.empty:
+        st.info("No recommendations yet. They appear once queries have been run against your data.")
+        return
+
+    speedup = history['before_ms'] / history['after_ms']
+    table = history.assign(
+        uses=history['uses'].map(lambda uses: ", ".join(f"{kind} ×{count}" for kind, count in json.loads(uses).items())),
+        speedup=speedup.round(1).map(lambda value: f"{value}×", na_action='ignore')
+    )[['created_at', 'action', 'table_name', 'column_name', 'uses', 'before_ms', 'after_ms', 'speedup']]
+
+    st.dataframe(
+        table.rename(columns={
+            'created_at': 'When', 'action': 'Action', 'table_name': 'Table', 'column_name': 'Column',
+            'uses': 'Uses', 'before_ms': 'Before (ms)', 'after_ms': 'After (ms)', 'speedup': 'Speedup'
+        }).round({'Before (ms)': 2, 'After (ms)': 2}),
+        use_container_width=True,
+        hide_index=True
+    )
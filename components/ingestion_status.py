@@ -0,0 +1,63 @@
+import streamlit as st
+
+from utils.jobs import FINISHED_STATES
+
+# st.fragment (Streamlit >= 1.37) lets the status panel refresh on its own
+POLLING_SUPPORTED = hasattr(st, 'fragment')
+POLL_INTERVAL = 1.0
+
+
+def _polling(func):
+    if POLLING_SUPPORTED:
+        return st.fragment(run_every=POLL_INTERVAL)(func)
+    return func
+
+
+@_polling
+def render_ingestion_status(job_ids, db_manager, sampled_job_ids=()):
+    """Render progress for background ingestion jobs
+
+    Polls the ingestion_jobs table and reruns the whole app once any job
+    finishes or has a sample ready that is not shown yet, so its dataset
+    shows up in the tabs.
+    """
+    jobs = db_manager.get_ingestion_jobs(job_ids)
+
+    if POLLING_SUPPORTED and any(
+        job['state'] in FINISHED_STATES
+        or (job['sample_rows'] and job['id'] not in sampled_job_ids)
+        for job in jobs
+    ):
+        st.rerun()
+
+    if not jobs:
+        return
+
+    st.markdown("### ⏳ Loading Datasets")
+    for job in jobs:
+        rows = job['rows_processed'] or 0
+        total = job['total_rows']
+        elapsed = job['elapsed'] or 0
+        if job['sample_rows']:
+            st.caption(f"🧪 {job['file_name']}: a sample of {job['sample_rows']:,} rows is ready to explore")
+
+        if job['state'] == 'queued':
+            st.progress(0.0, text=f"📄 {job['file_name']} - waiting to start")
+        elif job['state'] == 'storing':
+            st.progress(1.0, text=f"📄 {job['file_name']} - writing {total or 0:,} rows to the database ({elapsed:.1f}s)")
+        else:
+            fraction = min(rows / total, 1.0) if total else 0.0
+            total_text = f"{total:,}" if total else "?"
+            st.progress(fraction, text=f"📄 {job['file_name']} - {rows:,} / {total_text} rows processed ({elapsed:.1f}s)")
+
+
+def render_sample_badge(data):
+    """Flag results computed on a sample of a dataset that is still loading"""
+    if not data.get('sampled'):
+        return
+    total = data.get('total_rows')
+    total_text = f" of {total:,}" if total else ""
+    st.warning(
+        f"🧪 Sampled: showing {len(data['dataframe']):,}{total_text} rows. "
+        "Results switch to the full dataset when loading finishes."
+    )
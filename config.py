@@ -31,7 +31,15 @@ UTILS_DIR = BASE_DIR / "utils"
 DATABASE_CONFIG = {
     "path": "healthgenai_pro.db",
     "backup_interval": 3600,  # seconds
-    "max_query_history": 10000
+    "max_query_history": 10000,
+    "pool_readers": 4,  # read-only connections kept open per process
+    "busy_timeout": 5.0,  # seconds to wait for another process's write lock
+    "cache_size_kb": 64 * 1024,  # page cache per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "bulk_batch_rows": 50000,  # rows per executemany call when loading a table
+    "query_log_batch_rows": 100,  # query_history rows written per commit
+    "query_log_flush_ms": 500,  # longest a logged query waits to be written
+    "query_log_max_queued": 10000  # further entries are dropped (and counted) until the writer catches up
 }
 
 # AI Model Configuration
@@ -56,6 +64,29 @@ UPLOAD_CONFIG = {
     "max_files": 10
 }
 
+# Incremental Ingestion Configuration
+INCREMENTAL_CONFIG = {
+    # Tables listed here are upserted on their primary key instead of replaced
+    "primary_keys": {
+        "data_health_dataset_2": ["Patient_Number", "Day_Number"]
+    }
+}
+
+# Index Advisor Configuration
+INDEX_ADVISOR_CONFIG = {
+    "enabled": True,
+    "interval": 300,  # seconds between background runs
+    "workload_size": 500,  # most recent successful queries analysed
+    "min_uses": 3,  # filter/join/group/order uses before a column is worth an index
+    "min_rows": 10000,  # smaller tables scan fast enough without one
+    "max_new_indexes": 3,  # per run
+    "max_timed_queries": 5,  # queries timed before and after creating an index
+    "timing_runs": 3,  # best of this many runs per query
+    "max_query_seconds": 5.0,  # slower queries are left out of the measurement
+    "min_speedup": 1.2,  # before/after latency ratio needed to keep an index
+    "retry_rejected_after": 24 * 3600  # seconds before a rejected column is tried again
+}
+
 # UI Configuration
 UI_CONFIG = {
     "theme": "light",
@@ -77,8 +108,40 @@ SECURITY_CONFIG = {
 PERFORMANCE_CONFIG = {
     "cache_ttl": 300,  # seconds
     "max_cache_size": 100,  # number of cached items
-    "query_timeout": 30,  # seconds
-    "chunk_size": 1000  # rows for large datasets
+    "query_cache_max_rows": 100000,  # larger query results are not cached
+    "query_timeout": 30,  # seconds; longer queries are interrupted
+    "query_max_rows": 100000,  # rows a query may return; the rest are never read
+    "query_batch_rows": 10000,  # rows fetched and typed at a time when reading results
+    "chunk_bytes": 64 * 1024 * 1024,  # parsed size of a chunk when large datasets are read or stored in pieces
+    "streaming_threshold": 50 * 1024 * 1024,  # bytes; larger uploads of any format are ingested in chunks
+    "ingest_workers": None,  # processes for background ingestion jobs; None uses all available cores
+    "dataset_cache_dir": ".medico_cache",  # processed datasets as Arrow files
+    "dataset_cache_max_bytes": 2 * 1024 * 1024 * 1024,
+    "sample_threshold": 20 * 1024 * 1024,  # bytes; larger uploads show a sample first
+    "sample_rows": 50000,
+    "sketch_compression": 500,  # t-digest centroids per numeric column are about half this
+    "sketch_exact_values": 2000,  # distinct values a column sketch counts exactly before compressing
+    "column_workers": None,  # processes for column-parallel cleaning; None uses all cores, 1 turns it off
+    "column_parallel_min_columns": 64,  # narrower frames are cleaned in-process
+    "column_parallel_min_cells": 2_000_000  # rows x columns below which pool overhead outweighs the gain
+}
+
+# Data Processing Configuration
+PROCESSING_CONFIG = {
+    "missing_threshold": 50,  # percent missing before a column is dropped
+    "outlier_method": "iqr",
+    "outlier_action": "cap",
+    "category_max_ratio": 0.5,  # text with at most this share of distinct values becomes category
+    "inference_sample_rows": 20000,  # rows sampled to decide column types
+    # Cleaning stages in order; entries may also be {"stage": name, "params": {...}}
+    "pipeline": [
+        "clean_column_names",
+        "handle_missing_values",
+        "detect_and_convert_types",
+        "remove_duplicates",
+        "handle_outliers",
+        "optimize_dtypes"
+    ]
 }
 
 # Logging Configuration
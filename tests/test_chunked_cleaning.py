@@ -0,0 +1,153 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import PERFORMANCE_CONFIG
+from utils.data_processor import DataProcessor, _ValueCounter
+from utils.database import DatabaseManager
+from utils.dataset_cache import DatasetCache
+from utils.ingestion import clean_stream, process_upload
+from utils.readers import sniff_file
+
+
+def _fixture():
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        'Age': rng.integers(30, 50, 60).astype(float),
+        'Score': rng.normal(100, 5, 60).round(1),
+        'Ward': rng.choice(['a', 'b'], 60),
+        'Dose': rng.integers(1, 20, 60).astype(str).astype(object),
+    })
+    # Text in a numeric column becomes NaN on conversion, after missing values are filled
+    df.loc[[12, 20, 33], 'Dose'] = 'unknown'
+    df.loc[47, 'Dose'] = '500'
+    df.loc[[3, 11, 25], 'Score'] = [400.0, -250.0, 900.0]
+    df.loc[[4, 9, 30], 'Age'] = np.nan
+    df.loc[[8, 40], 'Score'] = np.nan
+    median_age = df['Age'].median()
+    # Same row as another once the missing age is filled with the median
+    twin = df.iloc[[2]].assign(Age=np.nan)
+    df.loc[2, 'Age'] = median_age
+    # An exact duplicate and a duplicate of a row with a missing score
+    return pd.concat([df, twin, df.iloc[[5, 8]]], ignore_index=True)
+
+
+def _upload(df):
+    data = df.to_csv(index=False).encode()
+    file = io.BytesIO(data)
+    file.name = 'ward.csv'
+    file.size = len(data)
+    return file
+
+
+def _clean(file, processor, sniff, chunk_rows=7):
+    chunks = []
+    profile = clean_stream(file, processor, chunks.extend, chunk_rows=chunk_rows, sniff=sniff)
+    assert all(len(chunk) <= chunk_rows for chunk in chunks)
+    return pd.concat(chunks, ignore_index=True), profile
+
+
+@pytest.mark.parametrize('action', ['cap', 'remove'])
+def test_chunked_cleaning_matches_in_memory(action):
+    raw = _fixture()
+    settings = {'outlier_action': action}
+
+    in_memory = DataProcessor(settings)
+    expected = in_memory.clean_and_process(raw.copy(), 'ward.csv').reset_index(drop=True)
+
+    file = _upload(raw)
+    streamed = DataProcessor(settings)
+    result, profile = _clean(file, streamed, sniff_file(file))
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert np.array_equal(streamed.row_hashes, in_memory.row_hashes)
+    # Rows with no value to compare are never outliers
+    assert result['Dose'].isna().sum() == 3
+
+    # The profile merged chunk by chunk is the one of the assembled frame
+    whole = in_memory.build_profile(expected, in_memory.row_hashes, streamed.sketches)
+    assert profile.pop('memory_usage') == pytest.approx(whole.pop('memory_usage'), rel=0.05)
+    columns, whole_columns = profile.pop('columns'), whole.pop('columns')
+    assert profile == whole
+    for col, column in columns.items():
+        assert column == pytest.approx(whole_columns[col], rel=1e-9), col
+
+
+def test_sniffed_date_format_that_does_not_fit_falls_back_to_inference():
+    raw = pd.DataFrame({
+        'Visit': pd.date_range('2024-01-01', periods=40).strftime('%Y-%m-%d'),
+        'Score': np.arange(40.0),
+    })
+    file = _upload(raw)
+    sniff = sniff_file(file)
+    # A format sniffed from too few rows, or from another column
+    sniff.date_formats = {'Visit': '%d/%m/%Y'}
+
+    in_memory = DataProcessor()
+    expected = in_memory.clean_and_process(raw.copy(), 'ward.csv', sniff.date_formats)
+    result, _ = _clean(file, DataProcessor(), sniff)
+
+    assert expected['Visit'].notna().all()
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+
+
+def test_chunked_outlier_bounds_come_from_sketches():
+    raw = _fixture()
+    file = _upload(raw)
+    processor = DataProcessor()
+
+    result, _ = _clean(file, processor, sniff_file(file))
+
+    assert set(processor.sketches) == set(result.select_dtypes(include=['number']).columns)
+    for col, sketch in processor.sketches.items():
+        assert sketch.count == result[col].notna().sum()
+        assert sketch.max == result[col].max()
+
+
+def test_streamed_upload_is_written_as_it_is_cleaned(tmp_path, monkeypatch):
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'streaming_threshold', 0)
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'chunk_bytes', 2048)
+    raw = _fixture()
+    expected = DataProcessor().clean_and_process(raw.copy(), 'ward.csv').reset_index(drop=True)
+    db = DatabaseManager(str(tmp_path / "stream.db"))
+    cache = DatasetCache(tmp_path / "cache")
+
+    result = process_upload(_upload(raw), DataProcessor(), db_manager=db, dataset_cache=cache, source_key='k')
+
+    assert result['dataframe'] is None and result['cached']
+    assert result['stored']['rows'] == len(expected)
+    assert result['profile']['row_count'] == len(expected)
+    stored = db.read_table('data_ward')
+    pd.testing.assert_frame_equal(stored, expected, check_dtype=False, check_categorical=False)
+    entry = cache.load('k')
+    pd.testing.assert_frame_equal(entry['dataframe'], expected, check_dtype=False, check_categorical=False)
+    assert np.array_equal(entry['row_hashes'], db.get_row_hashes('data_ward'))
+    assert entry['profile'] == result['profile'] == db.get_profile('data_ward')
+
+    # The same upload again leaves the table as it is
+    again = process_upload(_upload(raw), DataProcessor(), db_manager=db, dataset_cache=cache, source_key='k')
+    assert again['stored']['skipped']
+
+
+def test_value_counter_keeps_the_most_frequent_values_within_its_capacity():
+    counter = _ValueCounter(capacity=50)
+    rng = np.random.default_rng(3)
+    common = pd.Series(rng.choice(['a', 'b', 'c'], 3000, p=[0.5, 0.3, 0.2]))
+    rare = pd.Series(np.arange(5000).astype(str))
+    for i in range(10):
+        counter.add(pd.concat([common[i * 300:(i + 1) * 300], rare[i * 500:(i + 1) * 500]]))
+
+    counts = counter.counts()
+    assert not counter.exact and len(counts) <= 50
+    assert counts.sort_values(ascending=False).index[:3].tolist() == ['a', 'b', 'c']
+    exact = common.value_counts()
+    for value in 'abc':
+        assert exact[value] - counter.error <= counts[value] <= exact[value]
+    assert counter.distinct() == pytest.approx(5003, rel=0.15)
+
+    small = _ValueCounter(capacity=50)
+    small.add(common)
+    assert small.exact and small.distinct() == 3
+    assert small.counts().to_dict() == common.value_counts().to_dict()
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from utils.connection_pool import ConnectionPool, get_pool
+
+
+def _pool(tmp_path, **kwargs):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), **kwargs)
+    with pool.writer() as conn:
+        conn.execute("CREATE TABLE beds (id INTEGER)")
+    return pool
+
+
+def test_pool_is_shared_per_process_and_file(tmp_path):
+    path = str(tmp_path / "pool.db")
+
+    assert get_pool(path) is get_pool(os.path.relpath(path))
+    assert get_pool(path) is not get_pool(str(tmp_path / "other.db"))
+
+
+def test_connections_are_tuned_and_readers_cannot_write(tmp_path):
+    pool = _pool(tmp_path)
+
+    with pool.writer() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    with pool.reader() as conn:
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO beds VALUES (1)")
+
+
+def test_writer_commits_or_rolls_back_its_block(tmp_path):
+    pool = _pool(tmp_path)
+
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO beds VALUES (1)")
+    with pytest.raises(ValueError):
+        with pool.writer() as conn:
+            conn.execute("INSERT INTO beds VALUES (2)")
+            raise ValueError
+
+    with pool.reader() as conn:
+        assert conn.execute("SELECT id FROM beds").fetchall() == [(1,)]
+
+
+def test_writer_is_held_by_one_thread_at_a_time(tmp_path):
+    pool = _pool(tmp_path)
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.writer():
+            held.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.writer(timeout=0.05):
+            pass
+    release.set()
+    thread.join()
+    with pool.writer(timeout=0.05):
+        pass
+
+
+def test_readers_are_reused_and_capped(tmp_path):
+    pool = _pool(tmp_path, readers=2)
+
+    with pool.reader() as first:
+        with pool.reader() as second:
+            assert first is not second
+            got = []
+            waiter = threading.Thread(target=lambda: got.append(pool._acquire_reader()))
+            waiter.start()
+            waiter.join(0.2)
+            # A third reader waits for one to be returned
+            assert waiter.is_alive()
+    waiter.join(5)
+    assert got[0] in (first, second)
+    pool._readers.put(got[0])
+    assert pool._reader_count == 2
+
+    # An open read transaction is not left behind in the pool
+    with pool.reader() as conn:
+        conn.execute("BEGIN")
+        conn.execute("SELECT * FROM beds").fetchall()
+    assert not conn.in_transaction
+
+    pool.close()
+    assert pool._reader_count == 0
+    with pool.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM beds").fetchone() == (0,)
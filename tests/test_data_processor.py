@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_processor import DataProcessor
+from utils.sketch import QuantileSketch
+
+
+def test_each_stage_records_its_metrics():
+    df = pd.DataFrame({
+        'Patient ID': [1, 2, 2, 3, 4],
+        'Score': [10.0, np.nan, np.nan, 12.0, 11.0],
+    })
+    processor = DataProcessor()
+
+    result = processor.clean_and_process(df, 'ward.csv')
+
+    metrics = processor.get_stage_metrics()
+    assert [m['stage'] for m in metrics] == [name for name, _ in processor.get_pipeline()]
+    by_stage = {m['stage']: m for m in metrics}
+    assert by_stage['remove_duplicates']['rows_in'] == 5
+    assert by_stage['remove_duplicates']['rows_out'] == len(result) == 4
+    assert by_stage['handle_missing_values']['cells_touched'] == 2
+    assert all(m['seconds'] >= 0 and m['memory_after'] > 0 for m in metrics)
+
+
+@pytest.mark.parametrize('action', ['cap', 'remove'])
+def test_outlier_bounds_match_dataframe_quantile(action):
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame(rng.normal(0, 1, (301, 4)).round(2), columns=list('abcd'))
+    df.loc[::7, 'b'] = np.nan
+    df['d'] = rng.integers(0, 5, 301)
+    quartiles = df.quantile([0.25, 0.75])
+    iqr = quartiles.loc[0.75] - quartiles.loc[0.25]
+    lower, upper = quartiles.loc[0.25] - 1.5 * iqr, quartiles.loc[0.75] + 1.5 * iqr
+    outside = (df < lower) | (df > upper)
+
+    result = DataProcessor().handle_outliers(df.copy(), action=action)
+
+    if action == 'cap':
+        expected = df.astype({col: 'float64' for col in outside.columns[outside.any()]})
+        expected = expected.clip(lower, upper, axis=1)
+    else:
+        expected = df[~outside.any(axis=1)]
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_capping_sketches_the_cleaned_columns():
+    rng = np.random.default_rng(6)
+    df = pd.DataFrame({
+        'Score': rng.normal(100, 5, 5000).round(1),
+        'Code': rng.integers(0, 9, 5000),
+        'Ward': rng.choice(['a', 'b'], 5000),
+    })
+    df.loc[::11, 'Score'] = np.nan
+    df.loc[3, 'Score'] = 900.0
+    processor = DataProcessor()
+
+    result = processor.clean_and_process(df, 'ward.csv')
+
+    assert list(processor.sketches) == ['Score', 'Code']
+    for col, sketch in processor.sketches.items():
+        expected = QuantileSketch().add(result[col])
+        assert sketch.exact == expected.exact
+        assert np.array_equal(sketch.means, expected.means)
+        assert np.array_equal(sketch.weights, expected.weights)
+    assert processor.sketches['Score'].max < 900
+
+
+def test_optimize_dtypes_keeps_every_value_exactly():
+    n = 200
+    df = pd.DataFrame({
+        'beds': np.arange(n, dtype='int64'),
+        'visits': np.arange(n, dtype='float64') * 1000,
+        'gaps': [np.nan if i % 10 == 0 else float(i) for i in range(n)],
+        'dose': np.full(n, 0.5),
+        'score': np.linspace(0, 1, n),
+        'ward': ['abc'[i % 3] for i in range(n)],
+        'note': [f"note {i}" for i in range(n)],
+        'flag': [i % 2 == 0 for i in range(n)],
+        'admitted': pd.date_range('2024-01-01', periods=n),
+    })
+    df['note'] = df['note'].astype(object)
+
+    result = DataProcessor().optimize_dtypes(df)
+
+    assert result.dtypes.astype(str).to_dict() == {
+        'beds': 'int16', 'visits': 'int32', 'gaps': 'Int16', 'dose': 'float32', 'score': 'float64',
+        'ward': 'category', 'note': 'string', 'flag': 'bool', 'admitted': str(df['admitted'].dtype),
+    }
+    assert result['note'].dtype.storage == 'pyarrow'
+    for col in df.columns:
+        assert result[col].astype(object).where(result[col].notna(), None).tolist() \
+            == df[col].astype(object).where(df[col].notna(), None).tolist(), col
+    assert result.memory_usage(deep=True).sum() < df.memory_usage(deep=True).sum() / 2
+
+
+def _with_text(share, n=2000, seed=0):
+    """Numeric strings with `share` of the rows replaced by text"""
+    values = pd.Series(np.arange(n).astype(str), dtype=object)
+    rows = np.random.default_rng(seed).choice(n, int(share * n), replace=False)
+    values[rows] = 'pending'
+    return values
+
+
+@pytest.mark.parametrize('share, numeric', [(0.02, True), (0.095, True), (0.105, False), (0.3, False)])
+@pytest.mark.parametrize('sample_rows', [100, 5000])
+def test_numeric_decision_from_a_sample_matches_the_full_column(share, numeric, sample_rows):
+    df = pd.DataFrame({'dose': _with_text(share)})
+
+    result = DataProcessor().detect_and_convert_types(df, sample_rows=sample_rows)
+
+    assert pd.api.types.is_numeric_dtype(result['dose']) == numeric
+    if numeric:
+        pd.testing.assert_series_equal(result['dose'], pd.to_numeric(df['dose'], errors='coerce'), check_dtype=False)
+
+
+def test_dates_are_parsed_with_the_format_they_are_written_in():
+    days = pd.date_range('2024-01-01', periods=40, freq='7D')
+    df = pd.DataFrame({
+        'admitted': days.strftime('%d/%m/%Y').astype(object),
+        'discharged': days.strftime('%m-%d-%Y').astype(object),
+        'ward': pd.Series(['a', 'b'] * 20, dtype=object),
+    })
+    df.loc[3, 'admitted'] = 'unknown'
+    processor = DataProcessor()
+
+    result = processor.detect_and_convert_types(df)
+
+    expected = pd.Series(days, name='admitted').where(df.index != 3)
+    pd.testing.assert_series_equal(result['admitted'], expected, check_dtype=False)
+    pd.testing.assert_series_equal(result['discharged'], pd.Series(days, name='discharged'), check_dtype=False)
+    assert result['ward'].tolist() == df['ward'].tolist()
+    assert any("Converted 'admitted' to datetime (%d/%m/%Y)" in line for line in processor.processing_log)
+    # A sniffed format that does not fit is ignored
+    result = processor.detect_and_convert_types(df, date_formats={'discharged': '%Y-%m-%d'})
+    pd.testing.assert_series_equal(result['discharged'], pd.Series(days, name='discharged'), check_dtype=False)
+
+
+def test_profile_matches_describe_and_basic_stats():
+    rng = np.random.default_rng(8)
+    df = pd.DataFrame({
+        'score': np.append(rng.normal(50, 10, 199), np.nan),
+        'beds': rng.integers(0, 5, 200),
+        'ward': pd.Categorical(rng.choice(['a', 'b', 'c'], 200, p=[0.6, 0.3, 0.1])),
+        'admitted': pd.date_range('2024-01-01', periods=200),
+        'flag': rng.random(200) < 0.5,
+    })
+    df = pd.concat([df, df.iloc[:3]], ignore_index=True)
+    processor = DataProcessor()
+
+    profile = processor.build_profile(df)
+
+    expected = processor.get_basic_stats(df)
+    assert {key: profile[key] for key in expected} == {key: int(value) for key, value in expected.items()}
+    for col in ['score', 'beds']:
+        described = df[col].describe()
+        column = profile['columns'][col]
+        for key in described.index:
+            assert column[key] == pytest.approx(described[key]), (col, key)
+        assert column['distinct'] == df[col].nunique()
+    ward = profile['columns']['ward']
+    assert ward['kind'] == 'categorical'
+    assert ward['top_values'] == [[value, int(count)] for value, count in df['ward'].value_counts().items()]
+    assert profile['columns']['admitted']['min'] == str(df['admitted'].min())
+    assert profile['columns']['flag']['kind'] == 'other'
+    # The summary shown in the app is read from the profile
+    summary = processor.generate_data_summary(df, 'ward.csv', profile=profile)
+    assert summary['numeric_summary']['score']['mean'] == profile['columns']['score']['mean']
+    assert summary['categorical_summary'] == {'ward': dict(ward['top_values'])}
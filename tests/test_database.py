@@ -0,0 +1,276 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data_processor import DataProcessor
+from utils.database import DatabaseManager, _read_cursor, _typed_columns, combine_row_hashes, row_hashes
+
+
+def test_compacted_dtypes_survive_a_round_trip(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'round_trip.db'))
+    raw = pd.DataFrame({
+        'count': [1, 2, 300, 4, 5, 6],
+        'gaps': [1.0, np.nan, 3.0, 40000.0, np.nan, 6.0],
+        'half': [0.5, 1.5, np.nan, 2.25, 3.0, 4.0],
+        'ward': ['a', 'b', 'a', 'a', 'b', 'a'],
+        'note': ['x1', 'x2', 'x3', 'x4', 'x5', None],
+    })
+    df = DataProcessor().optimize_dtypes(raw.copy(), category_max_ratio=0.5)
+    # The compact dtypes this test is about
+    assert str(df['gaps'].dtype) == 'Int32'
+    assert str(df['ward'].dtype) == 'category'
+
+    assert db.store_dataframe(df, 'compact')
+    stored = db.read_table('compact')
+
+    pd.testing.assert_frame_equal(stored, df)
+    assert stored['gaps'].isna().tolist() == [False, True, False, False, True, False]
+
+
+def test_values_that_no_longer_fit_keep_the_read_dtype(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'round_trip.db'))
+    df = pd.DataFrame({'n': np.array([1, 2, 3], dtype='int8')})
+    assert db.store_dataframe(df, 'small')
+    with db.pool.writer() as conn:
+        conn.execute('INSERT INTO "small" VALUES (NULL), (1000)')
+        conn.commit()
+
+    stored = db.read_table('small')
+
+    assert stored['n'].dtype == 'float64'
+    assert stored['n'].tolist()[:3] == [1.0, 2.0, 3.0]
+    assert np.isnan(stored['n'].iloc[3]) and stored['n'].iloc[4] == 1000
+
+
+def test_preview_is_cut_off_and_counted_on_demand(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'preview.db'))
+    assert db.store_dataframe(pd.DataFrame({'n': range(250)}), 'numbers')
+    query = 'SELECT n FROM "numbers" WHERE n >= 10;'
+
+    df, total = db.preview_query(query, rows=100)
+
+    assert len(df) == 100 and total is None
+    assert df.attrs['truncated'] and 'total_rows' not in df.attrs
+    assert db.count_rows(query) == 240
+
+
+def test_row_hashes_ignore_how_values_are_typed():
+    df = pd.DataFrame({
+        'beds': [1, 2, None, 2],
+        'ward': ['a', 'b', 'a', None],
+        'admitted': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-01', '2024-01-03']),
+    })
+    typed = df.assign(
+        beds=df['beds'].astype('Int8'), ward=df['ward'].astype('category'),
+        admitted=df['admitted'].astype('datetime64[s]')
+    )
+    as_text = df.assign(ward=df['ward'].astype(object))
+
+    hashes = row_hashes(df)
+    assert np.array_equal(row_hashes(typed), hashes)
+    assert np.array_equal(row_hashes(as_text), hashes)
+    assert len(set(hashes.tolist())) == 4
+    # Table fingerprints can be updated as rows are added and replaced
+    assert combine_row_hashes(hashes[2:], combine_row_hashes(hashes[:2])) == combine_row_hashes(hashes)
+
+
+def test_row_hashes_are_kept_from_cleaning_to_the_table(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'hashes.db'))
+    raw = pd.DataFrame({'bed': [1, 2, 2, 3, 1], 'ward': ['a', 'b', 'b', 'c', 'a']})
+    processor = DataProcessor()
+
+    df = processor.remove_duplicates(raw)
+
+    pd.testing.assert_frame_equal(df, raw.drop_duplicates())
+    assert np.array_equal(processor.row_hashes, row_hashes(df))
+    assert db.store_dataframe(df, 'beds', hashes=processor.row_hashes)
+    assert np.array_equal(db.get_row_hashes('beds'), row_hashes(db.read_table('beds')))
+
+
+def test_row_hash_index_follows_rows_changed_outside_the_app(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'hashes.db'))
+    df = pd.DataFrame({'bed': range(6), 'ward': list('abcabc')})
+    db.store_dataframe(df, 'beds')
+    with db.pool.writer() as conn:
+        conn.execute('DELETE FROM "beds" WHERE bed = 1')
+        conn.execute('INSERT INTO "beds" VALUES (9, \'z\')')
+        conn.commit()
+
+    with db.pool.writer() as conn:
+        rowids, hashes, sources, in_step = db._row_hash_index(conn, 'beds')
+
+    assert not in_step
+    assert rowids.tolist() == [1, 3, 4, 5, 6, 7]
+    assert np.array_equal(hashes, row_hashes(db.read_table('beds')))
+    # Only rows stored by the app have a source hash
+    assert sources[-1] == 0
+
+
+def test_profile_is_kept_only_for_the_contents_it_describes(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'profiles.db'))
+    processor = DataProcessor()
+    df = pd.DataFrame({'bed': range(10), 'ward': list('ababababab')})
+    assert db.get_profile('beds') is None
+    assert not db.store_profile('beds', processor.build_profile(df))
+
+    db.store_dataframe(df, 'beds')
+    profile = processor.build_profile(df)
+    assert db.store_profile('beds', profile)
+    assert db.get_profile('beds') == profile
+
+    # Storing the same rows again keeps it; new contents drop it
+    db.store_dataframe(df, 'beds')
+    assert db.get_profile('beds') == profile
+    db.store_dataframe(df.iloc[:5], 'beds')
+    assert db.get_profile('beds') is None
+
+
+def test_bulk_load_types_columns_and_rebuilds_indexes(tmp_path, monkeypatch):
+    from config import DATABASE_CONFIG
+
+    monkeypatch.setitem(DATABASE_CONFIG, 'bulk_batch_rows', 4)
+    db = DatabaseManager(str(tmp_path / 'bulk.db'))
+    df = pd.DataFrame({
+        'bed': np.arange(10, dtype='int16'),
+        'gaps': pd.array([1, None] * 5, dtype='Int8'),
+        'score': np.linspace(0, 1, 10),
+        'ward': pd.Categorical(list('ababababab')),
+        'code': pd.Categorical([1, 2] * 5),
+        'flag': [True, False] * 5,
+        'admitted': pd.date_range('2024-01-01', periods=10, freq='h'),
+        'note': [None] + [f"n{i}" for i in range(9)],
+    })
+    db.store_dataframe(df, 'beds')
+    with db.pool.writer() as conn:
+        conn.execute('CREATE INDEX idx_beds_ward ON "beds" ("ward")')
+    written = []
+
+    stats = db.store_dataframe_chunks(
+        (df.iloc[i:i + 3] for i in range(0, 10, 3)), 'beds', progress=written.append
+    )
+
+    assert stats['rows'] == 10 and not stats['skipped'] and stats['rows_per_second'] > 0
+    assert written == [3, 6, 9, 10]
+    with db.pool.reader() as conn:
+        types = {name: kind for _, name, kind, *_ in conn.execute('PRAGMA table_info("beds")')}
+        assert types == {
+            'bed': 'INTEGER', 'gaps': 'INTEGER', 'score': 'REAL', 'ward': 'TEXT', 'code': 'INTEGER',
+            'flag': 'INTEGER', 'admitted': 'TEXT', 'note': 'TEXT',
+        }
+        assert conn.execute('SELECT typeof(gaps), typeof(note) FROM "beds" WHERE rowid = 2').fetchone() \
+            == ('null', 'text')
+        assert conn.execute('SELECT admitted FROM "beds" WHERE rowid = 2').fetchone() == ('2024-01-01 01:00:00',)
+        # The index is rebuilt on the new rows and the planner has statistics for it
+        assert conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'beds'"
+        ).fetchall() == [('idx_beds_ward',)]
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'beds'").fetchone()[0] > 0
+    pd.testing.assert_frame_equal(db.read_table('beds'), df, check_dtype=False)
+
+
+def test_storing_the_same_rows_again_is_skipped(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'skip.db'))
+    df = pd.DataFrame({'bed': range(5), 'ward': list('abcab')})
+    assert not db.is_stored(df, 'beds')
+
+    assert not db.store_dataframe(df, 'beds')['skipped']
+    with db.pool.reader() as conn:
+        loaded_at = conn.execute("SELECT upload_timestamp FROM table_metadata WHERE table_name = 'beds'").fetchone()
+
+    assert db.is_stored(df, 'beds')
+    assert db.is_stored(df.iloc[:0], 'beds', hashes=row_hashes(df))
+    assert db.store_dataframe(df, 'beds')['skipped']
+    with db.pool.reader() as conn:
+        assert conn.execute(
+            "SELECT upload_timestamp FROM table_metadata WHERE table_name = 'beds'"
+        ).fetchone() == loaded_at
+
+    # Anything the fingerprint alone would miss is loaded again
+    for changed in [
+        df.iloc[::-1].reset_index(drop=True),
+        df[['ward', 'bed']],
+        df.assign(bed=df['bed'].astype('float64')),
+        df.assign(ward=df['ward'].replace('c', 'z')),
+    ]:
+        assert not db.is_stored(changed, 'beds')
+    # Including a table changed or dropped outside the app
+    with db.pool.writer() as conn:
+        conn.execute('DROP TABLE "beds"')
+    assert not db.is_stored(df, 'beds')
+    assert not db.store_dataframe(df, 'beds')['skipped']
+
+
+@pytest.fixture
+def results():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE t (n INTEGER, x REAL, gaps REAL, late REAL, s TEXT, mixed)")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?, ?, ?, ?)", [
+        (i, i / 2, None if i % 3 == 0 else float(i), None if i < 4 else i, f"s{i}" if i % 4 else None,
+         i if i % 2 else f"m{i}")
+        for i in range(10)
+    ])
+    yield conn
+    conn.close()
+
+
+def test_typed_columns_match_dataframe_inference():
+    rows = [(1, 1.5, None, 'a', 1), (2, None, None, None, 'b'), (3, 2, None, 'c', 2.5)]
+
+    n, x, empty, text, mixed = _typed_columns(rows, 5)
+
+    assert n.dtype == 'int64' and n.tolist() == [1, 2, 3]
+    assert x.dtype == 'float64' and np.isnan(x[1]) and x[2] == 2.0
+    assert [array.dtype for array in (empty, text, mixed)] == [object] * 3
+    assert mixed.tolist() == [1, 'b', 2.5]
+
+
+@pytest.mark.parametrize('batch_rows', [3, 4, 1000])
+def test_cursor_is_read_in_typed_batches(results, monkeypatch, batch_rows):
+    from config import PERFORMANCE_CONFIG
+
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'query_batch_rows', batch_rows)
+    query = "SELECT n, x, gaps, late, s, mixed, n AS x FROM t ORDER BY n"
+
+    df, total = _read_cursor(results.execute(query))
+
+    expected = pd.read_sql_query(query, results)
+    assert total == 10 and df.columns.tolist() == ['n', 'x', 'gaps', 'late', 's', 'mixed', 'x']
+    # Batches of only NULLs in a numeric column are NaN, not None
+    assert df.iloc[:, 3].dtype == 'float64' and df.iloc[:4, 3].isna().all()
+    for i in range(len(df.columns)):
+        assert df.iloc[:, i].astype(object).where(df.iloc[:, i].notna(), None).tolist() \
+            == expected.iloc[:, i].astype(object).where(expected.iloc[:, i].notna(), None).tolist(), i
+
+
+def test_cursor_reads_one_row_past_the_limit(results, monkeypatch):
+    from config import PERFORMANCE_CONFIG
+
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'query_batch_rows', 2)
+
+    df, total = _read_cursor(results.execute("SELECT n FROM t ORDER BY n"), limit=5)
+    assert total is None and df['n'].tolist() == [0, 1, 2, 3, 4, 5]
+    df, total = _read_cursor(results.execute("SELECT n FROM t ORDER BY n"), limit=10)
+    assert total == 10 and len(df) == 10
+    df, total = _read_cursor(results.execute("SELECT n, s FROM t WHERE n < 0"))
+    assert total == 0 and df.columns.tolist() == ['n', 's']
+
+
+def test_iter_query_yields_batches_of_the_result(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'iter.db'))
+    df = pd.DataFrame({'bed': range(25), 'ward': list('abcde') * 5, 'score': np.linspace(0, 1, 25)})
+    db.store_dataframe(df, 'beds')
+    query = 'SELECT * FROM "beds" ORDER BY bed'
+
+    batches = list(db.iter_query(query, batch_rows=10))
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), db.execute_query(query))
+    # Closing early hands the reader connection back to the pool
+    iterator = db.iter_query(query, batch_rows=10)
+    next(iterator)
+    iterator.close()
+    assert db.pool._readers.qsize() == db.pool._reader_count
+    db.query_log.flush(timeout=5)
+    assert len(db.get_query_workload(10)) == 1
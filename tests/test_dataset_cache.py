@@ -0,0 +1,107 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.dataset_cache import DatasetCache, dataset_key
+
+
+def _frame(start, rows):
+    return pd.DataFrame({
+        'score': np.arange(start, start + rows, dtype='float32'),
+        'ward': pd.Categorical(['ab'[i % 2] for i in range(rows)], categories=['a', 'b']),
+    })
+
+
+def test_entry_round_trip(tmp_path):
+    cache = DatasetCache(tmp_path)
+    df = pd.DataFrame({
+        'age': pd.array([40, None, 52], dtype='Int8'),
+        'score': np.array([1.5, 2.5, np.nan], dtype='float32'),
+        'ward': pd.Categorical(['a', 'b', 'a']),
+        'admitted': pd.to_datetime(['2024-01-01', '2024-02-01', None]),
+        'note': pd.array(['x', None, 'z'], dtype='string[pyarrow]'),
+    })
+    entry = {
+        'name': 'ward.csv', 'table': 'data_ward', 'dataframe': df,
+        'stats': {'row_count': np.int64(3), 'memory_usage': np.float64(12.5)},
+        'row_hashes': np.array([1, 2, 2 ** 64 - 1], dtype='uint64'),
+        'source_hashes': np.array([7, 8, 9], dtype='uint64'),
+        'stored': {'rows': 3}, 'cached': True,
+    }
+
+    assert cache.store('key', entry)
+    loaded = cache.load('key')
+
+    pd.testing.assert_frame_equal(loaded['dataframe'], df)
+    assert loaded['row_hashes'].dtype == 'uint64' and loaded['row_hashes'].tolist() == [1, 2, 2 ** 64 - 1]
+    assert loaded['source_hashes'].tolist() == [7, 8, 9]
+    assert loaded['stats'] == {'row_count': 3, 'memory_usage': 12.5}
+    # Per-run fields are not cached
+    assert 'stored' not in loaded and 'cached' not in loaded
+    assert cache.load('other') is None
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = DatasetCache(tmp_path)
+    (tmp_path / 'key.arrow').write_bytes(b'not an arrow file')
+
+    assert cache.load('key') is None
+    assert not (tmp_path / 'key.arrow').exists()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    df = pd.DataFrame({'score': np.arange(10000, dtype='float64')})
+    cache = DatasetCache(tmp_path, max_bytes=10 ** 9)
+    for i, key in enumerate(['old', 'used', 'new']):
+        cache.store(key, {'table': key, 'dataframe': df})
+        os.utime(tmp_path / f'{key}.arrow', (time.time() - 100 + i, time.time() - 100 + i))
+    # Loading marks an entry as recently used
+    assert cache.load('used') is not None
+
+    cache.max_bytes = 2 * (tmp_path / 'old.arrow').stat().st_size
+    cache.store('newest', {'table': 'newest', 'dataframe': df})
+
+    assert sorted(path.stem for path in tmp_path.glob('*.arrow')) == ['newest', 'used']
+    # The newest entry is kept even when it alone is over the limit
+    cache.max_bytes = 1
+    cache.evict()
+    assert [path.stem for path in tmp_path.glob('*.arrow')] == ['newest']
+
+
+def test_key_covers_content_settings_and_table():
+    key = dataset_key('abc', 'settings', 'data_ward')
+
+    assert key == dataset_key('abc', 'settings', 'data_ward')
+    assert len({key, dataset_key('abd', 'settings', 'data_ward'),
+                dataset_key('abc', 'other', 'data_ward'), dataset_key('abc', 'settings', 'data_beds')}) == 4
+
+
+def test_writer_publishes_chunks_as_one_entry(tmp_path):
+    cache = DatasetCache(tmp_path)
+    writer = cache.writer('key')
+    chunks = [_frame(0, 5), _frame(5, 5), _frame(10, 3)]
+    for i, chunk in enumerate(chunks):
+        writer.write(chunk, row_hashes=np.arange(len(chunk)) + 10 * i)
+
+    # Nothing is visible before the entry is complete
+    assert cache.load('key') is None
+    assert writer.close({'table': 'data_ward', 'profile': {'row_count': 13}, 'dataframe': None})
+
+    entry = cache.load('key')
+    pd.testing.assert_frame_equal(entry['dataframe'], pd.concat(chunks, ignore_index=True))
+    assert entry['table'] == 'data_ward' and entry['profile'] == {'row_count': 13}
+    assert entry['row_hashes'].tolist() == [0, 1, 2, 3, 4, 10, 11, 12, 13, 14, 20, 21, 22]
+    assert list(tmp_path.glob('*.tmp')) == []
+
+
+def test_aborted_writer_leaves_no_entry(tmp_path):
+    cache = DatasetCache(tmp_path)
+    writer = cache.writer('key')
+    writer.write(_frame(0, 5))
+    writer.abort()
+
+    assert not writer.close({'table': 'data_ward'})
+    assert cache.load('key') is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,117 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from utils.database import DatabaseManager
+from utils.index_advisor import IndexAdvisor, auto_index_name, column_usage
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE patients (id INTEGER, ward TEXT, "Blood Pressure" REAL, age INTEGER)')
+    conn.execute('CREATE TABLE visits (patient_id INTEGER, ward TEXT, day TEXT)')
+    yield conn
+    conn.close()
+
+
+def test_column_usage_reads_clauses_aliases_and_quoted_names(conn):
+    used, plan = column_usage(conn, """
+        SELECT p.ward, COUNT(*) FROM patients AS p
+        JOIN visits v ON v.patient_id = p.id
+        WHERE "Blood Pressure" > 140 AND v.day >= '2024-01-01' -- age is not filtered
+        GROUP BY p.ward ORDER BY COUNT(*) DESC LIMIT 10
+    """)
+
+    assert used == {
+        ('visits', 'patient_id', 'join'), ('patients', 'id', 'join'),
+        ('patients', 'Blood Pressure', 'filter'), ('visits', 'day', 'filter'),
+        ('patients', 'ward', 'group'),
+    }
+    assert plan
+
+
+def test_column_usage_ignores_literals_and_resolves_unqualified_names(conn):
+    used, _ = column_usage(conn, "SELECT * FROM patients WHERE WARD = 'age' ORDER BY [age]")
+
+    # Names are spelled as the table spells them
+    assert used == {('patients', 'ward', 'filter'), ('patients', 'age', 'order')}
+    with pytest.raises(sqlite3.Error):
+        column_usage(conn, "SELECT * FROM gone WHERE ward = 'a'")
+
+
+@pytest.fixture
+def advisor(tmp_path):
+    db = DatabaseManager(str(tmp_path / "advisor.db"))
+    db.store_dataframe(pd.DataFrame({'id': range(200), 'ward': list('abcd') * 50, 'age': range(200)}), 'patients')
+    db.store_dataframe(pd.DataFrame({'id': range(5), 'ward': list('abcde')}), 'wards')
+    advisor = IndexAdvisor(db, {'min_uses': 3, 'min_rows': 100, 'retry_rejected_after': 3600})
+    advisor.speedup = 10.0
+
+    def time_queries(queries):
+        # Timing before an index exists gives 1s, after it 1s / speedup
+        return (1.0 / advisor.speedup if _indexes(db) else 1.0), list(queries)
+
+    advisor._time_queries = time_queries
+    return advisor
+
+
+def _log(db, query, times):
+    for _ in range(times):
+        db.log_query(query, 0.01, True)
+
+
+def _indexes(db):
+    with db.pool.reader() as conn:
+        return {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_auto_%'"
+        )}
+
+
+def test_advisor_indexes_columns_the_workload_filters_on(advisor):
+    db = advisor.db_manager
+    _log(db, "SELECT * FROM patients WHERE ward = 'a'", 3)
+    _log(db, "SELECT * FROM patients WHERE age > 5", 2)  # Too few uses
+    _log(db, "SELECT * FROM wards WHERE ward = 'a'", 5)  # Too small a table
+    db.log_query("SELECT * FROM patients WHERE id = 1", 0.01, False)  # Failed queries don't count
+
+    decisions = advisor.run_once()
+
+    assert [(d['table_name'], d['column_name'], d['action'], d['uses']) for d in decisions] \
+        == [('patients', 'ward', 'created', {'filter': 3})]
+    assert _indexes(db) == {auto_index_name('patients', 'ward')}
+    # Already indexed, so the next run has nothing to do
+    assert advisor.run_once() == []
+    assert db.get_index_recommendations()['action'].tolist() == ['created']
+
+
+def test_index_without_a_speedup_is_rejected_and_not_retried(advisor):
+    db = advisor.db_manager
+    advisor.speedup = 1.1
+    _log(db, "SELECT * FROM patients ORDER BY age", 3)
+
+    decisions = advisor.run_once()
+
+    assert [d['action'] for d in decisions] == ['rejected']
+    assert _indexes(db) == set()
+    assert advisor.run_once() == []
+
+
+def test_advisor_drops_only_its_own_unused_indexes(advisor):
+    db = advisor.db_manager
+    with db.pool.writer() as conn:
+        conn.execute('CREATE INDEX manual_age ON patients (age)')
+    _log(db, "SELECT ward, COUNT(*) FROM patients GROUP BY ward", 3)
+    advisor.run_once()
+    assert _indexes(db) == {auto_index_name('patients', 'ward')}
+
+    # The workload moves on to other queries
+    advisor.config['workload_size'] = 3
+    _log(db, "SELECT * FROM patients WHERE age = 5", 3)
+    decisions = advisor.run_once()
+
+    assert [(d['column_name'], d['action']) for d in decisions] == [('ward', 'dropped')]
+    assert _indexes(db) == set()
+    with db.pool.reader() as conn:
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'manual_age'").fetchone()
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+
+import utils.ingestion
+from utils.ingestion import IngestionCache, compute_file_fingerprint
+
+
+def _upload(data, name='ward.csv', file_id=None):
+    file = io.BytesIO(data)
+    file.name = name
+    file.size = len(data)
+    file.file_id = file_id
+    return file
+
+
+class _Stream(io.RawIOBase):
+    """A readable upload without getbuffer(), read block by block"""
+
+    def __init__(self, data):
+        self._file = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+
+def test_fingerprint_depends_only_on_content():
+    data = b'a,b\n' + b'1,2\n' * 1000
+    stream = _Stream(data)
+    stream.seek(10)
+
+    assert compute_file_fingerprint(_upload(data)) == compute_file_fingerprint(stream, block_size=7)
+    # Reading blocks leaves the file where it was
+    assert stream.tell() == 10
+    assert compute_file_fingerprint(_upload(data + b'3,4\n')) != compute_file_fingerprint(_upload(data))
+
+
+def test_cache_hashes_each_upload_once(monkeypatch):
+    calls = []
+    fingerprint = utils.ingestion.compute_file_fingerprint
+    monkeypatch.setattr(
+        utils.ingestion, 'compute_file_fingerprint', lambda file: calls.append(file.name) or fingerprint(file)
+    )
+    cache = IngestionCache()
+    file = _upload(b'a\n1\n', file_id='f1')
+
+    key = cache.make_key(file, 'settings')
+    cache.put(key, {'table': 'data_ward'})
+    # Streamlit reruns hand over the same upload again
+    assert cache.get(cache.make_key(file, 'settings')) == {'table': 'data_ward'}
+    assert cache.get(cache.make_key(file, 'other settings')) is None
+    assert calls == ['ward.csv']
+
+    # Uploads without an id are hashed every time
+    anonymous = _upload(b'a\n1\n')
+    assert cache.make_key(anonymous, 'settings') == key
+    assert cache.make_key(anonymous, 'settings') == key
+    assert calls == ['ward.csv'] * 3
+
+
+def test_retain_drops_removed_uploads():
+    cache = IngestionCache()
+    kept, removed = _upload(b'a\n1\n', 'kept.csv', 'f1'), _upload(b'a\n2\n', 'gone.csv', 'f2')
+    kept_key, removed_key = cache.make_key(kept, 's'), cache.make_key(removed, 's')
+    cache.put(kept_key, {'table': 'data_kept'})
+    cache.put(removed_key, {'table': 'data_gone'})
+
+    cache.retain([kept_key])
+
+    assert len(cache) == 1 and cache.get(removed_key) is None
+    assert cache.get(kept_key) == {'table': 'data_kept'}
+    assert len(cache._fingerprints) == 1
+
+
+@pytest.mark.parametrize('name, table', [('Ward.csv', 'data_ward'), ('labs.2024.xlsx', 'data_labs')])
+def test_table_name_for(name, table):
+    assert utils.ingestion.table_name_for(name) == table
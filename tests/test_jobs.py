@@ -0,0 +1,183 @@
+import io
+import os
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+import utils.jobs
+from utils.dataset_cache import DatasetCache
+from utils.ingestion import spool_upload, with_sketches
+from utils.jobs import IngestionWorker, JobProgress
+from utils.readers import sniff_file
+from utils.sketch import QuantileSketch
+
+
+def _upload(df, name):
+    data = df.to_csv(index=False).encode()
+    file = io.BytesIO(data)
+    file.name = name
+    file.size = len(data)
+    return file
+
+
+def _wait_for_result(worker, job_id, source_key, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        entry = worker.take_result(job_id, source_key)
+        if entry is not None:
+            return entry
+        time.sleep(0.1)
+    return None
+
+
+def test_sample_of_pending_job_survives_polling(tmp_path):
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=1)
+    job_id = worker.db_manager.create_ingestion_job("big.csv", "data_big", "source")
+
+    sample = Future()
+    sample.set_result({'dataframe': pd.DataFrame({'a': range(500)}), 'table': 'data_big'})
+    worker._store_sample(job_id, sample)
+
+    # app.py polls take_result before get_sample on every run
+    for _ in range(3):
+        assert worker.take_result(job_id, "source") is None
+        entry = worker.get_sample(job_id)
+        assert entry is not None and len(entry['dataframe']) == 500
+
+    assert worker.db_manager.get_ingestion_jobs([job_id])[0]['sample_rows'] == 500
+
+
+def test_finished_job_entry_has_the_stored_sketches(tmp_path, monkeypatch):
+    spooled = []
+    spool_upload = utils.jobs.spool_upload
+    monkeypatch.setattr(utils.jobs, 'spool_upload', lambda file: spooled.append(spool_upload(file)) or spooled[-1])
+
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({'score': rng.normal(100, 5, 400).round(1), 'ward': rng.choice(['a', 'b'], 400)})
+    df.loc[7, 'score'] = 900.0
+    data = df.to_csv(index=False).encode()
+    file = io.BytesIO(data)
+    file.name = 'ward.csv'
+    file.size = len(data)
+
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=1)
+    job_id = worker.submit(file, {}, sniff_file(file), "source")
+    deadline = time.time() + 60
+    entry = None
+    while entry is None and time.time() < deadline:
+        time.sleep(0.1)
+        entry = worker.take_result(job_id, "source")
+    assert entry is not None
+    # The spooled copy of the upload goes once the job is done with it
+    while os.path.exists(spooled[0]) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not os.path.exists(spooled[0])
+
+    # As app.py hands entries to the analytics and chart tabs
+    entry = with_sketches(entry, worker.db_manager)
+    sketch = QuantileSketch.from_dict(entry['sketches']['Score'])
+    stored = worker.db_manager.read_table(entry['table'])
+    assert sketch.count == len(stored)
+    assert sketch.max == stored['Score'].max() < 900
+    assert worker.db_manager.get_sketches(entry['table'], build=False) == entry['sketches']
+    # An entry cached without sketches gets the table's
+    assert with_sketches({**entry, 'sketches': None}, worker.db_manager)['sketches'] == entry['sketches']
+
+
+def test_uploads_are_ingested_side_by_side(tmp_path):
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=2)
+    worker.dataset_cache = DatasetCache(tmp_path / "cache")
+    frames = {
+        f"ward{i}.csv": pd.DataFrame({'bed': range(100 * i, 100 * i + 50 + i), 'ward': f"w{i}"})
+        for i in range(4)
+    }
+
+    jobs = {name: worker.submit(_upload(df, name), {}, None, name) for name, df in frames.items()}
+    entries = {name: _wait_for_result(worker, job_id, name) for name, job_id in jobs.items()}
+
+    # Tables are written one at a time, so none of the loads gave up on a locked database
+    for name, df in frames.items():
+        assert entries[name] is not None, name
+        stored = worker.db_manager.read_table(entries[name]['table'])
+        assert stored['Bed'].tolist() == df['bed'].tolist()
+    states = worker.db_manager.get_ingestion_jobs(list(jobs.values()))
+    assert [job['state'] for job in states] == ['done'] * 4
+    assert {job['rows_processed'] for job in states} == {50, 51, 52, 53}
+
+
+def test_job_of_a_broken_pool_is_ingested_by_the_writer(tmp_path):
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=1)
+    worker.dataset_cache = DatasetCache(tmp_path / "cache")
+    file = _upload(pd.DataFrame({'bed': range(30)}), "ward.csv")
+    job_id = worker.db_manager.create_ingestion_job(file.name, "data_ward", "source")
+    path = spool_upload(file)
+    worker._uploads[job_id] = (path, 1)
+    args = (
+        path, file.name, {}, None, worker.db_manager.db_path, worker.dataset_cache, "source",
+        JobProgress(worker.db_manager.db_path, job_id)
+    )
+    broken = Future()
+    broken.set_exception(BrokenProcessPool("A worker died"))
+
+    worker._completed.put((job_id, "source", args, broken))
+    entry = _wait_for_result(worker, job_id, "source")
+
+    assert entry is not None and entry['dataframe']['Bed'].tolist() == list(range(30))
+    assert worker.db_manager.get_ingestion_jobs([job_id])[0]['state'] == 'done'
+    assert not os.path.exists(path)
+
+
+def test_progress_updates_are_throttled_except_for_state_changes(tmp_path):
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=1)
+    job_id = worker.db_manager.create_ingestion_job("big.csv", "data_big", "source")
+    progress = JobProgress(worker.db_manager.db_path, job_id, min_interval=60)
+
+    def job():
+        return worker.db_manager.get_ingestion_jobs([job_id])[0]
+
+    progress(100)
+    progress(200)
+    assert (job()['state'], job()['rows_processed']) == ('processing', 100)
+    # A new state and the last rows are written straight away
+    progress(0, 1000, 'storing')
+    assert (job()['state'], job()['rows_processed'], job()['total_rows']) == ('storing', 0, 1000)
+    progress(1000, 1000, 'storing')
+    assert job()['rows_processed'] == 1000
+
+
+def test_failed_job_records_its_error(tmp_path, monkeypatch):
+    # Errors are also appended to a log file in the working directory
+    monkeypatch.chdir(tmp_path)
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=1)
+    worker.dataset_cache = DatasetCache(tmp_path / "cache")
+    file = _upload(pd.DataFrame({'bed': []}), "empty.csv")
+
+    job_id = worker.submit(file, {}, None, "source")
+    deadline = time.time() + 60
+    while worker.db_manager.get_ingestion_jobs([job_id])[0]['state'] not in ('done', 'failed') \
+            and time.time() < deadline:
+        time.sleep(0.1)
+
+    job = worker.db_manager.get_ingestion_jobs([job_id])[0]
+    assert job['state'] == 'failed' and job['error_message'] and job['finished_at']
+    assert worker.take_result(job_id, "source") is None
+
+
+def test_result_nobody_collected_is_served_from_the_dataset_cache(tmp_path):
+    worker = IngestionWorker(str(tmp_path / "jobs.db"), max_workers=1, result_ttl=0)
+    worker.dataset_cache = DatasetCache(tmp_path / "cache")
+    file = _upload(pd.DataFrame({'bed': range(40)}), "ward.csv")
+
+    job_id = worker.submit(file, {}, None, "source")
+    deadline = time.time() + 60
+    # Pruned from memory as soon as the writer has finished it
+    while (worker.db_manager.get_ingestion_jobs([job_id])[0]['state'] != 'done' or job_id in worker._results) \
+            and time.time() < deadline:
+        time.sleep(0.1)
+
+    assert job_id not in worker._results
+    entry = worker.take_result(job_id, "source")
+    assert entry is not None and entry['dataframe']['Bed'].tolist() == list(range(40))
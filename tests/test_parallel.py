@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import PERFORMANCE_CONFIG
+from utils import parallel
+from utils.data_processor import DataProcessor
+
+
+@pytest.fixture
+def eight_cores(monkeypatch):
+    monkeypatch.setattr(parallel, 'available_cores', lambda: 8)
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'column_workers', None)
+
+
+def test_ingestion_workers_share_the_cores(eight_cores, monkeypatch):
+    active_jobs = multiprocessing.Value('i', 0)
+    monkeypatch.setattr(parallel, '_active_jobs', active_jobs)
+
+    with parallel.running_job():
+        # A lone job gets every core
+        assert parallel.column_worker_count() == 8
+        with parallel.running_job():
+            assert active_jobs.value == 2
+            assert parallel.column_worker_count() == 4
+    assert active_jobs.value == 0
+
+    active_jobs.value = 8
+    assert parallel.column_worker_count() == 1
+
+
+def test_app_process_uses_every_core(eight_cores):
+    assert parallel.column_worker_count() == 8
+
+
+def test_arrow_files_round_trip_and_are_removed():
+    df = pd.DataFrame({'a': [1.5, np.nan], 'b': ['x', None], 'c': [1, 2]}).astype({'b': object})
+
+    path, object_columns = parallel.write_arrow_file(df)
+    assert os.path.exists(path)
+    result = parallel.read_arrow_file(path, object_columns)
+
+    pd.testing.assert_frame_equal(result, df)
+    assert not os.path.exists(path)
+
+
+def test_column_groups_match_in_process_cleaning(monkeypatch):
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame(rng.normal(0, 1, (200, 12)), columns=[f"c{i}" for i in range(12)])
+    df.iloc[::17, 3] = np.nan
+    df.iloc[5, 7] = 40.0
+    in_process = DataProcessor()
+    expected = in_process.clean_and_process(df.copy(), 'wide.csv')
+
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'column_workers', 2)
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'column_parallel_min_columns', 1)
+    monkeypatch.setitem(PERFORMANCE_CONFIG, 'column_parallel_min_cells', 1)
+    split = []
+    run_stage_by_columns = DataProcessor.run_stage_by_columns
+    monkeypatch.setattr(
+        DataProcessor, 'run_stage_by_columns',
+        lambda self, name, *args: split.append(name) or run_stage_by_columns(self, name, *args)
+    )
+    processor = DataProcessor()
+    try:
+        result = processor.clean_and_process(df.copy(), 'wide.csv')
+    finally:
+        parallel.reset_column_pool()
+
+    assert split == ['handle_missing_values', 'detect_and_convert_types', 'handle_outliers', 'optimize_dtypes']
+    pd.testing.assert_frame_equal(result, expected)
+    # Log lines without their timestamps
+    assert [line[11:] for line in processor.get_processing_log()] == \
+        [line[11:] for line in in_process.get_processing_log()]
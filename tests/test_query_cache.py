@@ -0,0 +1,23 @@
+import sqlite3
+
+import pytest
+
+from utils.query_cache import statement_tables
+
+
+@pytest.mark.parametrize('query, params, cacheable', [
+    ("SELECT a FROM t WHERE d > date('2024-01-01', '+1 day')", None, True),
+    ("SELECT strftime('%Y', '2024-03-01') FROM t", None, True),
+    ("SELECT CURRENT_TIMESTAMP, a FROM t", None, False),
+    ("SELECT a FROM t WHERE d = CURRENT_DATE", None, False),
+    ("SELECT a FROM t WHERE d < current_time", None, False),
+    ("SELECT date() FROM t", None, False),
+    ("SELECT datetime('NOW', 'localtime') FROM t", None, False),
+    ("SELECT strftime('%Y') FROM t", None, False),
+    ("SELECT date(d) FROM t", None, False),
+    ("SELECT julianday(?) FROM t", ('now',), False),
+])
+def test_time_dependent_statements_are_not_cacheable(query, params, cacheable):
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE t (a, d)")
+    assert (statement_tables(conn, query, params) is not None) == cacheable
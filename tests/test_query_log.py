@@ -0,0 +1,91 @@
+import time
+
+from utils.database import DatabaseManager
+from utils.query_log import QueryLogWriter
+
+
+def _entry(i):
+    return (f"SELECT {i}", 0.01, f"2024-01-01T00:00:{i:02d}", True, None)
+
+
+def _history(db):
+    with db.pool.reader() as conn:
+        return [row[0] for row in conn.execute("SELECT query_text FROM query_history ORDER BY id")]
+
+
+def _writer(db, monkeypatch, **kwargs):
+    writer = QueryLogWriter(db.db_path, **kwargs)
+    batches = []
+    write = writer._write
+    monkeypatch.setattr(writer, '_write', lambda batch: batches.append(len(batch)) or write(batch))
+    return writer, batches
+
+
+def test_entries_are_written_in_batches(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / "log.db"))
+    writer, batches = _writer(db, monkeypatch, batch_rows=3, flush_ms=60000)
+
+    for i in range(6):
+        writer.log(_entry(i))
+
+    assert writer.flush(timeout=5)
+    assert batches == [3, 3]
+    assert _history(db) == [f"SELECT {i}" for i in range(6)]
+    assert writer.stats() == {'queued': 0, 'written': 6, 'dropped': 0}
+    writer.close()
+
+
+def test_a_lone_entry_waits_at_most_the_flush_interval(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / "log.db"))
+    writer, batches = _writer(db, monkeypatch, batch_rows=100, flush_ms=50)
+    started = time.monotonic()
+
+    writer.log(_entry(1))
+
+    assert writer.flush(timeout=5)
+    assert batches == [1] and time.monotonic() - started < 2
+    writer.close()
+
+
+def test_entries_past_a_full_queue_are_dropped_and_counted(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / "log.db"))
+    writer, _ = _writer(db, monkeypatch, batch_rows=1, flush_ms=10, max_queued=2)
+
+    # The writer thread waits for the connection while the queue fills up
+    with writer.pool.writer():
+        writer.log(_entry(0))
+        deadline = time.monotonic() + 5
+        while writer.stats()['queued'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for i in range(1, 5):
+            writer.log(_entry(i))
+        assert writer.stats() == {'queued': 2, 'written': 0, 'dropped': 2}
+
+    assert writer.flush(timeout=5)
+    assert _history(db) == ["SELECT 0", "SELECT 1", "SELECT 2"]
+    assert writer.stats() == {'queued': 0, 'written': 3, 'dropped': 2}
+    writer.close()
+
+
+def test_failed_writes_are_counted_as_dropped(tmp_path):
+    writer = QueryLogWriter(str(tmp_path / "no_history.db"), batch_rows=2, flush_ms=10)
+
+    writer.log(_entry(0))
+    writer.log(_entry(1))
+
+    # Flushing still returns, as the batch is given up on
+    assert writer.flush(timeout=5)
+    assert writer.stats() == {'queued': 0, 'written': 0, 'dropped': 2}
+    writer.close()
+
+
+def test_close_writes_what_is_queued(tmp_path):
+    db = DatabaseManager(str(tmp_path / "log.db"))
+    writer = QueryLogWriter(db.db_path, batch_rows=100, flush_ms=60000)
+
+    writer.log(_entry(0))
+    writer.close()
+    writer.log(_entry(1))
+
+    assert _history(db) == ["SELECT 0"]
+    assert writer.stats()['dropped'] == 1
@@ -0,0 +1,158 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.readers import iter_chunks
+
+
+def _upload(data, name):
+    file = io.BytesIO(data)
+    file.name = name
+    file.size = len(data)
+    return file
+
+
+def _read(file, chunk_size, **kwargs):
+    chunks = list(iter_chunks(file, chunk_size, **kwargs))
+    return chunks, pd.concat(chunks, ignore_index=True)
+
+
+RECORDS = [
+    {'id': i, 'value': round(i * 1.5, 1), 'ward': 'abc'[i % 3], 'tags': {'day': i}}
+    for i in range(25)
+]
+EXPECTED = pd.DataFrame({
+    'id': range(25),
+    'value': [round(i * 1.5, 1) for i in range(25)],
+    'ward': ['abc'[i % 3] for i in range(25)],
+    'tags': [json.dumps({'day': i}) for i in range(25)],
+})
+
+
+@pytest.mark.parametrize('text', [
+    json.dumps(RECORDS),
+    json.dumps(RECORDS, indent=2),
+    '\n'.join(json.dumps(record) for record in RECORDS) + '\n\n',
+])
+@pytest.mark.parametrize('bom', [b'', b'\xef\xbb\xbf'])
+def test_json_records_are_read_in_chunks(text, bom):
+    file = _upload(bom + text.encode(), 'feed.json')
+
+    chunks, df = _read(file, 10)
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    pd.testing.assert_frame_equal(df, EXPECTED)
+    # Each call starts again from the top
+    pd.testing.assert_frame_equal(_read(file, 10)[1], EXPECTED)
+
+
+def test_json_array_values_split_across_blocks():
+    from utils.readers import iter_json_chunks
+
+    records = [{'n': 10 ** 12 + i, 'text': 'x' * (i % 7)} for i in range(200)]
+    file = _upload(json.dumps(records).encode(), 'feed.json')
+
+    # Tiny blocks cut numbers and strings at every possible position
+    df = pd.concat(iter_json_chunks(file, 64, block_size=5), ignore_index=True)
+
+    pd.testing.assert_frame_equal(df, pd.DataFrame(records))
+
+
+def test_json_columns_are_fixed_by_the_first_chunk():
+    records = [{'a': 1, 'b': 2}, {'a': 3, 'b': 4}, {'a': 5, 'c': 6}, {'b': 7}]
+    file = _upload(json.dumps(records).encode(), 'feed.json')
+
+    chunks, _ = _read(file, 2)
+
+    assert [chunk.columns.tolist() for chunk in chunks] == [['a', 'b'], ['a', 'b']]
+    assert chunks[1]['b'].isna().tolist() == [True, False]
+
+
+def test_one_line_columnar_object_is_not_ndjson():
+    file = _upload(b'{"a": [1, 2, 3], "b": [4, 5, 6]}', 'feed.json')
+
+    _, df = _read(file, 10)
+
+    pd.testing.assert_frame_equal(df, pd.DataFrame({'a': [1, 2, 3], 'b': [4, 5, 6]}))
+
+
+def test_single_object_of_scalars_is_one_record():
+    file = _upload(b'{"a": 1, "b": "x"}\n', 'feed.json')
+
+    _, df = _read(file, 10)
+
+    pd.testing.assert_frame_equal(df, pd.DataFrame({'a': [1], 'b': ['x']}))
+
+
+def test_excel_rows_are_streamed_in_chunks():
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['Patient', None, 'Score'])
+    for i in range(23):
+        sheet.append([f"p{i}", i, i / 2])
+    # Trailing blank rows, as spreadsheets often leave them
+    sheet.append([None, None, None])
+    sheet.cell(row=40, column=1, value=None)
+    workbook.create_sheet('Other').append(['ignored'])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    file = _upload(buffer.getvalue(), 'labs.xlsx')
+
+    chunks, df = _read(file, 10)
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 3]
+    assert df.columns.tolist() == ['Patient', 'Unnamed_1', 'Score']
+    assert df['Patient'].tolist() == [f"p{i}" for i in range(23)]
+    assert np.array_equal(df['Unnamed_1'], np.arange(23))
+    assert np.allclose(df['Score'], np.arange(23) / 2)
+
+
+def _csv_upload(df):
+    return _upload(df.to_csv(index=False).encode(), 'ward.csv')
+
+
+def test_pinned_numeric_dtypes_match_inference():
+    from utils.readers import read_csv, sniff_file
+
+    raw = pd.DataFrame({
+        'id': range(30),
+        'score': np.linspace(0, 10, 30),
+        'beds': [np.nan if i % 4 == 0 else i for i in range(30)],
+        'ward': ['abc'[i % 3] for i in range(30)],
+    })
+    file = _csv_upload(raw)
+    sniff = sniff_file(file)
+    expected = pd.read_csv(io.BytesIO(file.getvalue()))
+
+    assert 'score' in sniff.read_csv_kwargs()['dtype']
+    pd.testing.assert_frame_equal(read_csv(file, sniff), expected)
+    chunks, df = _read(file, 7, sniff=sniff)
+    pd.testing.assert_frame_equal(df, expected)
+    assert chunks[0]['id'].dtype == 'int64'
+    assert chunks[0]['beds'].dtype == 'float64'
+
+
+def test_text_in_a_sniffed_numeric_column_falls_back_to_inference():
+    from utils.readers import read_csv, sniff_file
+
+    values = [str(i) for i in range(30)]
+    file = _csv_upload(pd.DataFrame({'id': range(30), 'dose': values}))
+    sniff = sniff_file(file)
+    # Text past the sniffed sample
+    values[25] = 'unknown'
+    file = _csv_upload(pd.DataFrame({'id': range(30), 'dose': values}))
+    expected = pd.read_csv(io.BytesIO(file.getvalue()))
+
+    assert sniff.dtypes['dose'] == 'int64'
+    pd.testing.assert_frame_equal(read_csv(file, sniff), expected)
+    chunks, df = _read(file, 10, sniff=sniff)
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10]
+    # Chunks are inferred on their own, as pandas does for chunked reads
+    assert chunks[0]['dose'].dtype == 'int64'
+    assert df['dose'].astype(str).tolist() == values
+    assert df['id'].tolist() == list(range(30))
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.sketch import QuantileSketch, column_sketches
+
+QS = [0.001, 0.01, 0.25, 0.5, 0.75, 0.99, 0.999]
+
+
+def _rank_error(values, estimates, qs):
+    """Largest distance, as a share of the values, between each estimate's rank and its quantile"""
+    ordered = np.sort(values)
+    ranks = (np.searchsorted(ordered, estimates, side='left') + np.searchsorted(ordered, estimates, side='right')) / 2
+    return np.max(np.abs(ranks / len(values) - np.asarray(qs)))
+
+
+def test_few_distinct_values_give_exact_quantiles():
+    rng = np.random.default_rng(1)
+    ages = pd.Series(rng.integers(18, 95, 5000).astype(float))
+    ages[rng.choice(5000, 40, replace=False)] = np.nan
+
+    sketch = QuantileSketch().add(ages)
+
+    assert sketch.exact and sketch.count == ages.notna().sum()
+    assert np.array_equal(sketch.quantile(QS), ages.quantile(QS).to_numpy())
+    assert (sketch.min, sketch.max) == (ages.min(), ages.max())
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'lognormal'])
+def test_compressed_quantiles_are_close_in_rank(distribution):
+    rng = np.random.default_rng(2)
+    values = rng.normal(100, 15, 200000) if distribution == 'normal' else rng.lognormal(3, 1, 200000)
+    sketch = QuantileSketch(compression=500, max_exact=2000)
+    for chunk in np.array_split(values, 40):
+        sketch.merge(QuantileSketch(compression=500, max_exact=2000).add(chunk))
+
+    assert not sketch.exact and len(sketch.means) < 1000
+    estimates = sketch.quantile(QS)
+    assert _rank_error(values, estimates, QS) < 0.002
+    assert sketch.count == len(values)
+    assert (sketch.min, sketch.max) == (values.min(), values.max())
+
+
+def test_merged_sketches_equal_one_sketch_of_all_values():
+    rng = np.random.default_rng(3)
+    parts = [rng.integers(0, 300, 1000).astype(float) for _ in range(4)]
+
+    merged = QuantileSketch()
+    for part in parts:
+        merged.merge(QuantileSketch().add(part))
+    whole = QuantileSketch().add(np.concatenate(parts))
+
+    assert np.array_equal(merged.means, whole.means) and np.array_equal(merged.weights, whole.weights)
+    assert np.array_equal(merged.quantile(QS), np.quantile(np.concatenate(parts), QS))
+    # Merging an empty sketch changes nothing
+    assert merged.merge(QuantileSketch()).count == 4000
+
+
+def test_removed_values_leave_the_sketch_of_the_rest():
+    rng = np.random.default_rng(4)
+    values = rng.integers(0, 500, 3000).astype(float)
+    sketch = QuantileSketch().add(values)
+
+    sketch.remove(values[:1000])
+
+    assert sketch.exact and sketch.count == 2000
+    assert np.array_equal(sketch.quantile(QS), np.quantile(values[1000:], QS))
+    # Values never added are ignored
+    assert sketch.remove([1e9]).count == 2000
+
+    # Once compressed, removal stays approximate
+    values = rng.normal(0, 1, 50000)
+    sketch = QuantileSketch(compression=500, max_exact=2000).add(values)
+    sketch.remove(values[:10000])
+    assert sketch.count == 40000
+    assert _rank_error(values[10000:], sketch.quantile([0.25, 0.5, 0.75]), [0.25, 0.5, 0.75]) < 0.01
+
+
+def test_clip_and_count_outside_match_capping():
+    values = np.arange(100, dtype=float)
+    sketch = QuantileSketch().add(values)
+
+    assert sketch.count_outside(10, 89.5) == 20
+    clipped = sketch.clip(10, 89.5)
+    assert np.array_equal(clipped.quantile(QS), np.quantile(np.clip(values, 10, 89.5), QS))
+    assert (clipped.min, clipped.max) == (10, 89.5)
+
+    values = np.random.default_rng(5).normal(0, 1, 50000)
+    sketch = QuantileSketch(compression=500, max_exact=2000).add(values)
+    outside = int(((values < -2) | (values > 2)).sum())
+    assert sketch.count_outside(-2, 2) == pytest.approx(outside, rel=0.05)
+
+
+def test_dict_round_trip_and_column_sketches():
+    rng = np.random.default_rng(6)
+    df = pd.DataFrame({'score': rng.normal(0, 1, 5000), 'beds': rng.integers(0, 9, 5000), 'ward': 'a'})
+
+    sketches = column_sketches(df.iloc[2500:], column_sketches(df.iloc[:2500]))
+
+    assert sorted(sketches) == ['beds', 'score']
+    assert np.array_equal(sketches['beds'].quantile(QS), df['beds'].quantile(QS).to_numpy())
+    restored = QuantileSketch.from_dict(sketches['score'].to_dict())
+    assert np.array_equal(restored.quantile(QS), sketches['score'].quantile(QS))
+    assert restored.exact == sketches['score'].exact
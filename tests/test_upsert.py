@@ -0,0 +1,113 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import INCREMENTAL_CONFIG, PERFORMANCE_CONFIG
+from utils.data_processor import DataProcessor
+from utils.database import DatabaseManager, combine_row_hashes, format_fingerprint, row_hashes
+from utils.ingestion import process_upload, store_processed
+
+TABLE = 'data_feed'
+
+
+def _upload(df):
+    data = df.to_csv(index=False).encode()
+    file = io.BytesIO(data)
+    file.name = 'feed.csv'
+    file.size = len(data)
+    return file
+
+
+def _feed(ids, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'patient_id': ids,
+        'value': rng.normal(50, 10, len(ids)).round(2),
+        'ward': rng.choice(['a', 'b', 'c'], len(ids)),
+    })
+    df.loc[df.index % 17 == 0, 'value'] = np.nan  # imputed with the upload's median
+    return df
+
+
+def _assert_consistent(db):
+    stored = db.read_table(TABLE)
+    hashes = db.get_row_hashes(TABLE)
+    # The index is aligned with rowid order, which read_table keeps
+    assert np.array_equal(hashes, row_hashes(stored))
+    file_hash = db.get_table_info(TABLE)['metadata'][5]
+    assert file_hash == format_fingerprint(combine_row_hashes(row_hashes(stored)))
+    sketch = db.get_sketches(TABLE)['Value']
+    assert sum(sketch['weights']) == stored['Value'].notna().sum()
+    return stored
+
+
+@pytest.fixture
+def keyed(monkeypatch, tmp_path, request):
+    monkeypatch.setitem(INCREMENTAL_CONFIG['primary_keys'], TABLE, ['Patient_Id'])
+    if request.param == 'streamed':
+        monkeypatch.setitem(PERFORMANCE_CONFIG, 'streaming_threshold', 0)
+    return DatabaseManager(str(tmp_path / 'feed.db'))
+
+
+@pytest.mark.parametrize('keyed', ['in_memory', 'streamed'], indirect=True)
+def test_upsert_counts_only_rows_whose_source_changed(keyed):
+    db = keyed
+    first = _feed(range(1000), seed=1)
+    store_processed(process_upload(_upload(first), DataProcessor()), db)
+    _assert_consistent(db)
+
+    # One edited row plus new rows that shift the median used for imputation
+    second = pd.concat([first, _feed(range(1000, 3000), seed=2).assign(value=lambda d: d['value'] + 40)])
+    second.loc[5, 'ward'] = 'z'
+    entry = store_processed(process_upload(_upload(second), DataProcessor()), db)
+
+    assert entry['processing_log'][-1].endswith('2000 new, 1 changed, 999 unchanged rows')
+    stored = _assert_consistent(db)
+    assert len(stored) == 3000
+    assert stored.loc[stored['Patient_Id'] == 5, 'Ward'].item() == 'z'
+    assert len(entry['dataframe']) == 3000
+
+
+@pytest.mark.parametrize('keyed', ['in_memory'], indirect=True)
+def test_upsert_with_changed_columns_rebuilds_the_table(keyed):
+    db = keyed
+    first = _feed(range(100), seed=1)
+    store_processed(process_upload(_upload(first), DataProcessor()), db)
+
+    second = _feed(range(50, 150), seed=3).drop(columns='ward')
+    entry = store_processed(process_upload(_upload(second), DataProcessor()), db)
+
+    assert 'rebuilt' in entry['processing_log'][-1]
+    stored = _assert_consistent(db)
+    assert len(stored) == 150
+    assert stored.loc[stored['Patient_Id'] >= 100, 'Ward'].isna().all()
+    assert stored.loc[stored['Patient_Id'] < 50, 'Ward'].notna().all()
+
+
+@pytest.mark.parametrize('keyed', ['in_memory'], indirect=True)
+def test_upsert_after_rows_were_deleted_outside_the_app(keyed):
+    db = keyed
+    first = _feed(range(100), seed=1)
+    store_processed(process_upload(_upload(first), DataProcessor()), db)
+    # A gap in the rowids: the index no longer lines up with rowid - 1
+    with db.pool.writer() as conn:
+        conn.execute(f'DELETE FROM "{TABLE}" WHERE "Patient_Id" BETWEEN 10 AND 19')
+        conn.commit()
+
+    second = first.copy()
+    second.loc[second['patient_id'] == 50, 'ward'] = 'z'
+    entry = store_processed(process_upload(_upload(second), DataProcessor()), db)
+
+    assert entry['processing_log'][-1].endswith('10 new, 1 changed, 89 unchanged rows')
+    stored = _assert_consistent(db)
+    assert len(stored) == 100
+    assert stored.loc[stored['Patient_Id'] == 50, 'Ward'].item() == 'z'
+
+    # The saved index keeps the rowids, so a further upsert needs no rehash
+    third = second.copy()
+    third.loc[third['patient_id'] == 60, 'ward'] = 'y'
+    entry = store_processed(process_upload(_upload(third), DataProcessor()), db)
+    assert entry['processing_log'][-1].endswith('0 new, 1 changed, 99 unchanged rows')
+    _assert_consistent(db)
@@ -0,0 +1,120 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import DATABASE_CONFIG
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path):
+    """Connection pool for a database file, shared by everything in this process
+
+    Pools are per process: connections must not cross a fork, so a pool
+    worker that touches the database opens its own.
+    """
+    key = (os.getpid(), os.path.abspath(db_path))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path)
+        return pool
+
+
+class ConnectionPool:
+    """One writer and several reader connections to a SQLite file
+
+    Each connection is opened and tuned once. WAL journaling lets readers
+    run alongside the writer, and the writer lock keeps writes in this
+    process to a single connection. Other processes are covered by
+    SQLite's busy timeout. Safe to share between threads, and so between
+    Streamlit sessions.
+    """
+
+    def __init__(self, db_path, readers=None, busy_timeout=None):
+        self.db_path = db_path
+        self.max_readers = readers or DATABASE_CONFIG['pool_readers']
+        self.busy_timeout = busy_timeout or DATABASE_CONFIG['busy_timeout']
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DATABASE_CONFIG['cache_size_kb']}")
+        conn.execute(f"PRAGMA mmap_size={DATABASE_CONFIG['mmap_size']}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    @contextmanager
+    def writer(self, timeout=None):
+        """The writer connection, held exclusively for the block
+
+        Like sqlite3's own context manager, commits when the block succeeds
+        and rolls back when it raises. `timeout` bounds the wait for another
+        thread's write; sqlite3.OperationalError is raised when it runs out.
+        """
+        if not self._writer_lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise sqlite3.OperationalError("database is locked")
+        try:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+        finally:
+            self._writer_lock.release()
+
+    @contextmanager
+    def reader(self):
+        """A read-only connection for the block; waits if all are in use"""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._reader_lock:
+            if self._reader_count < self.max_readers:
+                self._reader_count += 1
+                try:
+                    return self._connect(read_only=True)
+                except Exception:
+                    self._reader_count -= 1
+                    raise
+        return self._readers.get()
+
+    def close(self):
+        """Close idle connections; the pool reopens them on next use"""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._reader_lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._reader_count -= 1
@@ -1,60 +1,297 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+import json
 import re
+import time
+from concurrent.futures.process import BrokenProcessPool
+from config import PROCESSING_CONFIG
+from utils.readers import infer_date_format, looks_like_date
+from utils.database import row_hashes as compute_row_hashes
+from utils.parallel import (
+    column_groups, column_worker_count, get_column_pool, read_arrow_file, remove_arrow_file,
+    reset_column_pool, should_split_columns, write_arrow_file
+)
+from utils.sketch import QuantileSketch, column_sketches
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional: text falls back to object columns
+    pa = None
+
+# Values kept per text column for date format inference in the chunked plan
+_PLAN_SAMPLE_VALUES = 1000
+
+# Distinct values _ValueCounter counts exactly per column, and value hashes
+# it keeps to estimate the distinct count of columns with more
+_COUNTER_CAPACITY = 10000
+_COUNTER_HASHES = 1024
+
+# Dataset-level entries of a profile that make up get_basic_stats
+_BASIC_STATS_KEYS = (
+    'row_count', 'column_count', 'numeric_columns', 'categorical_columns',
+    'datetime_columns', 'missing_values', 'duplicate_rows', 'memory_usage'
+)
+
+# Numeric column statistics in DataFrame.describe order
+_DESCRIBE_KEYS = ('count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')
+
 
 class DataProcessor:
     """Advanced data processing utilities"""
     
-    def __init__(self):
+    # Cleaning stages that can be listed in PROCESSING_CONFIG['pipeline']
+    STAGES = (
+        'clean_column_names', 'handle_missing_values', 'detect_and_convert_types',
+        'remove_duplicates', 'handle_outliers', 'optimize_dtypes'
+    )
+    
+    # Stages that keep self.row_hashes in line with their output; after any
+    # other stage the hashes are recomputed at the end of the pipeline
+    ROW_HASH_STAGES = ('clean_column_names', 'remove_duplicates', 'handle_outliers', 'optimize_dtypes')
+    
+    # Stages that keep the values of numeric columns, and with them self.sketches
+    SKETCH_STAGES = ('handle_outliers', 'optimize_dtypes')
+    
+    # Stages that treat every column on its own, so wide frames can be split
+    # into column groups and cleaned in parallel (handle_outliers only when
+    # capping; removing rows couples the columns)
+    COLUMN_STAGES = ('handle_missing_values', 'detect_and_convert_types', 'handle_outliers', 'optimize_dtypes')
+    
+    def __init__(self, settings=None):
         self.processing_log = []
+        self.stage_metrics = []
+        self.row_hashes = None
+        self.source_hashes = None
+        self.sketches = None
+        self.settings = {**PROCESSING_CONFIG, **(settings or {})}
+        self._cells_touched = 0
+        self._stage_totals = {}
+        self._defer_summaries = False
+    
+    def get_settings_key(self):
+        """Stable string form of the cleaning settings, used in cache keys"""
+        return json.dumps(self.settings, sort_keys=True, default=str)
     
-    def clean_and_process(self, df, filename):
-        """Clean and process DataFrame with comprehensive operations"""
+    def get_pipeline(self, date_formats=None):
+        """Resolve the configured stages into (name, params) pairs
         
-        processed_df = df.copy()
-        self.processing_log = []
+        Entries are stage names or {"stage": name, "params": {...}} dicts;
+        parameters not given fall back to the processor settings.
+        """
+        defaults = {
+            'handle_missing_values': {'missing_threshold': self.settings['missing_threshold']},
+            'detect_and_convert_types': {
+                'date_formats': self.clean_date_formats(date_formats),
+                'sample_rows': self.settings['inference_sample_rows']
+            },
+            'handle_outliers': {
+                'method': self.settings['outlier_method'],
+                'action': self.settings['outlier_action']
+            },
+            'optimize_dtypes': {'category_max_ratio': self.settings['category_max_ratio']}
+        }
         
-        # Log original state
-        self.log_operation(f"Original data: {len(df)} rows, {len(df.columns)} columns")
+        pipeline = []
+        for spec in self.settings['pipeline']:
+            if isinstance(spec, str):
+                spec = {'stage': spec}
+            name = spec['stage']
+            if name not in self.STAGES:
+                raise ValueError(f"Unknown cleaning stage: {name}")
+            pipeline.append((name, {**defaults.get(name, {}), **spec.get('params', {})}))
+        return pipeline
+    
+    def has_default_pipeline(self):
+        """Whether the stages run in the order the chunked path implements
+        
+        The chunked path runs the cleaning stages in their default order,
+        optionally followed by optimize_dtypes on the assembled frame.
+        """
+        names = [name for name, _ in self.get_pipeline()]
+        if names[-1:] == ['optimize_dtypes']:
+            names = names[:-1]
+        return names == list(self.STAGES[:-1])
+    
+    def clean_and_process(self, df, filename, date_formats=None, track_source=False):
+        """Clean and process DataFrame with comprehensive operations
+        
+        Runs the configured pipeline stage by stage, recording each stage's
+        timing and memory in self.stage_metrics.
         
-        # 1. Clean column names
-        processed_df = self.clean_column_names(processed_df)
+        Afterwards self.row_hashes holds the row hashes of the result, taken
+        from the duplicate check and refreshed only for rows changed later,
+        and self.sketches the quantile sketches of its numeric columns,
+        built from the sort handle_outliers does anyway. With
+        `track_source`, self.source_hashes holds the hash of the raw row
+        each result row was cleaned from.
+        """
         
-        # 2. Handle missing values
-        processed_df = self.handle_missing_values(processed_df)
+        self.processing_log = []
+        self.stage_metrics = []
+        self.row_hashes = None
+        self.source_hashes = None
+        self.sketches = None
+        if track_source:
+            # Stages keep the index, so result rows point back at their raw rows
+            if not df.index.is_unique:
+                df = df.reset_index(drop=True)
+            source_hashes = pd.Series(compute_row_hashes(df), index=df.index)
         
-        # 3. Detect and convert data types
-        processed_df = self.detect_and_convert_types(processed_df)
+        # Log original state
+        self.log_operation(f"Original data: {len(df)} rows, {len(df.columns)} columns")
         
-        # 4. Remove duplicates
-        processed_df = self.remove_duplicates(processed_df)
+        processed_df = df
+        size = None
+        for name, params in self.get_pipeline(date_formats):
+            processed_df, size = self.run_stage(name, processed_df, params, size)
         
-        # 5. Handle outliers (optional)
-        processed_df = self.handle_outliers(processed_df)
+        if self.row_hashes is None or len(self.row_hashes) != len(processed_df):
+            self.row_hashes = compute_row_hashes(processed_df)
+        numeric = processed_df.select_dtypes(include=['number']).columns
+        if self.sketches is None or list(self.sketches) != list(numeric):
+            self.sketches = column_sketches(processed_df)
+        if track_source:
+            self.source_hashes = source_hashes.loc[processed_df.index].to_numpy()
         
         # Log final state
         self.log_operation(f"Processed data: {len(processed_df)} rows, {len(processed_df.columns)} columns")
         
         return processed_df
     
+    def run_stage(self, name, df, params, input_bytes=None):
+        """Run one stage and record its metrics; returns (df, bytes)"""
+        
+        input_bytes = _frame_bytes(df) if input_bytes is None else input_bytes
+        self._cells_touched = 0
+        
+        start = time.perf_counter()
+        if self._splits_columns(name, df, params):
+            output = self.run_stage_by_columns(name, df, params)
+        else:
+            output = getattr(self, name)(df, **params)
+        seconds = time.perf_counter() - start
+        if name not in self.ROW_HASH_STAGES:
+            self.row_hashes = None
+        if name not in self.SKETCH_STAGES:
+            self.sketches = None
+        
+        output_bytes = _frame_bytes(output)
+        metrics = {
+            'stage': name,
+            'params': params,
+            'seconds': seconds,
+            'memory_before': input_bytes,
+            'memory_after': output_bytes,
+            'memory_delta': output_bytes - input_bytes,
+            'rows_in': len(df),
+            'rows_out': len(output),
+            'cells_touched': self._cells_touched
+        }
+        self.stage_metrics.append(metrics)
+        return output, output_bytes
+    
+    def _splits_columns(self, name, df, params):
+        if name not in self.COLUMN_STAGES or params.get('action', 'cap') != 'cap':
+            return False
+        return should_split_columns(df)
+    
+    def run_stage_by_columns(self, name, df, params):
+        """Run a column stage on groups of columns in a process pool
+        
+        Each group is written to an Arrow IPC file in shared memory
+        (/dev/shm where available) that the worker memory-maps, and the
+        worker hands its output back the same way; only paths and log lines
+        go through the pool's pipe. The results are put side by side in the
+        original column order. Per-column log lines keep their group order
+        and the frame-wide summary line is rebuilt from the workers' totals.
+        Falls back to running in-process if a group cannot be converted to
+        Arrow or the pool breaks.
+        """
+        
+        groups = column_groups(df.columns.tolist(), column_worker_count())
+        inputs = []
+        results = []
+        try:
+            for group in groups:
+                inputs.append(write_arrow_file(df[group]))
+            pool = get_column_pool()
+            futures = [
+                pool.submit(_column_stage_worker, self.settings, name, params, path, object_columns)
+                for path, object_columns in inputs
+            ]
+            for future in futures:
+                results.append(future.result())
+            output = pd.concat([read_arrow_file(*result[:2]) for result in results], axis=1)
+        except (pa.ArrowException, BrokenProcessPool) as e:
+            if isinstance(e, BrokenProcessPool):
+                reset_column_pool()
+            return getattr(self, name)(df, **params)
+        finally:
+            # Workers remove the files they read; these are left by failures
+            for path, _ in inputs:
+                remove_arrow_file(path)
+            for result in results:
+                remove_arrow_file(result[0])
+        output.index = df.index
+        
+        totals = {}
+        sketches = {}
+        for _, _, log_lines, cells_touched, stage_totals, group_sketches in results:
+            self.processing_log.extend(log_lines)
+            self._cells_touched += cells_touched
+            for key, value in stage_totals.items():
+                totals[key] = totals.get(key, 0) + value
+            sketches.update({
+                col: QuantileSketch.from_dict(sketch) for col, sketch in (group_sketches or {}).items()
+            })
+        if totals:
+            self.log_operation(self._format_summary(name, totals))
+        
+        if name == 'handle_outliers':
+            numeric = output.select_dtypes(include=['number']).columns
+            self.sketches = {col: sketches[col] for col in numeric} if set(numeric) <= set(sketches) else None
+        
+        if name == 'handle_outliers' and self.row_hashes is not None and len(self.row_hashes) == len(df):
+            # Workers cannot see whole rows; rehash the rows whose values were capped
+            numeric = output.select_dtypes(include=['number']).columns
+            before = df[numeric].to_numpy(dtype='float64', na_value=np.nan)
+            after = output[numeric].to_numpy(dtype='float64', na_value=np.nan)
+            touched = ((before != after) & ~(np.isnan(before) & np.isnan(after))).any(axis=1)
+            if touched.any():
+                self.row_hashes = self.row_hashes.copy()
+                self.row_hashes[touched] = compute_row_hashes(output[touched])
+        
+        return output
+    
+    def _log_summary(self, name, **totals):
+        """Log a stage's frame-wide summary, or leave it for run_stage_by_columns"""
+        self._stage_totals = totals
+        if not self._defer_summaries:
+            self.log_operation(self._format_summary(name, totals))
+    
+    def _format_summary(self, name, totals):
+        if name == 'handle_missing_values':
+            return f"Missing values reduced from {totals['missing_before']} to {totals['missing_after']}"
+        
+        memory_before, memory_after = totals['memory_before'], totals['memory_after']
+        ratio = memory_before / memory_after if memory_after else 1.0
+        return (
+            f"Optimized dtypes of {totals['columns']} columns: memory "
+            f"{memory_before / 1024**2:.1f} MB -> {memory_after / 1024**2:.1f} MB ({ratio:.1f}x smaller)"
+        )
+    
+    def get_stage_metrics(self):
+        """Timing, memory and cell counts for each stage of the last run"""
+        return self.stage_metrics
+    
     def clean_column_names(self, df):
         """Clean and standardize column names"""
         original_columns = df.columns.tolist()
         
         # Clean column names
-        new_columns = []
-        for col in df.columns:
-            # Remove special characters and extra spaces
-            clean_col = re.sub(r'[^\w\s]', '', str(col))
-            clean_col = re.sub(r'\s+', '_', clean_col.strip())
-            
-            # Convert to title case
-            clean_col = clean_col.title()
-            
-            new_columns.append(clean_col)
-        
-        df.columns = new_columns
+        new_columns = [self.clean_column_name(col) for col in original_columns]
+        df = df.set_axis(new_columns, axis=1)
         
         # Log changes
         changes = [f"{orig} -> {new}" for orig, new in zip(original_columns, new_columns) if orig != new]
@@ -63,136 +300,686 @@ class DataProcessor:
         
         return df
     
-    def handle_missing_values(self, df):
+    def clean_column_name(self, col):
+        """Clean a single column name"""
+        # Remove special characters and extra spaces
+        clean_col = re.sub(r'[^\w\s]', '', str(col))
+        clean_col = re.sub(r'\s+', '_', clean_col.strip())
+        
+        # Convert to title case
+        return clean_col.title()
+    
+    def handle_missing_values(self, df, missing_threshold=None):
         """Handle missing values intelligently"""
         
-        missing_before = df.isnull().sum().sum()
+        if missing_threshold is None:
+            missing_threshold = self.settings['missing_threshold']
+        null_counts = df.isnull().sum()
+        missing_before = int(null_counts.sum())
+        missing_percentage = null_counts / max(len(df), 1) * 100
         
-        for column in df.columns:
-            missing_count = df[column].isnull().sum()
-            missing_percentage = (missing_count / len(df)) * 100
-            
-            if missing_count == 0:
-                continue
-            
-            if missing_percentage > 50:
-                # Drop columns with >50% missing values
-                df = df.drop(columns=[column])
-                self.log_operation(f"Dropped column '{column}' ({missing_percentage:.1f}% missing)")
-                continue
-            
-            # Handle based on data type
-            if df[column].dtype in ['int64', 'float64']:
-                # For numeric: fill with median
-                median_val = df[column].median()
-                df[column].fillna(median_val, inplace=True)
-                self.log_operation(f"Filled numeric column '{column}' with median: {median_val}")
-                
+        # Drop columns with too many missing values
+        to_drop = missing_percentage.index[missing_percentage > missing_threshold]
+        for column in to_drop:
+            self.log_operation(f"Dropped column '{column}' ({missing_percentage[column]:.1f}% missing)")
+        
+        to_fill = [col for col in null_counts.index[null_counts > 0] if col not in to_drop]
+        numeric_cols = [col for col in to_fill if df[col].dtype in ['int64', 'float64']]
+        other_cols = [col for col in to_fill if col not in numeric_cols]
+        
+        # For numeric: fill with median; for categorical: fill with mode
+        fill_values = {}
+        medians = df[numeric_cols].median() if numeric_cols else pd.Series(dtype='float64')
+        modes = df[other_cols].mode().head(1) if other_cols else pd.DataFrame()
+        
+        for column in to_fill:
+            if column in medians.index:
+                fill_values[column] = medians[column]
+                self.log_operation(f"Filled numeric column '{column}' with median: {medians[column]}")
+            elif len(modes) > 0 and not pd.isnull(modes[column].iloc[0]):
+                fill_values[column] = modes[column].iloc[0]
+                self.log_operation(f"Filled categorical column '{column}' with mode: {fill_values[column]}")
             else:
-                # For categorical: fill with mode
-                mode_val = df[column].mode()
-                if len(mode_val) > 0:
-                    df[column].fillna(mode_val[0], inplace=True)
-                    self.log_operation(f"Filled categorical column '{column}' with mode: {mode_val[0]}")
-                else:
-                    df[column].fillna('Unknown', inplace=True)
-                    self.log_operation(f"Filled column '{column}' with 'Unknown'")
+                fill_values[column] = 'Unknown'
+                self.log_operation(f"Filled column '{column}' with 'Unknown'")
         
-        missing_after = df.isnull().sum().sum()
-        self.log_operation(f"Missing values reduced from {missing_before} to {missing_after}")
+        if len(to_drop) > 0:
+            df = df.drop(columns=to_drop)
+        if fill_values:
+            df = df.fillna(fill_values)
+        self._cells_touched += len(df) * len(to_drop) + int(null_counts[list(fill_values)].sum())
+        
+        missing_after = int(df[to_fill].isnull().sum().sum()) if to_fill else 0
+        self._log_summary('handle_missing_values', missing_before=missing_before, missing_after=missing_after)
         
         return df
     
-    def detect_and_convert_types(self, df):
-        """Detect and convert appropriate data types"""
+    def clean_date_formats(self, date_formats):
+        """Re-key sniffed date formats by cleaned column name"""
+        return {
+            self.clean_column_name(col): date_format
+            for col, date_format in (date_formats or {}).items()
+        }
+    
+    def detect_and_convert_types(self, df, date_formats=None, sample_rows=None):
+        """Detect and convert appropriate data types
         
-        for column in df.columns:
-            # Skip if already numeric
-            if df[column].dtype in ['int64', 'float64']:
-                continue
-            
-            # Try to convert to numeric
-            numeric_df = pd.to_numeric(df[column], errors='coerce')
-            numeric_nulls = numeric_df.isnull().sum()
-            original_nulls = df[column].isnull().sum()
+        Types are decided on a random sample of rows. A column is converted
+        to numeric when fewer than 10% of rows would fail to parse; when the
+        sample estimate is too close to that limit to be sure, the decision
+        falls back to the full column. Date columns get an explicit format
+        inferred from the sample. A sniffed date format is used only if it
+        leaves fewer than 10% of values unparsed; otherwise the column's type
+        is inferred as if none had been sniffed. Only accepted columns are
+        converted in full, each in one vectorized call.
+        """
+        
+        date_formats = date_formats or {}
+        sample_rows = sample_rows or self.settings['inference_sample_rows']
+        
+        # Skip columns that are already numeric or datetime
+        candidates = [
+            col for col in df.columns
+            if df[col].dtype not in ['int64', 'float64']
+            and not pd.api.types.is_datetime64_any_dtype(df[col])
+        ]
+        if not candidates or len(df) == 0:
+            return df
+        
+        exact = len(df) <= sample_rows
+        if exact:
+            sample = df[candidates]
+        else:
+            # Fixed seed, so cleaning the same file twice gives the same result
+            rows = np.random.default_rng(0).choice(len(df), sample_rows, replace=False)
+            sample = df[candidates].take(np.sort(rows))
+        converted = {}
+        
+        for column in candidates:
+            # Columns with a sniffed date format are parsed directly
+            if column in date_formats:
+                parsed = pd.to_datetime(df[column], format=date_formats[column], errors='coerce')
+                if (parsed.isnull() & df[column].notnull()).mean() < 0.1:
+                    converted[column] = parsed
+                    self.log_operation(f"Converted '{column}' to datetime ({date_formats[column]})")
+                    continue
+                self.log_operation(
+                    f"Sniffed date format {date_formats[column]} does not fit '{column}'; inferring its type"
+                )
             
-            # If conversion doesn't create too many new nulls, convert to numeric
-            if (numeric_nulls - original_nulls) / len(df) < 0.1:
-                df[column] = numeric_df
+            # Convert to numeric if it doesn't create too many new nulls
+            values = sample[column]
+            failed = float((_to_numeric(values).isnull() & values.notnull()).mean())
+            margin = 0.0 if exact else _sampling_margin(failed, len(sample))
+            if failed + margin < 0.1:
+                converted[column] = _to_numeric(df[column])
                 self.log_operation(f"Converted '{column}' to numeric")
                 continue
+            if failed - margin < 0.1:
+                numeric_values = _to_numeric(df[column])
+                if (numeric_values.isnull() & df[column].notnull()).mean() < 0.1:
+                    converted[column] = numeric_values
+                    self.log_operation(f"Converted '{column}' to numeric")
+                    continue
             
-            # Try to convert to datetime
-            try:
-                if df[column].dtype == 'object':
-                    # Check if it looks like a date
-                    sample_values = df[column].dropna().head(10)
-                    date_patterns = [r'\d{4}-\d{2}-\d{2}', r'\d{2}/\d{2}/\d{4}', r'\d{2}-\d{2}-\d{4}']
-                    
-                    for pattern in date_patterns:
-                        if sample_values.astype(str).str.match(pattern).any():
-                            df[column] = pd.to_datetime(df[column], errors='coerce')
-                            self.log_operation(f"Converted '{column}' to datetime")
-                            break
-            except:
-                pass
+            # Try to convert to datetime if it looks like a date
+            if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+                continue
+            text_values = values.dropna().astype(str)
+            date_format = infer_date_format(text_values, min_share=0.9)
+            if date_format:
+                converted[column] = pd.to_datetime(df[column], format=date_format, errors='coerce')
+                self.log_operation(f"Converted '{column}' to datetime ({date_format})")
+            elif looks_like_date(text_values.head(10)):
+                # Recognisable dates in a format we don't know: let pandas infer it
+                try:
+                    converted[column] = pd.to_datetime(df[column], errors='coerce')
+                    self.log_operation(f"Converted '{column}' to datetime")
+                except (ValueError, TypeError):
+                    pass
+        
+        # Replace all converted columns at once
+        if converted:
+            df = df.assign(**converted)
+            self._cells_touched += len(df) * len(converted)
         
         return df
     
     def remove_duplicates(self, df):
-        """Remove duplicate rows"""
+        """Remove duplicate rows
+        
+        Rows are compared by 64-bit hash, as in the chunked path, instead of
+        factorizing every column. The hashes of the kept rows are reused for
+        duplicate counts and storage.
+        """
         
         initial_rows = len(df)
-        df_deduplicated = df.drop_duplicates()
+        if initial_rows == 0 or len(df.columns) == 0:
+            return df
+        hashes = compute_row_hashes(df)
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        df_deduplicated = df[keep]
+        self.row_hashes = hashes[keep]
         final_rows = len(df_deduplicated)
         
         duplicates_removed = initial_rows - final_rows
+        self._cells_touched += duplicates_removed * len(df.columns)
         if duplicates_removed > 0:
             self.log_operation(f"Removed {duplicates_removed} duplicate rows")
         
         return df_deduplicated
     
     def handle_outliers(self, df, method='iqr', action='cap'):
-        """Handle outliers in numeric columns"""
+        """Handle outliers in numeric columns
+        
+        The numeric columns are sorted together in one call. The sorted
+        columns give the quartiles for every column's bounds (exactly as
+        DataFrame.quantile) and, when capping, self.sketches of the output:
+        clipping a sorted column leaves it sorted.
+        """
         
+        self.sketches = None
         numeric_columns = df.select_dtypes(include=['number']).columns
+        if method != 'iqr' or len(numeric_columns) == 0 or len(df) == 0:
+            return df
         
-        for column in numeric_columns:
-            if method == 'iqr':
-                Q1 = df[column].quantile(0.25)
-                Q3 = df[column].quantile(0.75)
-                IQR = Q3 - Q1
-                lower_bound = Q1 - 1.5 * IQR
-                upper_bound = Q3 + 1.5 * IQR
-                
-                outliers = df[(df[column] < lower_bound) | (df[column] > upper_bound)]
-                
-                if len(outliers) > 0:
-                    if action == 'cap':
-                        df[column] = df[column].clip(lower_bound, upper_bound)
-                        self.log_operation(f"Capped {len(outliers)} outliers in '{column}'")
-                    elif action == 'remove':
-                        df = df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
-                        self.log_operation(f"Removed {len(outliers)} outlier rows based on '{column}'")
+        ordered = np.sort(df[numeric_columns].to_numpy(dtype='float64', na_value=np.nan), axis=0)
+        Q1, Q3 = _sorted_quantiles(ordered, [0.25, 0.75])
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 1.5 * IQR
+        upper_bound = Q3 + 1.5 * IQR
+        bounds = {col: (lower_bound[i], upper_bound[i]) for i, col in enumerate(numeric_columns)}
+        if action == 'cap':
+            np.clip(ordered, lower_bound, upper_bound, out=ordered)
+            self.sketches = {
+                col: QuantileSketch.from_sorted(ordered[:, i]) for i, col in enumerate(numeric_columns)
+            }
         
+        df, counts, touched = self.apply_outlier_bounds(df, bounds, action)
+        if self.row_hashes is not None and len(self.row_hashes) == len(touched):
+            self.row_hashes = self._hashes_after_outliers(df, self.row_hashes, touched, action)
+        self._log_outliers(counts, action)
         return df
     
-    def get_basic_stats(self, df):
-        """Get basic statistics about the dataframe"""
+    def outlier_bounds(self, sketches, method='iqr'):
+        """IQR bounds of each column from its quantile sketch, as {col: (lower, upper)}
+        
+        The chunked path's counterpart of the bounds handle_outliers takes
+        from the whole frame; they are identical while a sketch is exact.
+        """
+        if method != 'iqr':
+            return {}
+        bounds = {}
+        for col, sketch in sketches.items():
+            if sketch.count == 0:
+                continue
+            q1, q3 = sketch.quantile([0.25, 0.75])
+            iqr = q3 - q1
+            bounds[col] = (q1 - 1.5 * iqr, q3 + 1.5 * iqr)
+        return bounds
+    
+    def apply_outlier_bounds(self, df, bounds, action='cap', sketches=None):
+        """Cap or remove values outside `bounds` in a frame or one chunk of it
+        
+        Returns the frame, the outlier count of each column and a mask of
+        the rows capped or removed. `sketches`, if given, are updated to
+        describe the result. Missing values are never outliers.
+        """
+        columns = [col for col in bounds if col in df.columns]
+        touched = np.zeros(len(df), dtype=bool)
+        if not columns or len(df) == 0:
+            return df, {}, touched
+        
+        values = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+        lower = np.array([bounds[col][0] for col in columns])
+        upper = np.array([bounds[col][1] for col in columns])
+        outside = (values < lower) | (values > upper)
+        outlier_counts = outside.sum(axis=0)
+        bounded = np.flatnonzero(outlier_counts)
+        counts = {columns[i]: int(outlier_counts[i]) for i in bounded}
+        if len(bounded) == 0:
+            return df, counts, touched
+        touched = outside.any(axis=1)
+        
+        if action == 'cap':
+            # One clip over the float matrix; clipping upcasts to float64 anyway
+            capped = np.clip(values[:, bounded], lower[bounded], upper[bounded])
+            df = df.assign(**{columns[i]: capped[:, j] for j, i in enumerate(bounded)})
+            self._cells_touched += int(outlier_counts.sum())
+            for i in bounded:
+                if sketches is not None and columns[i] in sketches:
+                    sketches[columns[i]] = sketches[columns[i]].clip(lower[i], upper[i])
+        elif action == 'remove':
+            self._cells_touched += int(touched.sum()) * len(df.columns)
+            if sketches is not None:
+                for col, sketch in sketches.items():
+                    if col in df.columns:
+                        sketch.remove(df.loc[touched, col])
+            df = df[~touched]
+        return df, counts, touched
+    
+    def _hashes_after_outliers(self, df, hashes, touched, action):
+        """Row hashes after apply_outlier_bounds: capped rows rehashed, removed rows dropped"""
+        if not touched.any():
+            return hashes
+        if action == 'remove':
+            return hashes[~touched]
+        hashes = hashes.copy()
+        hashes[touched] = compute_row_hashes(df[touched])
+        return hashes
+    
+    def _log_outliers(self, counts, action):
+        for column, count in counts.items():
+            if action == 'cap':
+                self.log_operation(f"Capped {count} outliers in '{column}'")
+            else:
+                self.log_operation(f"Removed {count} outlier rows based on '{column}'")
+    
+    def optimize_dtypes(self, df, category_max_ratio=None):
+        """Store columns in the smallest dtype that holds their values exactly
+        
+        Integers are downcast, floats become integers when every value is
+        whole (nullable if some are missing) or float32 when that is
+        lossless, repetitive text becomes category and other text is kept
+        as Arrow-backed strings when pyarrow is available.
+        """
+        
+        if category_max_ratio is None:
+            category_max_ratio = self.settings['category_max_ratio']
+        memory_before = int(df.memory_usage(deep=True).sum())
+        
+        optimized = {}
+        for column in df.columns:
+            values = df[column]
+            if pd.api.types.is_bool_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+                continue
+            if pd.api.types.is_numeric_dtype(values):
+                new_values = _compact_numeric(values)
+            elif isinstance(values.dtype, pd.CategoricalDtype):
+                continue
+            else:
+                new_values = _compact_text(values, category_max_ratio)
+            if new_values is not None and new_values.dtype != values.dtype:
+                optimized[column] = new_values
+        
+        if optimized:
+            df = df.assign(**optimized)
+            self._cells_touched += len(df) * len(optimized)
+        
+        memory_after = int(df.memory_usage(deep=True).sum())
+        self._log_summary(
+            'optimize_dtypes', columns=len(optimized), memory_before=memory_before, memory_after=memory_after
+        )
+        
+        return df
+    
+    def plan_chunked_cleaning(self, chunks, date_formats=None):
+        """First pass over a chunked file: merge per-chunk summaries into a cleaning plan
+        
+        Medians come from per-column quantile sketches and modes from value
+        counts, both merged across chunks, so memory does not grow with the
+        file. Sketches are exact for columns with few distinct values and
+        within a small rank error otherwise. Fill statistics include
+        duplicate rows, as they do in clean_and_process; duplicates and
+        outliers are left to plan_chunked_finish, which sees the filled
+        and converted rows.
+        """
+        
+        self.processing_log = []
+        self.stage_metrics = []
+        stage_params = dict(self.get_pipeline())
+        missing_threshold = stage_params['handle_missing_values']['missing_threshold']
+        date_formats = self.clean_date_formats(date_formats)
+        columns = None
+        row_count = 0
+        null_counts = None
+        numeric_kind = {}
+        sketches = {}
+        raw_counts = {}
+        non_numeric = {}
+        date_failures = dict.fromkeys(date_formats, 0)
+        samples = {}
+        
+        for chunk in chunks:
+            if columns is None:
+                original_columns = chunk.columns.tolist()
+                columns = [self.clean_column_name(col) for col in original_columns]
+                for col in columns:
+                    numeric_kind[col] = True
+                    sketches[col] = QuantileSketch()
+                    raw_counts[col] = _ValueCounter()
+                    non_numeric[col] = 0
+                    samples[col] = []
+            chunk.columns = columns
+            
+            row_count += len(chunk)
+            chunk_nulls = chunk.isnull().sum()
+            null_counts = chunk_nulls if null_counts is None else null_counts + chunk_nulls
+            
+            numeric_cols = [c for c in columns if chunk[c].dtype in ['int64', 'float64']]
+            for col in columns:
+                values = chunk[col]
+                if col in numeric_cols:
+                    sketches[col].add(values)
+                    continue
+                
+                numeric_kind[col] = False
+                if pd.api.types.is_datetime64_any_dtype(values):
+                    # Dates are never numeric candidates
+                    parsed = pd.Series(np.nan, index=values.index)
+                else:
+                    parsed = pd.to_numeric(values, errors='coerce')
+                non_numeric[col] += int((parsed.isnull() & values.notnull()).sum())
+                if col in date_formats:
+                    dates = pd.to_datetime(values, format=date_formats[col], errors='coerce')
+                    date_failures[col] += int((dates.isnull() & values.notnull()).sum())
+                raw_counts[col].add(values)
+                if len(samples[col]) < _PLAN_SAMPLE_VALUES:
+                    samples[col].extend(values.dropna().head(_PLAN_SAMPLE_VALUES - len(samples[col])).tolist())
+        
+        if columns is None:
+            raise ValueError("File contains no data")
+        
+        self.log_operation(f"Original data: {row_count} rows, {len(columns)} columns")
+        renamed = sum(1 for orig, new in zip(original_columns, columns) if orig != new)
+        if renamed:
+            self.log_operation(f"Cleaned column names: {renamed} columns renamed")
+        
+        plan = {
+            'columns': columns,
+            'drop': [],
+            'fill': {},
+            'float_columns': [],
+            'numeric_conversions': [],
+            'datetime_conversions': [],
+            'date_formats': {},
+            'row_count': row_count
+        }
+        
+        # Missing values: drop sparse columns, fill the rest with median or mode
+        missing_before = int(null_counts.sum())
+        missing_after = missing_before
+        for col in columns:
+            missing_count = int(null_counts[col])
+            if missing_count == 0:
+                continue
+            
+            missing_percentage = missing_count / row_count * 100
+            if missing_percentage > missing_threshold:
+                plan['drop'].append(col)
+                missing_after -= missing_count
+                self.log_operation(f"Dropped column '{col}' ({missing_percentage:.1f}% missing)")
+                continue
+            
+            missing_after -= missing_count
+            if numeric_kind[col]:
+                if sketches[col].count == 0:
+                    continue
+                median_val = sketches[col].quantile(0.5)
+                plan['fill'][col] = median_val
+                plan['float_columns'].append(col)
+                self.log_operation(f"Filled numeric column '{col}' with median: {median_val}")
+                continue
+            
+            counts = raw_counts[col].counts()
+            if len(counts) > 0:
+                mode_val = _mode_from_counts(counts)
+                plan['fill'][col] = mode_val
+                self.log_operation(f"Filled categorical column '{col}' with mode: {mode_val}")
+            else:
+                plan['fill'][col] = 'Unknown'
+                self.log_operation(f"Filled column '{col}' with 'Unknown'")
+        
+        self.log_operation(f"Missing values reduced from {missing_before} to {missing_after}")
+        
+        # Type conversion for text columns, decided from the merged summaries
+        for col in columns:
+            if numeric_kind[col] or col in plan['drop']:
+                continue
+            
+            if col in date_formats:
+                # As in detect_and_convert_types: a sniffed format must fit the column
+                if date_failures[col] / row_count < 0.1:
+                    plan['datetime_conversions'].append(col)
+                    plan['date_formats'][col] = date_formats[col]
+                    self.log_operation(f"Converted '{col}' to datetime ({date_formats[col]})")
+                    continue
+                self.log_operation(
+                    f"Sniffed date format {date_formats[col]} does not fit '{col}'; inferring its type"
+                )
+            
+            new_nulls = non_numeric[col]
+            fill_value = plan['fill'].get(col)
+            filled = int(null_counts[col]) if col in plan['fill'] else 0
+            fill_number = pd.to_numeric(pd.Series([fill_value]), errors='coerce').iloc[0] if filled else np.nan
+            if filled and pd.isnull(fill_number):
+                new_nulls += filled
+            
+            if new_nulls / row_count < 0.1:
+                plan['numeric_conversions'].append(col)
+                self.log_operation(f"Converted '{col}' to numeric")
+                continue
+            
+            sample_values = pd.Series(samples[col], dtype='object').astype(str)
+            date_format = infer_date_format(sample_values, min_share=0.9)
+            if date_format:
+                plan['datetime_conversions'].append(col)
+                plan['date_formats'][col] = date_format
+                self.log_operation(f"Converted '{col}' to datetime ({date_format})")
+            elif looks_like_date(sample_values.head(10)):
+                plan['datetime_conversions'].append(col)
+                self.log_operation(f"Converted '{col}' to datetime")
+        
+        return plan
+    
+    def apply_cleaning_plan(self, chunk, plan):
+        """Second pass: fill and convert one chunk using a plan from plan_chunked_cleaning"""
+        
+        chunk.columns = plan['columns']
+        if plan['drop']:
+            chunk = chunk.drop(columns=plan['drop'])
+        if plan['fill']:
+            chunk = chunk.fillna(plan['fill'])
+        
+        for col in plan['float_columns']:
+            chunk[col] = chunk[col].astype('float64')
+        for col in plan['numeric_conversions']:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+        for col in plan['datetime_conversions']:
+            chunk[col] = pd.to_datetime(
+                chunk[col], format=plan['date_formats'].get(col), errors='coerce'
+            )
+        
+        return chunk
+    
+    def plan_chunked_finish(self, chunks, chunk_hashes):
+        """Plan duplicates, outliers and dtypes for chunks from apply_cleaning_plan
+        
+        `chunks` are read twice, so they must be re-iterable (clean_stream
+        spools them to disk); `chunk_hashes` are their row hashes.
+        Duplicates are found across the whole file from the filled and
+        converted rows. Outlier bounds come from quantile sketches of the
+        deduplicated rows, so they match clean_and_process while the
+        sketches are exact, and dtypes are chosen from the handled rows as
+        optimize_dtypes would choose them for the assembled frame. Sets
+        self.row_hashes and self.sketches for the finished rows; the plan
+        also holds their positions in the file. Apply it chunk by chunk
+        with apply_chunked_finish, then call complete_chunked_cleaning.
+        """
+        
+        hashes = np.concatenate(chunk_hashes)
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        duplicates = int(len(keep) - keep.sum())
+        if duplicates > 0:
+            self.log_operation(f"Removed {duplicates} duplicate rows")
+        
+        sketches = {}
+        for _, chunk in _deduplicated(chunks, keep):
+            column_sketches(chunk, sketches)
+        
+        stage_params = dict(self.get_pipeline())
+        params = stage_params['handle_outliers']
+        action = params.get('action', 'cap')
+        bounds = self.outlier_bounds(sketches, params.get('method', 'iqr'))
+        
+        dtypes = _ChunkedDtypes()
+        outlier_counts = {}
+        finished_hashes = []
+        positions = []
+        memory_before = 0
+        for chunk_positions, chunk in _deduplicated(chunks, keep):
+            chunk, counts, touched = self.apply_outlier_bounds(chunk, bounds, action, sketches)
+            for col, count in counts.items():
+                outlier_counts[col] = outlier_counts.get(col, 0) + count
+            finished_hashes.append(
+                self._hashes_after_outliers(chunk, hashes[chunk_positions], touched, action)
+            )
+            positions.append(chunk_positions[~touched] if action == 'remove' else chunk_positions)
+            dtypes.add(chunk)
+            memory_before += int(chunk.memory_usage(deep=True, index=False).sum())
+        self._log_outliers(outlier_counts, action)
+        self.row_hashes = np.concatenate(finished_hashes)
+        self.sketches = sketches
+        
+        target_dtypes = None
+        if 'optimize_dtypes' in stage_params:
+            category_max_ratio = stage_params['optimize_dtypes'].get(
+                'category_max_ratio', self.settings['category_max_ratio']
+            )
+            target_dtypes = dtypes.dtypes(category_max_ratio)
+        
+        return {
+            'keep': keep,
+            'bounds': bounds,
+            'action': action,
+            'dtypes': target_dtypes,
+            'compacted': dtypes.changed(target_dtypes or {}),
+            'positions': np.concatenate(positions),
+            'memory_before': memory_before,
+            'profile': ChunkedProfile()
+        }
+    
+    def apply_chunked_finish(self, chunk, start, finish):
+        """Drop duplicates, handle outliers and set dtypes of one chunk with a plan from plan_chunked_finish
+        
+        `start` is the position of the chunk's first row in the file.
+        """
+        
+        chunk = chunk[finish['keep'][start:start + len(chunk)]]
+        chunk, _, _ = self.apply_outlier_bounds(chunk, finish['bounds'], finish['action'])
+        if finish['dtypes']:
+            changed = {
+                col: dtype for col, dtype in finish['dtypes'].items() if chunk[col].dtype != dtype
+            }
+            if changed:
+                chunk = chunk.astype(changed)
+        finish['profile'].add(chunk)
+        return chunk
+    
+    def complete_chunked_cleaning(self, finish):
+        """Log the summary of a chunked run once every chunk is finished and return its profile
+        
+        The profile is as build_profile would give for the assembled frame
+        (see ChunkedProfile).
+        """
+        
+        profile = finish['profile'].result(self.row_hashes, self.sketches)
+        if finish['dtypes'] is not None:
+            self._log_summary(
+                'optimize_dtypes', columns=finish['compacted'],
+                memory_before=finish['memory_before'], memory_after=profile['memory_usage']
+            )
+        self.log_operation(
+            f"Processed data: {profile['row_count']} rows, {profile['column_count']} columns"
+        )
+        return profile
+    
+    def get_basic_stats(self, df, hashes=None, profile=None):
+        """Get basic statistics about the dataframe
+        
+        `hashes` are the frame's row hashes; when given, duplicates are
+        counted from them instead of comparing every column again. With a
+        `profile` from build_profile the statistics are read from it.
+        """
+        
+        if profile is not None:
+            return {key: profile[key] for key in _BASIC_STATS_KEYS}
+        
+        if hashes is not None and len(hashes) == len(df):
+            duplicate_rows = int(pd.Series(hashes).duplicated().sum())
+        else:
+            duplicate_rows = df.duplicated().sum()
         
         stats = {
             'row_count': len(df),
             'column_count': len(df.columns),
             'numeric_columns': len(df.select_dtypes(include=['number']).columns),
-            'categorical_columns': len(df.select_dtypes(include=['object']).columns),
+            'categorical_columns': len(df.select_dtypes(include=['object', 'category', 'string']).columns),
             'datetime_columns': len(df.select_dtypes(include=['datetime']).columns),
             'missing_values': df.isnull().sum().sum(),
-            'duplicate_rows': df.duplicated().sum(),
+            'duplicate_rows': duplicate_rows,
             'memory_usage': df.memory_usage(deep=True).sum()
         }
         
         return stats
     
+    def build_profile(self, df, hashes=None, sketches=None, top_values=10):
+        """Profile a dataset once: counts, nulls, distinct values, moments, quantiles, top values
+        
+        Each column is visited once; quartiles come from `sketches` (as built
+        by column_sketches, or their to_dict form) when available and
+        duplicates from `hashes`. The result is plain JSON so it can be kept
+        with the table and the dataset cache.
+        """
+        
+        if hashes is None or len(hashes) != len(df):
+            hashes = compute_row_hashes(df)
+        
+        row_count = len(df)
+        columns = {}
+        for col in df.columns:
+            values = df[col]
+            nulls = int(values.isnull().sum())
+            column = {
+                'dtype': str(values.dtype),
+                'count': row_count - nulls,
+                'nulls': nulls
+            }
+            
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                column['kind'] = 'numeric'
+                column.update(_numeric_profile(values, (sketches or {}).get(col)))
+            elif pd.api.types.is_datetime64_any_dtype(values):
+                column['kind'] = 'datetime'
+                column['distinct'] = int(values.nunique())
+                column['min'] = str(values.min()) if nulls < row_count else None
+                column['max'] = str(values.max()) if nulls < row_count else None
+            else:
+                # The dtypes select_dtypes(['object', 'category', 'string']) picks
+                is_text = values.dtype == object or isinstance(
+                    values.dtype, (pd.CategoricalDtype, pd.StringDtype)
+                )
+                column['kind'] = 'categorical' if is_text else 'other'
+                counts = values.value_counts()
+                column['distinct'] = len(counts)
+                column['top_values'] = [
+                    [_json_value(value), int(count)] for value, count in counts.head(top_values).items()
+                ]
+            columns[str(col)] = column
+        
+        kinds = [column['kind'] for column in columns.values()]
+        return {
+            'row_count': row_count,
+            'column_count': len(columns),
+            'numeric_columns': kinds.count('numeric'),
+            'categorical_columns': kinds.count('categorical'),
+            'datetime_columns': kinds.count('datetime'),
+            'missing_values': sum(column['nulls'] for column in columns.values()),
+            'duplicate_rows': int(pd.Series(hashes).duplicated().sum()),
+            'memory_usage': int(df.memory_usage(deep=True).sum()),
+            'columns': columns
+        }
+    
     def get_processing_log(self):
         """Get the processing log"""
         return self.processing_log
@@ -202,30 +989,539 @@ class DataProcessor:
         timestamp = datetime.now().strftime("%H:%M:%S")
         self.processing_log.append(f"[{timestamp}] {operation}")
     
-    def generate_data_summary(self, df, filename):
-        """Generate comprehensive data summary"""
+    def generate_data_summary(self, df, filename, profile=None):
+        """Generate comprehensive data summary
+        
+        Reads column statistics from `profile` (see build_profile), building
+        one if it is not given.
+        """
+        
+        profile = profile or self.build_profile(df)
+        columns = profile['columns']
         
         summary = {
             'filename': filename,
             'shape': df.shape,
             'columns': df.columns.tolist(),
             'dtypes': df.dtypes.to_dict(),
-            'missing_values': df.isnull().sum().to_dict(),
-            'basic_stats': self.get_basic_stats(df),
+            'missing_values': {col: column['nulls'] for col, column in columns.items()},
+            'basic_stats': self.get_basic_stats(df, profile=profile),
             'processing_log': self.processing_log
         }
         
         # Add numeric summaries
-        numeric_cols = df.select_dtypes(include=['number']).columns
-        if len(numeric_cols) > 0:
-            summary['numeric_summary'] = df[numeric_cols].describe().to_dict()
+        numeric_summary = {
+            col: {key: column[key] for key in _DESCRIBE_KEYS}
+            for col, column in columns.items() if column['kind'] == 'numeric'
+        }
+        if numeric_summary:
+            summary['numeric_summary'] = numeric_summary
         
         # Add categorical summaries
-        categorical_cols = df.select_dtypes(include=['object']).columns
-        if len(categorical_cols) > 0:
-            summary['categorical_summary'] = {}
-            for col in categorical_cols:
-                value_counts = df[col].value_counts().head(10)
-                summary['categorical_summary'][col] = value_counts.to_dict()
+        categorical_summary = {
+            col: dict(column['top_values'])
+            for col, column in columns.items() if column['kind'] == 'categorical'
+        }
+        if categorical_summary:
+            summary['categorical_summary'] = categorical_summary
         
         return summary
+
+
+class _ValueCounter:
+    """Value counts that can be merged across chunks, in bounded memory
+    
+    Counts are exact until more than `capacity` distinct values have been
+    seen. From then on only the `capacity` most frequent values are kept,
+    each undercounted by at most `error`, and distinct() estimates the
+    number of distinct values from the smallest value hashes seen (a
+    k-minimum-values sketch) instead of counting them.
+    """
+    
+    def __init__(self, capacity=_COUNTER_CAPACITY, hashes=_COUNTER_HASHES):
+        self.capacity = capacity
+        self.exact = True
+        self.error = 0
+        self._hashes = hashes
+        self._counts = None
+        self._pending = []
+        self._pending_size = 0
+        self._min_hashes = np.empty(0, dtype='uint64')
+    
+    def add(self, values):
+        counts = values.value_counts()
+        counts = counts[counts > 0]
+        if len(counts) == 0:
+            return
+        if isinstance(counts.index, pd.CategoricalIndex):
+            counts.index = counts.index.astype(object)
+        self._pending.append(counts)
+        self._pending_size += len(counts)
+        value_hashes = pd.util.hash_pandas_object(counts.index, index=False).to_numpy()
+        self._min_hashes = np.unique(np.concatenate([self._min_hashes, value_hashes]))[:self._hashes]
+        if self._pending_size >= self.capacity:
+            self._compact()
+    
+    def counts(self):
+        """Counts of the values kept, in order of first appearance"""
+        self._compact()
+        if self._counts is None:
+            return pd.Series(dtype='int64')
+        return self._counts
+    
+    def distinct(self):
+        """Number of distinct values: exact while counts() holds them all, else estimated"""
+        counts = self.counts()
+        if self.exact or len(self._min_hashes) < self._hashes:
+            return len(counts)
+        estimate = (self._hashes - 1) / ((float(self._min_hashes[-1]) + 1) / 2 ** 64)
+        return max(int(round(estimate)), len(counts))
+    
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = self._pending if self._counts is None else [self._counts] + self._pending
+        counts = pd.concat(parts).groupby(level=0, sort=False).sum()
+        self._pending = []
+        self._pending_size = 0
+        if len(counts) > self.capacity:
+            largest = np.sort(counts.to_numpy())[::-1]
+            self.error += int(largest[self.capacity])
+            self.exact = False
+            # Keep order of first appearance among the values kept
+            counts = counts[counts.rank(method='first', ascending=False) <= self.capacity]
+        self._counts = counts
+
+
+class _ChunkedDtypes:
+    """The dtypes optimize_dtypes would give a frame that arrives in chunks
+    
+    Numeric columns keep their range and whether every value is whole or
+    float32 holds it; text columns keep their value counts. A text column
+    with more distinct values than _ValueCounter keeps is never made a
+    category, and a column whose chunks mix numbers and text stays object.
+    """
+    
+    def __init__(self):
+        self.rows = 0
+        self._dtypes = {}
+        self._numeric = {}
+        self._text = {}
+        self._strings = {}
+    
+    def add(self, chunk):
+        self.rows += len(chunk)
+        for col in chunk.columns:
+            values = chunk[col]
+            self._dtypes.setdefault(col, []).append(values.dtype)
+            if pd.api.types.is_bool_dtype(values) or pd.api.types.is_datetime64_any_dtype(values) \
+                    or isinstance(values.dtype, pd.CategoricalDtype):
+                continue
+            if pd.api.types.is_numeric_dtype(values):
+                self._add_numeric(col, values)
+            else:
+                self._text.setdefault(col, _ValueCounter()).add(values)
+                kind = pd.api.types.infer_dtype(values, skipna=True) if values.dtype == object else None
+                self._strings[col] = self._strings.get(col, True) and kind in ('string', 'empty')
+    
+    def _add_numeric(self, col, values):
+        summary = self._numeric.setdefault(col, {
+            'integer': True, 'count': 0, 'missing': 0, 'whole': True, 'float32': True,
+            'min': None, 'max': None
+        })
+        summary['integer'] = summary['integer'] and pd.api.types.is_integer_dtype(values) \
+            and not values.hasnans
+        array = values.to_numpy(dtype='float64', na_value=np.nan)
+        missing = np.isnan(array)
+        finite = array[~missing]
+        summary['missing'] += int(missing.sum())
+        summary['count'] += len(finite)
+        if len(finite) == 0:
+            return
+        
+        summary['whole'] = summary['whole'] and bool(
+            np.all(np.isfinite(finite)) and np.array_equal(finite, np.round(finite))
+            and np.abs(finite).max() < 2 ** 53
+        )
+        summary['float32'] = summary['float32'] and np.array_equal(
+            finite.astype('float32').astype('float64'), finite
+        )
+        # Integer columns keep exact extremes, beyond what float64 holds
+        low, high = (values.min(), values.max()) if summary['integer'] else (finite.min(), finite.max())
+        summary['min'] = low if summary['min'] is None else min(summary['min'], low)
+        summary['max'] = high if summary['max'] is None else max(summary['max'], high)
+    
+    def dtypes(self, category_max_ratio):
+        """{column: dtype} for every column seen"""
+        dtypes = {}
+        for col, seen in self._dtypes.items():
+            kinds = {_dtype_kind(dtype) for dtype in seen}
+            if len(kinds) > 1:
+                dtypes[col] = np.dtype(object)
+            elif col in self._numeric:
+                dtypes[col] = self._numeric_dtype(self._numeric[col], seen)
+            elif col in self._text:
+                dtypes[col] = self._text_dtype(col, seen, category_max_ratio)
+            elif len(set(seen)) == 1:
+                dtypes[col] = seen[0]
+            else:
+                dtypes[col] = np.dtype(object)
+        return dtypes
+    
+    def changed(self, dtypes):
+        """Number of columns given another dtype than their first chunk had"""
+        return sum(1 for col, dtype in dtypes.items() if self._dtypes[col][0] != dtype)
+    
+    def _numeric_dtype(self, summary, seen):
+        common = np.result_type(*[dtype.numpy_dtype if hasattr(dtype, 'numpy_dtype') else dtype for dtype in seen])
+        if summary['count'] == 0:
+            return common
+        extremes = pd.Series([summary['min'], summary['max']])
+        if summary['integer']:
+            return pd.to_numeric(extremes.astype(common), downcast='integer').dtype
+        if summary['whole']:
+            if summary['missing'] == 0:
+                return pd.to_numeric(extremes.astype('int64'), downcast='integer').dtype
+            return pd.to_numeric(extremes.astype('Int64'), downcast='integer').dtype
+        if summary['float32']:
+            return np.dtype('float32')
+        return np.dtype('float64') if common.kind != 'f' else common
+    
+    def _text_dtype(self, col, seen, category_max_ratio):
+        counter = self._text[col]
+        counts = counter.counts()
+        if self.rows > 0 and counter.exact and len(counts) <= category_max_ratio * self.rows:
+            categories = counts.index.tolist()
+            try:
+                categories = sorted(categories)
+            except TypeError:
+                pass
+            return pd.CategoricalDtype(categories)
+        if pa is not None and self._strings.get(col) and all(dtype == object for dtype in seen):
+            return pd.StringDtype('pyarrow')
+        return seen[0] if len(set(seen)) == 1 else np.dtype(object)
+
+
+class ChunkedProfile:
+    """build_profile for a frame that arrives in chunks, in bounded memory
+    
+    Counts, extremes and moments are merged exactly (moments as power sums
+    about the first chunk's mean); distinct counts and top values come
+    from _ValueCounter, so they are exact unless a column has more
+    distinct values than it keeps, and quartiles from the column sketches.
+    Every chunk must have the same columns and dtypes.
+    """
+    
+    def __init__(self, top_values=10):
+        self.top_values = top_values
+        self.rows = 0
+        self.memory_usage = 0
+        self._columns = None
+        self._categories_memory = 0
+    
+    def add(self, chunk):
+        if self._columns is None:
+            self._columns = {col: self._new_column(chunk[col]) for col in chunk.columns}
+            # The categories' values, without the lookup table astype builds on them
+            self._categories_memory = sum(
+                int(chunk[col].cat.categories.to_series().memory_usage(deep=True, index=False))
+                for col in chunk.columns if isinstance(chunk[col].dtype, pd.CategoricalDtype)
+            )
+        self.rows += len(chunk)
+        
+        for col, column in self._columns.items():
+            values = chunk[col]
+            column['nulls'] += int(values.isnull().sum())
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Categories are shared by every chunk; count them once
+                self.memory_usage += int(values.cat.codes.memory_usage(index=False))
+            else:
+                self.memory_usage += int(values.memory_usage(deep=True, index=False))
+            
+            if column['kind'] == 'numeric':
+                array = values.to_numpy(dtype='float64', na_value=np.nan)
+                array = array[~np.isnan(array)]
+                if len(array) > 0:
+                    if column['shift'] is None:
+                        column['shift'] = array.mean()
+                    deviations = array - column['shift']
+                    squared = deviations ** 2
+                    column['sums'] += [
+                        deviations.sum(), squared.sum(), (squared * deviations).sum(), (squared ** 2).sum()
+                    ]
+                    column['min'] = min(column['min'], array.min())
+                    column['max'] = max(column['max'], array.max())
+            elif column['kind'] == 'datetime':
+                if values.notnull().any():
+                    low, high = values.min(), values.max()
+                    column['min'] = low if column['min'] is None else min(column['min'], low)
+                    column['max'] = high if column['max'] is None else max(column['max'], high)
+            column['counter'].add(values)
+    
+    def _new_column(self, values):
+        column = {'dtype': str(values.dtype), 'nulls': 0, 'counter': _ValueCounter()}
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            column.update(kind='numeric', shift=None, sums=np.zeros(4), min=np.inf, max=-np.inf)
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            column.update(kind='datetime', min=None, max=None)
+        else:
+            is_text = values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype))
+            column['kind'] = 'categorical' if is_text else 'other'
+        return column
+    
+    def result(self, hashes, sketches=None):
+        """The profile of every row added, as build_profile returns it"""
+        columns = {}
+        for col, column in (self._columns or {}).items():
+            profile = {
+                'dtype': column['dtype'],
+                'count': self.rows - column['nulls'],
+                'nulls': column['nulls']
+            }
+            counter = column['counter']
+            if column['kind'] == 'numeric':
+                profile['kind'] = 'numeric'
+                profile.update(self._numeric_result(column, counter, (sketches or {}).get(col)))
+            elif column['kind'] == 'datetime':
+                profile['kind'] = 'datetime'
+                profile['distinct'] = counter.distinct()
+                profile['min'] = str(column['min']) if column['min'] is not None else None
+                profile['max'] = str(column['max']) if column['max'] is not None else None
+            else:
+                profile['kind'] = column['kind']
+                counts = counter.counts().sort_values(ascending=False, kind='stable')
+                profile['distinct'] = counter.distinct()
+                profile['top_values'] = [
+                    [_json_value(value), int(count)] for value, count in counts.head(self.top_values).items()
+                ]
+            columns[str(col)] = profile
+        
+        kinds = [column['kind'] for column in columns.values()]
+        return {
+            'row_count': self.rows,
+            'column_count': len(columns),
+            'numeric_columns': kinds.count('numeric'),
+            'categorical_columns': kinds.count('categorical'),
+            'datetime_columns': kinds.count('datetime'),
+            'missing_values': sum(column['nulls'] for column in columns.values()),
+            'duplicate_rows': int(pd.Series(hashes).duplicated().sum()) if hashes is not None else 0,
+            'memory_usage': self.memory_usage + self._categories_memory + int(pd.RangeIndex(self.rows).memory_usage()),
+            'columns': columns
+        }
+    
+    def _numeric_result(self, column, counter, sketch):
+        count = self.rows - column['nulls']
+        result = {'distinct': counter.distinct()}
+        if count == 0:
+            return {**result, **{key: None for key in _DESCRIBE_KEYS[1:]}, 'skewness': None, 'kurtosis': None}
+        
+        # Central moments from the power sums about the shift
+        m1, m2, m3, m4 = column['sums'] / count
+        mu2 = max(m2 - m1 ** 2, 0.0)
+        mu3 = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        mu4 = m4 - 4 * m1 * m3 + 6 * m1 ** 2 * m2 - 3 * m1 ** 4
+        if sketch is not None:
+            if isinstance(sketch, dict):
+                sketch = QuantileSketch.from_dict(sketch)
+            quartiles = sketch.quantile([0.25, 0.5, 0.75])
+        else:
+            quartiles = [None] * 3
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            skewness = mu3 / mu2 ** 1.5
+            kurtosis = mu4 / mu2 ** 2 - 3
+        result.update({
+            'mean': float(column['shift'] + m1),
+            'std': float(np.sqrt(mu2 * count / (count - 1))) if count > 1 else None,
+            'min': float(column['min']),
+            '25%': _float_or_none(quartiles[0]),
+            '50%': _float_or_none(quartiles[1]),
+            '75%': _float_or_none(quartiles[2]),
+            'max': float(column['max']),
+            'skewness': float(skewness) if mu2 > 0 else None,
+            'kurtosis': float(kurtosis) if mu2 > 0 else None
+        })
+        return result
+
+
+def _deduplicated(chunks, keep):
+    """(positions, rows) of each chunk that `keep` marks, positions counted across chunks"""
+    start = 0
+    for chunk in chunks:
+        end = start + len(chunk)
+        mask = keep[start:end]
+        yield np.arange(start, end)[mask], chunk[mask]
+        start = end
+
+
+def _dtype_kind(dtype):
+    """Coarse kind of a dtype, for columns whose chunks were read with different ones"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'numeric'
+    return 'text'
+
+
+def _float_or_none(value):
+    return float(value) if value is not None else None
+
+
+def _column_stage_worker(settings, name, params, path, object_columns):
+    """Process-pool entry point for run_stage_by_columns"""
+    processor = DataProcessor(settings)
+    processor._defer_summaries = True
+    output = getattr(processor, name)(read_arrow_file(path, object_columns), **params)
+    sketches = {col: sketch.to_dict() for col, sketch in (processor.sketches or {}).items()}
+    return (
+        *write_arrow_file(output), processor.processing_log,
+        processor._cells_touched, processor._stage_totals, sketches
+    )
+
+
+def _numeric_profile(values, sketch=None):
+    """Moments, extremes, quartiles and distinct count of a numeric column"""
+    array = values.to_numpy(dtype='float64', na_value=np.nan)
+    array = array[~np.isnan(array)]
+    profile = {'distinct': int(values.nunique())}
+    if len(array) == 0:
+        return {**profile, **{key: None for key in _DESCRIBE_KEYS[1:]},
+                'skewness': None, 'kurtosis': None}
+    
+    mean = array.mean()
+    deviations = array - mean
+    squared = deviations ** 2
+    m2 = squared.mean()
+    m3 = (squared * deviations).mean()
+    m4 = (squared ** 2).mean()
+    
+    if sketch is not None:
+        if isinstance(sketch, dict):
+            sketch = QuantileSketch.from_dict(sketch)
+        quartiles = sketch.quantile([0.25, 0.5, 0.75])
+    else:
+        quartiles = np.quantile(array, [0.25, 0.5, 0.75])
+    
+    # Skewness and excess kurtosis as scipy.stats computes them (biased)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skewness = m3 / m2 ** 1.5
+        kurtosis = m4 / m2 ** 2 - 3
+    
+    profile.update({
+        'mean': float(mean),
+        'std': float(np.sqrt(squared.sum() / (len(array) - 1))) if len(array) > 1 else None,
+        'min': float(array.min()),
+        '25%': float(quartiles[0]),
+        '50%': float(quartiles[1]),
+        '75%': float(quartiles[2]),
+        'max': float(array.max()),
+        'skewness': float(skewness) if m2 > 0 else None,
+        'kurtosis': float(kurtosis) if m2 > 0 else None
+    })
+    return profile
+
+
+def _json_value(value):
+    """Plain Python form of a value for a JSON profile"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _to_numeric(values):
+    """pd.to_numeric(errors='coerce') that parses each distinct value once
+    
+    Health tables repeat a small set of codes and categories, so parsing
+    the uniques and mapping them back through the factorize codes is much
+    cheaper than parsing every row.
+    """
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == len(values):
+        return pd.to_numeric(values, errors='coerce')
+    
+    parsed = pd.to_numeric(pd.Series(uniques, dtype='object'), errors='coerce').to_numpy()
+    if (codes < 0).any():
+        # Missing values have code -1, which picks the trailing NaN
+        parsed = np.append(parsed.astype('float64'), np.nan)
+    return pd.Series(parsed[codes], index=values.index, name=values.name)
+
+
+def _sorted_quantiles(ordered, qs):
+    """Per-column quantiles of a column-sorted float matrix, NaN last
+
+    Linear interpolation over each column's non-missing values, computed
+    as numpy's quantile does so the results match DataFrame.quantile.
+    """
+    counts = (~np.isnan(ordered)).sum(axis=0)
+    columns = np.arange(ordered.shape[1])
+    last = np.maximum(counts - 1, 0)
+    results = []
+    for q in qs:
+        position = q * (counts - 1)
+        below = np.floor(position).astype('int64').clip(0)
+        above = np.minimum(below + 1, last)
+        t = position - below
+        a, b = ordered[below, columns], ordered[above, columns]
+        diff = b - a
+        value = np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+        results.append(np.where(counts > 0, value, np.nan))
+    return results
+
+
+def _frame_bytes(df):
+    """Memory used by a DataFrame, including string contents"""
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def _compact_numeric(values):
+    """Smallest exact numeric dtype for a column, or None to keep it"""
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast='integer')
+    
+    array = values.to_numpy(dtype='float64', na_value=np.nan)
+    finite = array[~np.isnan(array)]
+    if len(finite) == 0:
+        return None
+    
+    if np.all(np.isfinite(finite)) and np.array_equal(finite, np.round(finite)) \
+            and np.abs(finite).max() < 2 ** 53:
+        if len(finite) == len(array):
+            return pd.to_numeric(values.astype('int64'), downcast='integer')
+        # Whole numbers with gaps: a nullable integer type keeps the gaps as <NA>
+        return pd.to_numeric(values.astype('Int64'), downcast='integer')
+    
+    as_float32 = array.astype('float32')
+    if np.array_equal(as_float32.astype('float64'), array, equal_nan=True):
+        return values.astype('float32')
+    return None
+
+
+def _compact_text(values, category_max_ratio):
+    """Category for repetitive text, Arrow strings for the rest, or None"""
+    if len(values) == 0:
+        return None
+    if values.nunique(dropna=True) <= category_max_ratio * len(values):
+        return values.astype('category')
+    if pa is not None and values.dtype == object \
+            and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+        return values.astype('string[pyarrow]')
+    return None
+
+
+def _sampling_margin(share, sample_size, z=3.29):
+    """Half-width of a 99.9% confidence interval for a share estimated from a sample"""
+    variance = max(share * (1 - share), 1 / sample_size)
+    return z * np.sqrt(variance / sample_size)
+
+
+def _mode_from_counts(counts):
+    """Most frequent value, smallest first on ties (as Series.mode)"""
+    top = counts[counts == counts.max()].index.tolist()
+    try:
+        return sorted(top)[0]
+    except TypeError:
+        return top[0]
@@ -1,21 +1,43 @@
 import sqlite3
 import pandas as pd
-import hashlib
+import numpy as np
 from pathlib import Path
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import io
+import time
+
+from config import DATABASE_CONFIG, PERFORMANCE_CONFIG
+from utils.connection_pool import get_pool
+from utils.query_cache import get_query_cache, normalize_sql
+from utils.query_log import get_query_log
+from utils.sketch import QuantileSketch, column_sketches, sketches_to_dict
+
+class QueryTimeout(sqlite3.OperationalError):
+    """A query was interrupted for running past its timeout"""
+
+
+class QueryCancelled(sqlite3.OperationalError):
+    """A query was interrupted because its caller cancelled it"""
+
+
+class SchemaMismatch(ValueError):
+    """An upload's columns differ from those of the table it would be upserted into"""
+
 
 class DatabaseManager:
     """Enhanced database manager with advanced features"""
 
     def __init__(self, db_path="healthgenai.db"):
         self.db_path = db_path
+        self.pool = get_pool(db_path)
+        self.query_log = get_query_log(db_path)
+        self.query_cache = get_query_cache(db_path)
         self.init_database()
 
     def init_database(self):
         """Initialize database with required tables"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.writer() as conn:
             # Create metadata table
             conn.execute("""
             CREATE TABLE IF NOT EXISTS table_metadata (
@@ -42,94 +64,948 @@ class DatabaseManager:
             )
             """)
 
+            # Create dataset source table (which upload each table came from)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS dataset_sources (
+                table_name TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                stored_at TEXT
+            )
+            """)
+
+            # Create index advisor log (indexes created, rejected or dropped)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS index_recommendations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT,
+                column_name TEXT,
+                index_name TEXT,
+                uses TEXT,
+                before_ms REAL,
+                after_ms REAL,
+                action TEXT,
+                created_at TEXT
+            )
+            """)
+
+            # Create ingestion job table (background upload processing)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_name TEXT,
+                table_name TEXT,
+                fingerprint TEXT,
+                state TEXT,
+                rows_processed INTEGER DEFAULT 0,
+                total_rows INTEGER,
+                created_at TEXT,
+                finished_at TEXT,
+                elapsed REAL DEFAULT 0,
+                error_message TEXT,
+                sample_rows INTEGER
+            )
+            """)
+            self._add_missing_columns(conn, 'ingestion_jobs', {'sample_rows': 'INTEGER'})
+
+            # Create row hash index (one 64-bit hash per row, in rowid order;
+            # source_hashes hash the raw rows the stored rows were cleaned from;
+            # rowids are the rows' rowids, NULL when they are 1..row_count)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS row_hash_index (
+                table_name TEXT PRIMARY KEY,
+                row_count INTEGER,
+                hashes BLOB,
+                source_hashes BLOB,
+                rowids BLOB
+            )
+            """)
+            self._add_missing_columns(conn, 'row_hash_index', {'source_hashes': 'BLOB', 'rowids': 'BLOB'})
+
+            # Create quantile sketches of numeric columns (JSON, see utils.sketch)
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS column_sketches (
+                table_name TEXT,
+                column_name TEXT,
+                sketch TEXT,
+                PRIMARY KEY (table_name, column_name)
+            )
+            """)
+
+            # Create dataset profiles, keyed by the table fingerprint they describe
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS dataset_profiles (
+                fingerprint TEXT PRIMARY KEY,
+                table_name TEXT,
+                profile TEXT,
+                created_at TEXT
+            )
+            """)
+
             conn.commit()
 
-    def store_dataframe(self, df, table_name, original_filename=None):
-        """Store DataFrame with metadata"""
+    def _add_missing_columns(self, conn, table_name, columns):
+        """Add columns introduced after a table was first created"""
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+        for name, definition in columns.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE "{table_name}" ADD COLUMN {name} {definition}')
+
+    def store_dataframe(self, df, table_name, original_filename=None, hashes=None, sketches=None,
+                        source_hashes=None):
+        """Store DataFrame with metadata
+
+        `hashes` are the frame's row hashes if already computed; they are
+        stored as the table's row hash index. `sketches` likewise are the
+        quantile sketches of its numeric columns, in to_dict form; without
+        them get_sketches builds them when first asked. `source_hashes` are
+        the hashes of the raw rows each row was cleaned from, which upserts
+        compare to find changed rows.
+        Returns load statistics (see _bulk_load), or False on failure. A
+        table that already holds exactly these rows is left as it is.
+        """
         start_time = datetime.now()
 
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                # Store the dataframe
-                df.to_sql(table_name, conn, if_exists="replace", index=False)
+            # Calculate file hash for integrity
+            if hashes is None or len(hashes) != len(df):
+                hashes = row_hashes(df)
+            file_hash = format_fingerprint(combine_row_hashes(hashes))
+            schema = {col: str(dtype) for col, dtype in df.dtypes.items()}
 
-                # Calculate file hash for integrity
-                file_hash = hashlib.md5(df.to_string().encode()).hexdigest()
+            with self.pool.writer() as conn:
+                if self._holds_rows(conn, table_name, file_hash, schema, hashes):
+                    return _load_stats(len(df), start_time, skipped=True)
 
-                # Store metadata
-                metadata = {
-                    'table_name': table_name,
-                    'original_filename': original_filename or table_name,
-                    'upload_timestamp': start_time.isoformat(),
-                    'row_count': len(df),
-                    'column_count': len(df.columns),
-                    'file_hash': file_hash,
-                    'schema_info': json.dumps({
-                        col: str(dtype) for col, dtype in df.dtypes.items()
-                    })
-                }
+                # Store the dataframe. The write lock is taken up front: a read
+                # transaction that another process writes under cannot be
+                # upgraded, and fails at once instead of waiting
+                conn.execute("BEGIN IMMEDIATE")
+                self._bulk_load(conn, table_name, [df])
 
-                conn.execute("""
-                INSERT OR REPLACE INTO table_metadata
-                VALUES (:table_name, :original_filename, :upload_timestamp,
-                        :row_count, :column_count, :file_hash, :schema_info)
-                """, metadata)
+                self._write_row_hashes(conn, table_name, hashes, source_hashes)
+                self._write_sketches(conn, table_name, sketches or {})
+
+                self._write_metadata(
+                    conn, table_name, original_filename, start_time,
+                    len(df), df.columns, file_hash, schema
+                )
 
                 conn.commit()
+            self.query_cache.invalidate(table_name)
 
-            return True
+            return _load_stats(len(df), start_time)
 
         except Exception as e:
             self.log_error(f"store_dataframe", str(e))
             return False
 
-    def execute_query(self, query, params=None):
-        """Execute query with logging and error handling"""
+    def is_stored(self, df, table_name, hashes=None):
+        """Whether a table already holds exactly the rows and schema of `df`
+
+        With `hashes`, `df` may be an empty frame with the columns and
+        dtypes of the rows they describe.
+        """
+        try:
+            if hashes is None or (len(df) > 0 and len(hashes) != len(df)):
+                hashes = row_hashes(df)
+            file_hash = format_fingerprint(combine_row_hashes(hashes))
+            schema = {col: str(dtype) for col, dtype in df.dtypes.items()}
+            with self.pool.reader() as conn:
+                return self._holds_rows(conn, table_name, file_hash, schema, hashes)
+        except Exception as e:
+            return False
+
+    def _holds_rows(self, conn, table_name, file_hash, schema, hashes):
+        """Compare a table's stored fingerprint, schema and row hashes
+
+        The fingerprint is checked first as it is a single lookup; the
+        ordered schema and row hash index then rule out reordered rows
+        or columns and changed dtypes, which the fingerprint ignores.
+        """
+        row = conn.execute("""
+        SELECT m.file_hash, m.schema_info FROM table_metadata m
+        JOIN sqlite_master t ON t.type = 'table' AND t.name = m.table_name
+        WHERE m.table_name = ?
+        """, (table_name,)).fetchone()
+        if row is None or row[0] != file_hash or not row[1]:
+            return False
+        stored_schema = list(json.loads(row[1]).items())
+        if stored_schema != [(str(col), dtype) for col, dtype in schema.items()]:
+            return False
+        stored_hashes = self._load_row_hashes(conn, table_name)
+        return stored_hashes is not None and np.array_equal(stored_hashes, hashes)
+
+    def store_dataframe_chunks(self, chunks, table_name, original_filename=None, progress=None,
+                               hashes=None, sketches=None, source_hashes=None):
+        """Store an iterable of DataFrame chunks as one table in a single transaction
+
+        `progress`, if given, is called with the number of rows written so far.
+        `hashes`, if given, are the row hashes of all chunks in order;
+        otherwise they are computed chunk by chunk. `sketches` and
+        `source_hashes` are as for store_dataframe.
+        Returns load statistics (see _bulk_load), or False on failure.
+        """
         start_time = datetime.now()
+        chunk_hashes = []
+
+        def summarised(chunks):
+            for chunk in chunks:
+                if hashes is None:
+                    chunk_hashes.append(row_hashes(chunk))
+                yield chunk
+
+        with self.pool.writer() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row_count, columns, dtypes = self._bulk_load(
+                    conn, table_name, summarised(chunks), progress
+                )
+
+                if hashes is None or len(hashes) != row_count:
+                    hashes = np.concatenate(chunk_hashes) if chunk_hashes else None
+                if hashes is None or len(hashes) != row_count:
+                    raise ValueError("Row hashes do not match the stored rows")
+                self._write_row_hashes(conn, table_name, hashes, source_hashes)
+                self._write_sketches(conn, table_name, sketches or {})
+
+                self._write_metadata(
+                    conn, table_name, original_filename, start_time,
+                    row_count, columns, format_fingerprint(combine_row_hashes(hashes)),
+                    {col: _merge_dtype_names(names) for col, names in dtypes.items()}
+                )
+
+                conn.commit()
+                self.query_cache.invalidate(table_name)
+                return _load_stats(row_count, start_time)
+
+            except Exception as e:
+                conn.rollback()
+                self.log_error(f"store_dataframe_chunks", str(e))
+                return False
 
+    def _bulk_load(self, conn, table_name, chunks, progress=None):
+        """Replace a table with the rows of `chunks`, inside the caller's transaction
+
+        The table is created with explicit affinities for each column's
+        dtype (the dtypes recorded as schema_info) and filled with
+        executemany in batches of bulk_batch_rows. Indexes the old table had
+        are dropped with it and rebuilt once the rows are in, which is
+        cheaper than maintaining them row by row; ANALYZE then refreshes
+        the planner statistics. Returns (row_count, columns, dtype names
+        seen per column).
+        """
+        indexes = [sql for (sql,) in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table_name,)
+        )]
+        conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+
+        batch_rows = DATABASE_CONFIG['bulk_batch_rows']
+        insert_sql = None
+        columns = None
+        dtypes = {}
+        row_count = 0
+
+        for chunk in chunks:
+            if insert_sql is None:
+                columns = chunk.columns
+                definitions = ", ".join(f'"{col}" {_sqlite_type(chunk[col])}' for col in columns)
+                conn.execute(f'CREATE TABLE "{table_name}" ({definitions})')
+                placeholders = ", ".join("?" for _ in columns)
+                insert_sql = f'INSERT INTO "{table_name}" VALUES ({placeholders})'
+
+            for start in range(0, len(chunk), batch_rows):
+                batch = chunk.iloc[start:start + batch_rows]
+                conn.executemany(insert_sql, _iter_sql_rows(batch))
+                row_count += len(batch)
+                if progress:
+                    progress(row_count)
+            for col, dtype in chunk.dtypes.items():
+                dtypes.setdefault(col, set()).add(str(dtype))
+
+        if insert_sql is None:
+            raise ValueError("No data to store")
+
+        for sql in indexes:
+            try:
+                conn.execute(sql)
+            except sqlite3.Error as e:
+                # e.g. the column is gone or a unique key now has duplicates
+                self.log_error(f"_bulk_load", f"Index not rebuilt on {table_name}: {e}")
+        conn.execute(f'ANALYZE "{table_name}"')
+
+        return row_count, columns, dtypes
+
+    def upsert_dataframe(self, df, table_name, key_columns, original_filename=None, source_hashes=None):
+        """Insert new rows and update changed rows of an existing table
+
+        Rows are matched on `key_columns`. When `source_hashes` (hashes of
+        the raw rows `df` was cleaned from) are given, a stored row counts
+        as changed only if its raw row did; cleaning settles imputed and
+        capped values on the whole upload, so comparing cleaned values would
+        report rows whose source never changed. Rows stored without a
+        source hash are compared on their cleaned values through the row
+        hash index. Stored rows are never read back in full: the hash
+        indexes, row count and fingerprint are updated from the written
+        rows, and column sketches swap the replaced values for the new ones.
+        Returns counts of inserted, updated and unchanged rows. Raises
+        SchemaMismatch if the columns differ from the table's.
+        """
+        start_time = datetime.now()
+        with self.pool.writer() as conn:
+            table_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+            if sorted(table_columns) != sorted(df.columns):
+                raise SchemaMismatch(f"Columns of the upload do not match table {table_name}")
+
+            try:
+                # Canonical column order and one row per key (last one wins)
+                latest = ~df.duplicated(subset=key_columns, keep='last').to_numpy()
+                df = df.loc[latest, table_columns].reset_index(drop=True)
+                if source_hashes is not None:
+                    source_hashes = np.asarray(source_hashes, dtype='uint64')[latest]
+                new_hashes = row_hashes(df)
+
+                conn.execute("BEGIN IMMEDIATE")
+                rowids, index, source_index, in_step = self._row_hash_index(conn, table_name)
+                quoted_keys = ", ".join(f'"{col}"' for col in key_columns)
+                conn.execute(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS "ux_{table_name}_key" '
+                    f'ON "{table_name}" ({quoted_keys})'
+                )
+
+                # Look up the stored row of every incoming key
+                conn.execute("DROP TABLE IF EXISTS temp._upsert_keys")
+                conn.execute(f"CREATE TEMP TABLE _upsert_keys (_pos INTEGER, {quoted_keys})")
+                conn.executemany(
+                    f"INSERT INTO _upsert_keys VALUES (?, {', '.join('?' for _ in key_columns)})",
+                    ((pos, *keys) for pos, keys in enumerate(_iter_sql_rows(df[key_columns])))
+                )
+                join = " AND ".join(f't."{col}" = k."{col}"' for col in key_columns)
+                match_sql = f'SELECT k._pos, t.rowid FROM _upsert_keys k JOIN "{table_name}" t ON {join}'
+                existing = np.array(conn.execute(match_sql).fetchall(), dtype='int64').reshape(-1, 2)
+                existing_pos, existing_rowid = existing[:, 0], existing[:, 1]
+
+                slots = np.searchsorted(rowids, existing_rowid)
+                changed = index[slots] != new_hashes[existing_pos]
+                if source_hashes is not None:
+                    # Zero marks rows stored without a source hash
+                    old_sources = source_index[slots]
+                    known = old_sources != 0
+                    changed[known] = old_sources[known] != source_hashes[existing_pos[known]]
+                is_new = np.ones(len(df), dtype=bool)
+                is_new[existing_pos] = False
+                write_mask = is_new.copy()
+                write_mask[existing_pos[changed]] = True
+
+                # Sketches miss whatever changed the table behind the index's back
+                sketches = self._load_sketches(conn, table_name) if in_step else {}
+                numeric = set(df.select_dtypes(include=['number']).columns)
+                if sketches and set(sketches) == numeric and write_mask.any():
+                    # Take the replaced values out before they are overwritten
+                    replaced = self._read_rowids(conn, table_name, existing_rowid[changed], list(sketches))
+                    for col, sketch in sketches.items():
+                        sketch.remove(pd.to_numeric(replaced[col], errors='coerce'))
+                        sketch.add(df.loc[write_mask, col])
+                    self._write_sketches(conn, table_name, sketches)
+                elif write_mask.any() or not in_step:
+                    # Rebuilt from the table by get_sketches when next needed
+                    conn.execute("DELETE FROM column_sketches WHERE table_name = ?", (table_name,))
+
+                # Write only new and changed rows
+                columns_sql = ", ".join(f'"{col}"' for col in table_columns)
+                placeholders = ", ".join("?" for _ in table_columns)
+                updates = ", ".join(
+                    f'"{col}" = excluded."{col}"' for col in table_columns if col not in key_columns
+                )
+                conflict_action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+                conn.executemany(
+                    f'INSERT INTO "{table_name}" ({columns_sql}) VALUES ({placeholders}) '
+                    f'ON CONFLICT ({quoted_keys}) {conflict_action}',
+                    _iter_sql_rows(df[write_mask])
+                )
+
+                # Place the hashes of written rows at their rowids
+                if write_mask.any():
+                    stored = np.array(conn.execute(match_sql).fetchall(), dtype='int64').reshape(-1, 2)
+                    added = np.setdiff1d(stored[:, 1], rowids)
+                    grow = np.zeros(len(added), dtype='uint64')
+                    rowids = np.concatenate([rowids, added])
+                    order = np.argsort(rowids, kind='stable')
+                    rowids = rowids[order]
+                    index = np.concatenate([index, grow])[order]
+                    source_index = np.concatenate([source_index, grow])[order]
+                    written = stored[write_mask[stored[:, 0]]]
+                    index[np.searchsorted(rowids, written[:, 1])] = new_hashes[written[:, 0]]
+                    if source_hashes is not None:
+                        source_index[np.searchsorted(rowids, stored[:, 1])] = source_hashes[stored[:, 0]]
+                    else:
+                        source_index[np.searchsorted(rowids, written[:, 1])] = 0
+                conn.execute("DROP TABLE temp._upsert_keys")
+
+                row_count = len(index)
+                if conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0] != row_count:
+                    raise ValueError(f"Row hash index of {table_name} does not match its rows")
+                self._write_row_hashes(
+                    conn, table_name, index, source_index if source_index.any() else None, rowids
+                )
+
+                self._write_metadata(
+                    conn, table_name, original_filename, start_time,
+                    row_count, table_columns, format_fingerprint(combine_row_hashes(index)),
+                    self._schema_info(conn, table_name) or
+                    {col: str(dtype) for col, dtype in df.dtypes.items()}
+                )
+                conn.commit()
+                self.query_cache.invalidate(table_name)
+
+                return {
+                    'inserted': int(is_new.sum()),
+                    'updated': int(changed.sum()),
+                    'unchanged': int(len(existing_pos) - changed.sum())
+                }
+
+            except Exception as e:
+                conn.rollback()
+                self.log_error(f"upsert_dataframe", str(e))
+                raise
+
+    def _read_rowids(self, conn, table_name, rowids, columns):
+        """Columns of the given rows of a table, inside the caller's transaction"""
+        conn.execute("DROP TABLE IF EXISTS temp._upsert_rowids")
+        conn.execute("CREATE TEMP TABLE _upsert_rowids (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO _upsert_rowids VALUES (?)", ((int(rowid),) for rowid in rowids))
+        columns_sql = ", ".join(f'"{col}"' for col in columns)
+        rows = pd.read_sql(
+            f'SELECT {columns_sql} FROM "{table_name}" WHERE rowid IN (SELECT id FROM temp._upsert_rowids)',
+            conn
+        )
+        conn.execute("DROP TABLE temp._upsert_rowids")
+        return rows
+
+    def get_row_hashes(self, table_name):
+        """Stored row hashes of a table in rowid order, or None"""
+        try:
+            with self.pool.reader() as conn:
+                return self._load_row_hashes(conn, table_name)
+        except Exception as e:
+            return None
+
+    def _load_row_hashes(self, conn, table_name):
+        row = conn.execute(
+            "SELECT row_count, hashes FROM row_hash_index WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        if row is None:
+            return None
+        hashes = np.frombuffer(row[1], dtype='uint64')
+        return hashes.copy() if len(hashes) == row[0] else None
+
+    def _row_hash_index(self, conn, table_name):
+        """Rowids of a table in order, the row and source hashes of each row, and
+        whether the stored index was in step with the table
+
+        The stored index is trusted while its row count and rowid range
+        match the table's. Otherwise rows were deleted or inserted outside
+        this class: entries of deleted rows are dropped and rows missing
+        from the index are hashed, without a source hash. Tables stored
+        before the index existed are hashed in full here.
+        """
+        count, low, high = conn.execute(
+            f'SELECT COUNT(*), MIN(rowid), MAX(rowid) FROM "{table_name}"'
+        ).fetchone()
+        row = conn.execute(
+            "SELECT row_count, hashes, source_hashes, rowids FROM row_hash_index WHERE table_name = ?",
+            (table_name,)
+        ).fetchone()
+
+        rowids = np.empty(0, dtype='int64')
+        hashes = np.empty(0, dtype='uint64')
+        sources = np.empty(0, dtype='uint64')
+        if row is not None and row[1] is not None and len(row[1]) == 8 * row[0]:
+            hashes = np.frombuffer(row[1], dtype='uint64').copy()
+            sources = np.zeros(row[0], dtype='uint64')
+            if row[2] is not None and len(row[2]) == 8 * row[0]:
+                sources = np.frombuffer(row[2], dtype='uint64').copy()
+            if row[3] is None:
+                rowids = np.arange(1, row[0] + 1, dtype='int64')
+            else:
+                rowids = np.frombuffer(row[3], dtype='int64').copy()
+            if len(rowids) != row[0]:
+                rowids, hashes, sources = rowids[:0], hashes[:0], sources[:0]
+            elif count == row[0] and (count == 0 or (rowids[0] == low and rowids[-1] == high)):
+                return rowids, hashes, sources, True
+
+        actual = np.fromiter(
+            (r[0] for r in conn.execute(f'SELECT rowid FROM "{table_name}" ORDER BY rowid')),
+            dtype='int64', count=count
+        )
+        kept = np.isin(rowids, actual)
+        rowids, hashes, sources = rowids[kept], hashes[kept], sources[kept]
+        missing = np.setdiff1d(actual, rowids)
+        if len(missing):
+            query = f'SELECT rowid AS _rowid, * FROM "{table_name}"'
+            if len(rowids):
+                conn.execute("DROP TABLE IF EXISTS temp._hash_rowids")
+                conn.execute("CREATE TEMP TABLE _hash_rowids (id INTEGER PRIMARY KEY)")
+                conn.executemany("INSERT INTO _hash_rowids VALUES (?)", ((int(r),) for r in missing))
+                query += " WHERE rowid IN (SELECT id FROM temp._hash_rowids)"
+            query += " ORDER BY rowid"
+            missing_hashes = np.concatenate([
+                row_hashes(chunk.drop(columns='_rowid'))
+                for chunk in pd.read_sql(query, conn, chunksize=100000)
+            ])
+            conn.execute("DROP TABLE IF EXISTS temp._hash_rowids")
+            rowids = np.concatenate([rowids, missing])
+            order = np.argsort(rowids, kind='stable')
+            rowids = rowids[order]
+            hashes = np.concatenate([hashes, missing_hashes])[order]
+            sources = np.concatenate([sources, np.zeros(len(missing), dtype='uint64')])[order]
+        return rowids, hashes, sources, False
+
+    def get_source_hashes(self, table_name):
+        """Stored raw-row hashes of a table in rowid order, or None"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                if params:
-                    cursor = conn.execute(query, params)
-                else:
-                    cursor = conn.execute(query)
+            with self.pool.reader() as conn:
+                return self._load_source_hashes(conn, table_name)
+        except Exception as e:
+            return None
 
-                # Get results
-                results = cursor.fetchall()
-                columns = [description[0] for description in cursor.description]
+    def _load_source_hashes(self, conn, table_name):
+        row = conn.execute(
+            "SELECT row_count, source_hashes FROM row_hash_index WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        if row is None or row[1] is None:
+            return None
+        hashes = np.frombuffer(row[1], dtype='uint64')
+        return hashes.copy() if len(hashes) == row[0] else None
 
-                # Create DataFrame
-                df = pd.DataFrame(results, columns=columns)
+    def _write_row_hashes(self, conn, table_name, hashes, source_hashes=None, rowids=None):
+        """Persist a table's row hashes inside the caller's transaction
 
-                # Log successful query
-                execution_time = (datetime.now() - start_time).total_seconds()
-                self.log_query(query, execution_time, True)
+        `source_hashes` are dropped unless they line up with `hashes`.
+        `rowids` are the rowids of the rows in order; None means 1..n, as
+        after a bulk load, and is what is stored for them.
+        """
+        hashes = np.ascontiguousarray(hashes, dtype='uint64')
+        if source_hashes is not None and len(source_hashes) == len(hashes):
+            source_hashes = np.ascontiguousarray(source_hashes, dtype='uint64').tobytes()
+        else:
+            source_hashes = None
+        if rowids is not None:
+            rowids = np.ascontiguousarray(rowids, dtype='int64')
+            if len(rowids) != len(hashes):
+                raise ValueError("Row hashes do not match the rowids")
+            rowids = None if np.array_equal(rowids, np.arange(1, len(rowids) + 1)) else rowids.tobytes()
+        conn.execute(
+            "INSERT OR REPLACE INTO row_hash_index (table_name, row_count, hashes, source_hashes, rowids) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (table_name, len(hashes), hashes.tobytes(), source_hashes, rowids)
+        )
 
-                return df
+    def get_sketches(self, table_name, build=True):
+        """Quantile sketches of a table's numeric columns, in to_dict form
 
+        Tables without stored sketches are scanned once and their sketches
+        saved, unless `build` is False. Returns {} if the table cannot be
+        read or has no sketches to return.
+        """
+        try:
+            with self.pool.writer() as conn:
+                sketches = self._load_sketches(conn, table_name)
+                if not sketches and build:
+                    sketches = {}
+                    query = f'SELECT * FROM "{table_name}"'
+                    for chunk in pd.read_sql(query, conn, chunksize=100000):
+                        column_sketches(chunk, sketches)
+                    self._write_sketches(conn, table_name, sketches)
+                    conn.commit()
+                return sketches_to_dict(sketches)
         except Exception as e:
+            self.log_error(f"get_sketches", str(e))
+            return {}
+
+    def _load_sketches(self, conn, table_name):
+        rows = conn.execute(
+            "SELECT column_name, sketch FROM column_sketches WHERE table_name = ?", (table_name,)
+        ).fetchall()
+        return {col: QuantileSketch.from_dict(json.loads(sketch)) for col, sketch in rows}
+
+    def _write_sketches(self, conn, table_name, sketches):
+        """Replace a table's column sketches inside the caller's transaction
+
+        Accepts QuantileSketch objects or their to_dict form.
+        """
+        conn.execute("DELETE FROM column_sketches WHERE table_name = ?", (table_name,))
+        conn.executemany(
+            "INSERT INTO column_sketches VALUES (?, ?, ?)",
+            (
+                (table_name, str(col), json.dumps(sketch if isinstance(sketch, dict) else sketch.to_dict()))
+                for col, sketch in sketches.items()
+            )
+        )
+
+    def store_profile(self, table_name, profile):
+        """Save a dataset profile (see DataProcessor.build_profile) for a table's current contents"""
+        try:
+            with self.pool.writer() as conn:
+                fingerprint = self._fingerprint(conn, table_name)
+                if fingerprint is None:
+                    return False
+                # Profiles of earlier contents are no longer reachable
+                conn.execute("DELETE FROM dataset_profiles WHERE table_name = ?", (table_name,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO dataset_profiles VALUES (?, ?, ?, ?)",
+                    (fingerprint, table_name, json.dumps(profile), datetime.now().isoformat())
+                )
+                conn.commit()
+            return True
+        except Exception as e:
+            self.log_error(f"store_profile", str(e))
+            return False
+
+    def get_profile(self, table_name):
+        """Stored profile of a table, or None if its contents changed since profiling"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute("""
+                SELECT p.profile FROM dataset_profiles p
+                JOIN table_metadata m ON m.file_hash = p.fingerprint
+                WHERE m.table_name = ?
+                """, (table_name,)).fetchone()
+                return json.loads(row[0]) if row else None
+        except Exception as e:
+            return None
+
+    def _fingerprint(self, conn, table_name):
+        row = conn.execute(
+            "SELECT file_hash FROM table_metadata WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _schema_info(self, conn, table_name):
+        """Stored schema_info for a table, or None"""
+        row = conn.execute(
+            "SELECT schema_info FROM table_metadata WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def table_exists(self, table_name):
+        """Check whether a table exists"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name = ?",
+                    (table_name,)
+                ).fetchone()
+                return row is not None
+        except Exception as e:
+            return False
+
+    def read_table(self, table_name):
+        """Read a whole table, restoring the dtypes recorded in schema_info
+
+        Columns whose values no longer fit their recorded dtype (say an
+        integer column an upsert added missing values to) keep the dtype
+        they were read with.
+        """
+        with self.pool.reader() as conn:
+            # Rowid order keeps rows aligned with the row hash index
+            df, _ = _read_cursor(conn.execute(f'SELECT * FROM "{table_name}" ORDER BY rowid'))
+            schema = self._schema_info(conn, table_name) or {}
+        return _restore_dtypes(df, schema)
+
+    def _write_metadata(self, conn, table_name, original_filename, start_time,
+                        row_count, columns, file_hash, schema):
+        """Insert or replace the table_metadata row for a stored table"""
+        metadata = {
+            'table_name': table_name,
+            'original_filename': original_filename or table_name,
+            'upload_timestamp': start_time.isoformat(),
+            'row_count': row_count,
+            'column_count': len(columns),
+            'file_hash': file_hash,
+            'schema_info': json.dumps(schema)
+        }
+
+        conn.execute("""
+        INSERT OR REPLACE INTO table_metadata
+        VALUES (:table_name, :original_filename, :upload_timestamp,
+                :row_count, :column_count, :file_hash, :schema_info)
+        """, metadata)
+
+    def record_source(self, table_name, fingerprint):
+        """Remember which processed dataset a table was loaded from"""
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("""
+                INSERT OR REPLACE INTO dataset_sources (table_name, fingerprint, stored_at)
+                VALUES (?, ?, ?)
+                """, (table_name, fingerprint, datetime.now().isoformat()))
+                conn.commit()
+        except Exception as e:
+            self.log_error(f"record_source", str(e))
+
+    def get_source(self, table_name):
+        """Get the dataset fingerprint a table was loaded from, if known"""
+        try:
+            with self.pool.reader() as conn:
+                row = conn.execute(
+                    "SELECT fingerprint FROM dataset_sources WHERE table_name = ?",
+                    (table_name,)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            return None
+
+    def create_ingestion_job(self, file_name, table_name, fingerprint):
+        """Register a background ingestion job and return its id"""
+        with self.pool.writer() as conn:
+            cursor = conn.execute("""
+            INSERT INTO ingestion_jobs (file_name, table_name, fingerprint, state, created_at)
+            VALUES (?, ?, ?, 'queued', ?)
+            """, (file_name, table_name, fingerprint, datetime.now().isoformat()))
+            conn.commit()
+            return cursor.lastrowid
+
+    def update_ingestion_job(self, job_id, timeout=5.0, **fields):
+        """Update state, progress or timing columns of an ingestion job"""
+        if not fields:
+            return True
+        assignments = ", ".join(f"{name} = :{name}" for name in fields)
+        try:
+            with self.pool.writer(timeout=timeout) as conn:
+                conn.execute(
+                    f"UPDATE ingestion_jobs SET {assignments} WHERE id = :job_id",
+                    {**fields, 'job_id': job_id}
+                )
+                conn.commit()
+            return True
+        except sqlite3.OperationalError:
+            return False  # Progress updates are best effort
+
+    def get_ingestion_jobs(self, job_ids):
+        """Get ingestion job rows as dicts, in the order of `job_ids`"""
+        if not job_ids:
+            return []
+        try:
+            with self.pool.reader() as conn:
+                # Row factory on the cursor: pooled connections are shared
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                placeholders = ", ".join("?" for _ in job_ids)
+                rows = cursor.execute(
+                    f"SELECT * FROM ingestion_jobs WHERE id IN ({placeholders})",
+                    list(job_ids)
+                ).fetchall()
+            jobs = {row['id']: dict(row) for row in rows}
+            return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+        except Exception as e:
+            return []
+
+    def execute_query(self, query, params=None, timeout=None, max_rows=None, cancel_event=None):
+        """Execute query with logging and error handling
+
+        Results of read-only queries over stored tables are served from the
+        query cache while those tables keep their fingerprints. The query is
+        interrupted once it runs past `timeout` seconds (QueryTimeout) or
+        `cancel_event` is set (QueryCancelled); both default to
+        PERFORMANCE_CONFIG, and 0 disables the limit. At most `max_rows`
+        rows are read; a cut-off result has df.attrs['truncated'] set.
+        """
+        max_rows = PERFORMANCE_CONFIG['query_max_rows'] if max_rows is None else max_rows
+        df, _ = self._run_query(query, params, timeout, cancel_event, max_rows)
+        return df
+
+    def preview_query(self, query, rows=None, params=None, timeout=None, cancel_event=None):
+        """First `rows` rows of a query's result and its total row count
+
+        Reading stops at `rows`; the total is then None and the frame is
+        marked truncated, and count_rows can count the rest on demand.
+        Timeouts and cancellation work as in execute_query; `rows`
+        defaults to query_max_rows.
+        """
+        rows = rows or PERFORMANCE_CONFIG['query_max_rows']
+        return self._run_query(query, params, timeout, cancel_event, rows)
+
+    def count_rows(self, query, params=None, timeout=None, cancel_event=None):
+        """Number of rows a query returns, counted with SELECT COUNT(*)
+
+        Timeouts and cancellation work as in execute_query.
+        """
+        df, _ = self._run_query(
+            f"SELECT COUNT(*) FROM ({normalize_sql(query)})", params, timeout, cancel_event, 0
+        )
+        return int(df.iloc[0, 0])
+
+    def iter_query(self, query, params=None, batch_rows=None, timeout=None, cancel_event=None):
+        """Yield a query's result as DataFrames of up to `batch_rows` rows
+
+        Each batch is typed column by column as it comes off the cursor, so
+        the whole result is never held at once. Timeouts and cancellation
+        work as in execute_query, and the reader connection is held until
+        the iterator is exhausted or closed. Results are not cached.
+        """
+        batch_rows = batch_rows or PERFORMANCE_CONFIG['query_batch_rows']
+        start_time = datetime.now()
+        should_interrupt, interrupted = _interrupter(timeout, cancel_event)
+
+        try:
+            with self.pool.reader() as conn:
+                conn.set_progress_handler(should_interrupt, 1000)
+                try:
+                    cursor = conn.execute(query, params or ())
+                    columns = [description[0] for description in cursor.description]
+                    while True:
+                        rows = cursor.fetchmany(batch_rows)
+                        if not rows:
+                            break
+                        yield _frame_from_columns(columns, [_typed_columns(rows, len(columns))])
+                finally:
+                    conn.set_progress_handler(None, 0)
+
+            execution_time = (datetime.now() - start_time).total_seconds()
+            self.log_query(query, execution_time, True)
+
+        except GeneratorExit:
+            # Closed early by the caller; what was read succeeded
+            execution_time = (datetime.now() - start_time).total_seconds()
+            self.log_query(query, execution_time, True)
+            raise
+
+        except Exception as e:
+            if interrupted:
+                e = interrupted[0]
+            execution_time = (datetime.now() - start_time).total_seconds()
+            self.log_query(query, execution_time, False, str(e))
+            raise e
+
+    def _run_query(self, query, params, timeout, cancel_event, limit):
+        """Run a query for execute_query and preview_query; returns (frame, total rows)
+
+        `limit` caps the rows kept (0 keeps all). The total is None when
+        rows past the limit were not read.
+        """
+        start_time = datetime.now()
+        should_interrupt, interrupted = _interrupter(timeout, cancel_event)
+
+        try:
+            with self.pool.reader() as conn:
+                # Checked every 1000 virtual machine instructions
+                conn.set_progress_handler(should_interrupt, 1000)
+                try:
+                    # One read transaction, so the cache key matches the data read
+                    conn.execute("BEGIN")
+                    cache_key = self.query_cache.make_key(conn, query, params)
+                    df = self.query_cache.get(cache_key) if cache_key is not None else None
+
+                    if df is not None:
+                        total = len(df)
+                    else:
+                        if params:
+                            cursor = conn.execute(query, params)
+                        else:
+                            cursor = conn.execute(query)
+
+                        df, total = _read_cursor(cursor, limit)
+                        if total == len(df) and cache_key is not None:
+                            self.query_cache.put(cache_key, df)
+                finally:
+                    conn.set_progress_handler(None, 0)
+
+            if limit and len(df) > limit:
+                df = df.iloc[:limit].copy()
+            if total is None or total > len(df):
+                df.attrs['truncated'] = True
+                if total is not None:
+                    df.attrs['total_rows'] = total
+
+            # Log successful query
+            execution_time = (datetime.now() - start_time).total_seconds()
+            self.log_query(query, execution_time, True)
+
+            return df, total
+
+        except Exception as e:
+            if interrupted:
+                e = interrupted[0]
             execution_time = (datetime.now() - start_time).total_seconds()
             self.log_query(query, execution_time, False, str(e))
             raise e
 
     def log_query(self, query, execution_time, success, error_message=None):
-        """Log query execution details"""
+        """Log query execution details
+
+        The row is queued for the background query log writer, so it lands
+        in query_history shortly after rather than before this returns.
+        """
+        self.query_log.log((query[:1000], execution_time, datetime.now().isoformat(),
+                            success, error_message))
+
+    def get_query_workload(self, limit):
+        """Distinct successful queries among the last `limit` logged, with their counts"""
+        try:
+            with self.pool.reader() as conn:
+                return conn.execute("""
+                SELECT query_text, COUNT(*) FROM (
+                    SELECT query_text FROM query_history
+                    WHERE success = 1 ORDER BY id DESC LIMIT ?
+                ) GROUP BY query_text
+                """, (limit,)).fetchall()
+        except Exception as e:
+            return []
+
+    def get_table_row_counts(self):
+        """Row counts of the stored tables that still exist, from table_metadata"""
+        try:
+            with self.pool.reader() as conn:
+                return dict(conn.execute("""
+                SELECT m.table_name, m.row_count FROM table_metadata m
+                JOIN sqlite_master t ON t.type = 'table' AND t.name = m.table_name
+                """).fetchall())
+        except Exception as e:
+            return {}
+
+    def record_index_change(self, decision):
+        """Log an index advisor decision (see IndexAdvisor)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 conn.execute("""
-                INSERT INTO query_history
-                (query_text, execution_time, timestamp, success, error_message)
-                VALUES (?, ?, ?, ?, ?)
-                """, (query[:1000], execution_time, datetime.now().isoformat(),
-                      success, error_message))
+                INSERT INTO index_recommendations
+                (table_name, column_name, index_name, uses, before_ms, after_ms, action, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (decision['table_name'], decision['column_name'], decision['index_name'],
+                      json.dumps(decision['uses']), decision['before_ms'], decision['after_ms'],
+                      decision['action'], datetime.now().isoformat()))
                 conn.commit()
-        except:
-            pass  # Don't fail if logging fails
+        except Exception as e:
+            self.log_error(f"record_index_change", str(e))
+
+    def get_index_recommendations(self, limit=50):
+        """Most recent index advisor decisions as a DataFrame"""
+        try:
+            with self.pool.reader() as conn:
+                return pd.read_sql(
+                    "SELECT * FROM index_recommendations ORDER BY id DESC LIMIT ?",
+                    conn, params=(limit,)
+                )
+        except Exception as e:
+            return pd.DataFrame()
+
+    def get_rejected_indexes(self, within_seconds):
+        """(table, column) pairs whose index was rejected in the last `within_seconds`"""
+        since = (datetime.now() - timedelta(seconds=within_seconds)).isoformat()
+        try:
+            with self.pool.reader() as conn:
+                return set(conn.execute("""
+                SELECT table_name, column_name FROM index_recommendations
+                WHERE action = 'rejected' AND created_at >= ?
+                """, (since,)).fetchall())
+        except Exception as e:
+            return set()
 
     def get_table_info(self, table_name):
         """Get comprehensive table information"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 # Get basic info
                 cursor = conn.execute(f"PRAGMA table_info({table_name})")
                 columns = cursor.fetchall()
@@ -158,22 +1034,25 @@ class DatabaseManager:
     def get_available_tables(self):
         """Get all available tables with their info"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.reader() as conn:
                 cursor = conn.execute("""
                 SELECT name FROM sqlite_master
                 WHERE type='table' AND name NOT LIKE 'sqlite_%'
-                AND name NOT IN ('table_metadata', 'query_history')
+                AND name NOT IN ('table_metadata', 'query_history', 'dataset_sources',
+                                 'ingestion_jobs', 'row_hash_index', 'column_sketches',
+                                 'dataset_profiles', 'index_recommendations')
                 """)
 
                 tables = cursor.fetchall()
 
-                table_info = []
-                for (table_name,) in tables:
-                    info = self.get_table_info(table_name)
-                    if info:
-                        table_info.append(info)
+            # Outside the block, so each lookup can take a reader of its own
+            table_info = []
+            for (table_name,) in tables:
+                info = self.get_table_info(table_name)
+                if info:
+                    table_info.append(info)
 
-                return table_info
+            return table_info
 
         except Exception as e:
             return []
@@ -181,7 +1060,7 @@ class DatabaseManager:
     def optimize_database(self):
         """Optimize database performance"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.pool.writer() as conn:
                 conn.execute("VACUUM")
                 conn.execute("ANALYZE")
                 conn.commit()
@@ -192,7 +1071,7 @@ class DatabaseManager:
     def export_table(self, table_name, format='csv'):
         """Export table in various formats"""
         try:
-            df = self.execute_query(f"SELECT * FROM {table_name}")
+            df = self.execute_query(f"SELECT * FROM {table_name}", max_rows=0)
 
             if format.lower() == 'csv':
                 return df.to_csv(index=False)
@@ -213,4 +1092,215 @@ class DatabaseManager:
             with open("healthgenai_errors.log", "a") as f:
                 f.write(f"{datetime.now().isoformat()} - {operation}: {error_message}\n")
         except:
-            pass
\ No newline at end of file
+            pass
+
+
+def _iter_sql_rows(df):
+    """Yield DataFrame rows as tuples of SQLite-compatible Python values
+
+    Columns are converted to Python lists one at a time. Plain numpy
+    numbers go straight through tolist(); SQLite stores NaN as NULL.
+    """
+    columns = []
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+            columns.append(values.to_numpy().tolist())
+        else:
+            columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return zip(*columns)
+
+
+def _interrupter(timeout, cancel_event):
+    """Progress handler that stops a query past its timeout or once cancelled
+
+    Returns the handler and a list that receives the QueryTimeout or
+    QueryCancelled to raise in place of SQLite's "interrupted" error.
+    """
+    timeout = PERFORMANCE_CONFIG['query_timeout'] if timeout is None else timeout
+    deadline = time.monotonic() + timeout if timeout else None
+    interrupted = []
+
+    def should_interrupt():
+        if cancel_event is not None and cancel_event.is_set():
+            interrupted.append(QueryCancelled("Query cancelled"))
+        elif deadline is not None and time.monotonic() > deadline:
+            interrupted.append(QueryTimeout(f"Query timed out after {timeout}s"))
+        return bool(interrupted)
+
+    return should_interrupt, interrupted
+
+
+def _read_cursor(cursor, limit=0):
+    """Frame of up to `limit` rows of a cursor (all if 0), and the row count
+
+    Rows are fetched in query_batch_rows batches and turned into typed
+    column arrays batch by batch, so the result is never held as one big
+    list of tuples. One row past the limit is read to detect a cut-off;
+    the rest are never stepped over and the count is then None.
+    """
+    columns = [description[0] for description in cursor.description]
+    batch_rows = PERFORMANCE_CONFIG['query_batch_rows']
+    batches = []
+    read = 0
+    while not limit or read <= limit:
+        rows = cursor.fetchmany(batch_rows if not limit else min(batch_rows, limit + 1 - read))
+        if not rows:
+            break
+        batches.append(_typed_columns(rows, len(columns)))
+        read += len(rows)
+
+    total = None if limit and read > limit else read
+    return _frame_from_columns(columns, batches), total
+
+
+def _typed_columns(rows, column_count):
+    """Column arrays of a batch of SQLite rows
+
+    Integer columns become int64 and numeric columns with NULLs float64
+    with NaN, as pd.DataFrame would infer; text and mixed columns stay
+    object arrays for the DataFrame constructor to type.
+    """
+    arrays = []
+    for values in zip(*rows):
+        types = set(map(type, values))
+        if types == {int}:
+            arrays.append(np.fromiter(values, dtype='int64', count=len(values)))
+        elif types <= {int, float, type(None)} and types & {int, float}:
+            arrays.append(np.array(values, dtype='float64'))
+        else:
+            arrays.append(np.array(values, dtype=object))
+    return arrays
+
+
+def _frame_from_columns(columns, batches):
+    """DataFrame from per-batch column arrays (see _typed_columns)"""
+    if not batches:
+        return pd.DataFrame(columns=columns)
+    arrays = []
+    for i in range(len(columns)):
+        parts = [batch[i] for batch in batches]
+        if any(part.dtype != object for part in parts):
+            # A batch of only NULLs is NaN in an otherwise numeric column
+            parts = [
+                np.full(len(part), np.nan) if part.dtype == object and all(v is None for v in part) else part
+                for part in parts
+            ]
+        arrays.append(parts[0] if len(parts) == 1 else np.concatenate(parts))
+    # Keyed by position, so duplicate column names survive
+    df = pd.DataFrame(dict(enumerate(arrays)))
+    df.columns = columns
+    return df
+
+
+def _restore_dtypes(df, schema):
+    """Give columns read from SQLite the dtypes recorded in schema_info
+
+    Nullable integer and float dtypes (Int64, Float32, ...) come back with
+    their missing values as <NA>. A column is left as read when its values
+    do not survive the conversion.
+    """
+    for col, dtype in schema.items():
+        if col not in df.columns or str(df[col].dtype) == dtype:
+            continue
+        try:
+            if dtype.startswith('datetime64'):
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+            elif dtype in ('category', 'string', 'str'):
+                df[col] = df[col].astype(dtype)
+            elif dtype.lower().startswith(('bool', 'int', 'uint', 'float')):
+                values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+                converted = df[col].astype(dtype)
+                if np.array_equal(converted.to_numpy(dtype='float64', na_value=np.nan), values, equal_nan=True):
+                    df[col] = converted
+        except (TypeError, ValueError, OverflowError):
+            continue
+    return df
+
+
+def _sqlite_type(values):
+    """SQLite column type for a Series, chosen for its affinity"""
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _load_stats(row_count, start_time, skipped=False):
+    """Row count, duration and throughput of a table load
+
+    `skipped` marks a load that was not needed because the table already
+    held the rows.
+    """
+    seconds = (datetime.now() - start_time).total_seconds()
+    return {
+        'rows': row_count,
+        'seconds': seconds,
+        'rows_per_second': row_count / seconds if seconds > 0 else float(row_count),
+        'skipped': skipped
+    }
+
+
+def _merge_dtype_names(names):
+    """Collapse the dtypes a column had across chunks into one name"""
+    if len(names) == 1:
+        return next(iter(names))
+    if names <= {'int64', 'float64'}:
+        return 'float64'
+    return 'object'
+
+
+FINGERPRINT_PREFIX = 'rh:'
+
+
+def row_hashes(df):
+    """64-bit hash of each row, computed over SQLite-canonical values
+
+    Values are normalised the way they round-trip through SQLite (numbers
+    as floats, dates as text, everything else as text), so rows read back
+    from a table hash the same as the frame they were stored from.
+    """
+    canonical = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+            canonical[col] = values.astype('float64')
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            canonical[col] = values.dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+        elif _holds_only_strings(values):
+            # Strings hash the same whatever their dtype (object, Arrow or category)
+            canonical[col] = values
+        else:
+            canonical[col] = values.astype(object).map(str, na_action='ignore')
+    frame = pd.DataFrame(canonical, index=df.index)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def _holds_only_strings(values):
+    """Whether a column's non-null values are all str"""
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return _holds_only_strings(pd.Series(dtype.categories))
+    if pd.api.types.is_string_dtype(dtype) and dtype != object:
+        return True
+    return dtype == object and pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty')
+
+
+def combine_row_hashes(hashes, start=0):
+    """Order-independent table fingerprint: the sum of row hashes modulo 2**64
+
+    Sums can be updated incrementally, adding the hashes of new rows and
+    subtracting those of replaced ones.
+    """
+    return (start + int(np.asarray(hashes, dtype='uint64').sum(dtype='uint64'))) % 2 ** 64
+
+
+def format_fingerprint(value):
+    """Text form of a row-hash fingerprint stored in table_metadata.file_hash"""
+    return f"{FINGERPRINT_PREFIX}{value:016x}"
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from config import PERFORMANCE_CONFIG
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional: the cache is disabled without pyarrow
+    pa = None
+
+_METADATA_KEY = b'medicoai'
+# Hash arrays of an entry, stored as extra uint64 columns next to the data
+_HASH_COLUMNS = {'row_hashes': '__medicoai_row_hashes', 'source_hashes': '__medicoai_source_hashes'}
+
+
+def dataset_key(fingerprint, settings_key, table_name):
+    """Cache key for a processed dataset: content fingerprint, cleaning settings and table
+
+    The table is part of the key because entries carry their file and
+    table names: the same content uploaded under another name is a
+    different table.
+    """
+    return hashlib.blake2b(
+        f"{fingerprint}:{settings_key}:{table_name}".encode(), digest_size=16
+    ).hexdigest()
+
+
+class DatasetCache:
+    """On-disk columnar cache of processed datasets
+
+    Datasets are written as uncompressed Arrow IPC files, which can be
+    memory-mapped on reload: numeric columns come back without copying or
+    parsing, so reopening a large processed table costs milliseconds. Row
+    hashes are stored as uint64 columns and mapped the same way; only the
+    small JSON part of the entry goes into the schema metadata.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = Path(cache_dir or PERFORMANCE_CONFIG['dataset_cache_dir'])
+        self.max_bytes = max_bytes or PERFORMANCE_CONFIG['dataset_cache_max_bytes']
+        self.enabled = pa is not None
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.arrow"
+
+    def load(self, key):
+        """Load a cached entry, or None if it is not cached"""
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        if not path.exists():
+            return None
+
+        try:
+            source = pa.memory_map(str(path), 'r')
+            reader = pa.ipc.open_file(source)
+            table = reader.read_all()
+            metadata = (table.schema.metadata or {}).get(_METADATA_KEY)
+            if metadata is None:
+                # Written chunk by chunk (see DatasetWriter)
+                _, metadata = reader.get_batch_with_custom_metadata(reader.num_record_batches - 1)
+                metadata = metadata[_METADATA_KEY]
+            entry = json.loads(metadata)
+            for name, column in _HASH_COLUMNS.items():
+                if column in table.column_names:
+                    hashes = table.column(column)
+                    entry[name] = hashes.chunk(0).to_numpy() if hashes.num_chunks == 1 else hashes.to_numpy()
+                    table = table.drop_columns([column])
+            entry['dataframe'] = table.to_pandas(split_blocks=True)
+            os.utime(path)  # Mark as recently used for eviction
+            return entry
+
+        except Exception:
+            # Unreadable files are treated as misses and rebuilt
+            path.unlink(missing_ok=True)
+            return None
+
+    def store(self, key, entry):
+        """Write a processed entry; failures leave the cache unchanged"""
+        if not self.enabled:
+            return False
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            table = _with_hashes(
+                pa.Table.from_pandas(entry['dataframe'], preserve_index=False),
+                entry.get('row_hashes'), entry.get('source_hashes')
+            )
+            schema_metadata = dict(table.schema.metadata or {})
+            schema_metadata[_METADATA_KEY] = _entry_metadata(entry)
+            table = table.replace_schema_metadata(schema_metadata)
+
+            # Write to a temporary file first so readers never see partial data
+            path = self._path(key)
+            tmp_path = _tmp_path(path)
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+
+            self.evict()
+            return True
+
+        except Exception:
+            return False
+
+    def writer(self, key):
+        """DatasetWriter for an entry whose frame arrives in chunks, or None if the cache is disabled"""
+        if not self.enabled:
+            return None
+        return DatasetWriter(self, key)
+
+    def evict(self):
+        """Remove least recently used files until the cache fits its size limit"""
+        files = sorted(self.cache_dir.glob('*.arrow'), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+
+        for path in files[:-1]:  # Never evict the newest file
+            if total <= self.max_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        """Remove every cached dataset"""
+        for path in self.cache_dir.glob('*.arrow'):
+            path.unlink(missing_ok=True)
+
+
+class DatasetWriter:
+    """Writes a cache entry chunk by chunk, for frames too large to assemble
+
+    The rest of the entry is only known once every chunk is written, so it
+    goes into the custom metadata of a final empty batch instead of the
+    schema. Nothing is visible under the key until close() succeeds; a
+    failed write abandons the entry rather than the caller's work.
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.path = cache._path(key)
+        self._tmp_path = _tmp_path(self.path)
+        self._sink = None
+        self._writer = None
+        self._schema = None
+        self._last_batch = None
+        self._done = False
+
+    def write(self, df, row_hashes=None, source_hashes=None):
+        """Append a chunk and, if given, its row and source hashes"""
+        if self._done:
+            return
+        try:
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._schema = table.schema
+            table = _with_hashes(table, row_hashes, source_hashes)
+            if self._writer is None:
+                self.cache.cache_dir.mkdir(parents=True, exist_ok=True)
+                self._sink = pa.OSFile(str(self._tmp_path), 'wb')
+                self._writer = pa.ipc.new_file(self._sink, table.schema)
+            self._writer.write_table(table)
+            batches = table.to_batches()
+            if batches:
+                self._last_batch = batches[-1]
+        except Exception:
+            self.abort()
+
+    def close(self, entry):
+        """Finish the file with the rest of `entry` and publish it; returns whether it was stored"""
+        if self._done or self._last_batch is None:
+            self.abort()
+            return False
+        try:
+            # An empty slice keeps the dictionaries of categorical columns unchanged
+            self._writer.write_batch(
+                self._last_batch.slice(0, 0), custom_metadata={_METADATA_KEY: _entry_metadata(entry)}
+            )
+            self._writer.close()
+            self._sink.close()
+            os.replace(self._tmp_path, self.path)
+            self._done = True
+            self.cache.evict()
+            return True
+        except Exception:
+            self.abort()
+            return False
+
+    def abort(self):
+        """Drop the partial file; does nothing once the entry is published"""
+        if self._done:
+            return
+        self._done = True
+        for closable in (self._writer, self._sink):
+            try:
+                if closable is not None:
+                    closable.close()
+            except Exception:
+                pass
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def _with_hashes(table, row_hashes, source_hashes):
+    """An Arrow table with an entry's hash arrays appended as uint64 columns"""
+    for column, hashes in zip(_HASH_COLUMNS.values(), (row_hashes, source_hashes)):
+        if hashes is not None and len(hashes) == table.num_rows:
+            table = table.append_column(column, pa.array(np.asarray(hashes, dtype='uint64')))
+    return table
+
+
+def _entry_metadata(entry):
+    """The JSON part of an entry: everything but its frame and hash arrays"""
+    metadata = {
+        k: v for k, v in entry.items()
+        if k not in ('dataframe', 'stored', 'cached', 'streamed') and k not in _HASH_COLUMNS
+    }
+    return json.dumps(metadata, default=_json_default)
+
+
+def _tmp_path(path):
+    """Private temporary name for a file being written, unique per process"""
+    return path.with_suffix(f'.{os.getpid()}.tmp')
+
+
+def _json_default(value):
+    """Serialise numpy scalars found in stats dicts"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
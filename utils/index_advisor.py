@@ -0,0 +1,280 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+
+from config import INDEX_ADVISOR_CONFIG
+
+AUTO_INDEX_PREFIX = 'ix_auto_'
+
+_IDENTIFIER = r'"(?:[^"]|"")*"|\[[^\]]*\]|`[^`]*`|[A-Za-z_]\w*'
+_COLUMN_REF = re.compile(rf'(?:({_IDENTIFIER})\s*\.\s*)?({_IDENTIFIER})')
+_TABLE_REF = re.compile(rf'\b(?:FROM|JOIN)\s+({_IDENTIFIER})(?:\s+(?:AS\s+)?({_IDENTIFIER}))?', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_CLAUSE = re.compile(
+    r'\b(WHERE|ON|USING|GROUP\s+BY|ORDER\s+BY|HAVING|SELECT|FROM|JOIN|LIMIT|UNION|EXCEPT|INTERSECT)\b',
+    re.IGNORECASE
+)
+# How columns named in a clause use an index; other clauses are ignored
+_USAGE = {'WHERE': 'filter', 'ON': 'join', 'USING': 'join', 'GROUP BY': 'group', 'ORDER BY': 'order'}
+_KEYWORDS = {
+    'WHERE', 'ON', 'USING', 'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'JOIN', 'INNER', 'LEFT', 'RIGHT',
+    'FULL', 'OUTER', 'CROSS', 'NATURAL', 'UNION', 'EXCEPT', 'INTERSECT', 'WINDOW'
+}
+
+
+def _unquote(name):
+    if name[0] in '"[`':
+        return name[1:-1].replace('""', '"')
+    return name
+
+
+def column_usage(conn, query):
+    """Columns a query filters, joins, groups or sorts on
+
+    SQLite's authorizer reports every (table, column) the statement reads
+    while EXPLAIN QUERY PLAN compiles it, so names resolve the way the
+    engine resolves them; the clause each one appears in is read from the
+    query text. Returns a set of (table, column, usage) and the plan rows.
+    Raises sqlite3.Error if the query no longer compiles.
+    """
+    reads = set()
+
+    def authorize(action, table, column, database, source):
+        if action == sqlite3.SQLITE_READ and column:
+            reads.add((table, column))
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorize)
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    finally:
+        conn.set_authorizer(None)
+
+    text = _LITERALS.sub("''", query)
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(text):
+        aliases[_unquote(table).lower()] = _unquote(table)
+        if alias and alias.upper() not in _KEYWORDS:
+            aliases[_unquote(alias).lower()] = _unquote(table)
+
+    read_by_column = defaultdict(set)
+    for table, column in reads:
+        read_by_column[column.lower()].add(table)
+
+    used = set()
+    parts = _CLAUSE.split(text)
+    for keyword, segment in zip(parts[1::2], parts[2::2]):
+        usage = _USAGE.get(' '.join(keyword.upper().split()))
+        if usage is None:
+            continue
+        for qualifier, name in _COLUMN_REF.findall(segment):
+            column = _unquote(name)
+            tables = read_by_column.get(column.lower(), ())
+            if qualifier:
+                owner = aliases.get(_unquote(qualifier).lower())
+                tables = [table for table in tables if owner is None or table == owner]
+            for table in tables:
+                used.add((table, _column_name(reads, table, column), usage))
+    return used, plan
+
+
+def _column_name(reads, table, column):
+    """Column name as the table spells it"""
+    for read_table, read_column in reads:
+        if read_table == table and read_column.lower() == column.lower():
+            return read_column
+    return column
+
+
+def auto_index_name(table, column):
+    return AUTO_INDEX_PREFIX + re.sub(r'\W', '_', f"{table}__{column}")
+
+
+class IndexAdvisor:
+    """Creates and drops single-column indexes from the recorded query workload
+
+    Successful queries in query_history are compiled (not run) to find the
+    columns of uploaded tables they filter, join, group or sort on. Columns
+    used often enough on large enough tables get an index, kept only if the
+    queries that use it measurably speed up; a rejected column is retried
+    after retry_rejected_after seconds. Indexes the advisor created
+    are dropped again once the workload stops using them; indexes it did
+    not create are never touched. Every decision is recorded with its
+    before/after latency in index_recommendations.
+    """
+
+    def __init__(self, db_manager, config=None):
+        self.db_manager = db_manager
+        self.config = {**INDEX_ADVISOR_CONFIG, **(config or {})}
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run the advisor every `interval` seconds in a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="index-advisor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.config['interval']):
+            self.run_once()
+
+    def run_once(self):
+        """Analyse the workload and adjust indexes; returns the decisions made
+
+        Returns None if another run is already in progress.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._advise()
+        except Exception as e:
+            self.db_manager.log_error(f"index_advisor", str(e))
+            return []
+        finally:
+            self._run_lock.release()
+
+    def _advise(self):
+        self.db_manager.query_log.flush(timeout=5.0)
+        workload = self.db_manager.get_query_workload(self.config['workload_size'])
+        row_counts = self.db_manager.get_table_row_counts()
+
+        usage = defaultdict(Counter)
+        queries = defaultdict(list)
+        with self.db_manager.pool.reader() as conn:
+            for query, count in workload:
+                try:
+                    used, _ = column_usage(conn, query)
+                except sqlite3.Error:
+                    continue  # Refers to tables or columns that are gone
+                for table, column, kind in used:
+                    if table not in row_counts:
+                        continue
+                    usage[(table, column)][kind] += count
+                    if query not in queries[(table, column)]:
+                        queries[(table, column)].append(query)
+
+        decisions = []
+        for index_name, table, column in self._auto_indexes():
+            if (table, column) not in usage:
+                decisions.append(self._drop(index_name, table, column))
+
+        covered = self._indexed_columns()
+        rejected = self.db_manager.get_rejected_indexes(self.config['retry_rejected_after'])
+        candidates = [
+            (key, counts) for key, counts in usage.items()
+            if sum(counts.values()) >= self.config['min_uses']
+            and row_counts[key[0]] >= self.config['min_rows']
+            and key not in covered and key not in rejected
+        ]
+        candidates.sort(key=lambda item: -sum(item[1].values()))
+        for (table, column), counts in candidates[:self.config['max_new_indexes']]:
+            decision = self._try_index(table, column, counts, queries[(table, column)])
+            if decision:
+                decisions.append(decision)
+        return decisions
+
+    def _try_index(self, table, column, counts, queries):
+        """Create an index, keeping it only if its queries get faster"""
+        queries = queries[:self.config['max_timed_queries']]
+        before, timed = self._time_queries(queries)
+        if not timed:
+            return None
+
+        index_name = auto_index_name(table, column)
+        with self.db_manager.pool.writer() as conn:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ("{column}")')
+            conn.execute(f'ANALYZE "{table}"')
+
+        after, _ = self._time_queries(timed)
+        kept = after * self.config['min_speedup'] <= before
+        if not kept:
+            with self.db_manager.pool.writer() as conn:
+                conn.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+        decision = {
+            'table_name': table,
+            'column_name': column,
+            'index_name': index_name,
+            'uses': dict(counts),
+            'before_ms': before * 1000,
+            'after_ms': after * 1000,
+            'action': 'created' if kept else 'rejected'
+        }
+        self.db_manager.record_index_change(decision)
+        return decision
+
+    def _drop(self, index_name, table, column):
+        with self.db_manager.pool.writer() as conn:
+            conn.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+        decision = {
+            'table_name': table,
+            'column_name': column,
+            'index_name': index_name,
+            'uses': {},
+            'before_ms': None,
+            'after_ms': None,
+            'action': 'dropped'
+        }
+        self.db_manager.record_index_change(decision)
+        return decision
+
+    def _time_queries(self, queries):
+        """Total best-of-`timing_runs` seconds of the queries, and those that ran
+
+        Queries that fail or take longer than max_query_seconds are left out.
+        """
+        total = 0.0
+        timed = []
+        with self.db_manager.pool.reader() as conn:
+            for query in queries:
+                deadline = time.perf_counter() + self.config['max_query_seconds']
+                conn.set_progress_handler(lambda: time.perf_counter() > deadline, 10000)
+                try:
+                    best = None
+                    for _ in range(self.config['timing_runs']):
+                        start = time.perf_counter()
+                        conn.execute(query).fetchall()
+                        elapsed = time.perf_counter() - start
+                        best = elapsed if best is None else min(best, elapsed)
+                    total += best
+                    timed.append(query)
+                except sqlite3.Error:
+                    continue
+                finally:
+                    conn.set_progress_handler(None, 0)
+        return total, timed
+
+    def _auto_indexes(self):
+        """(index, table, column) of the indexes this advisor created"""
+        with self.db_manager.pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND name LIKE ?",
+                (AUTO_INDEX_PREFIX + '%',)
+            ).fetchall()
+            indexes = []
+            for index_name, table in rows:
+                columns = conn.execute(f'PRAGMA index_info("{index_name}")').fetchall()
+                if columns:
+                    indexes.append((index_name, table, columns[0][2]))
+        return indexes
+
+    def _indexed_columns(self):
+        """(table, column) pairs that lead an existing index"""
+        covered = set()
+        with self.db_manager.pool.reader() as conn:
+            rows = conn.execute(
+                "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"
+            ).fetchall()
+            for index_name, table in rows:
+                columns = conn.execute(f'PRAGMA index_info("{index_name}")').fetchall()
+                if columns and columns[0][2]:
+                    covered.add((table, columns[0][2]))
+        return covered
@@ -0,0 +1,639 @@
+import hashlib
+import io
+import itertools
+import os
+import pickle
+import tempfile
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from config import INCREMENTAL_CONFIG, PERFORMANCE_CONFIG
+from utils.data_processor import DataProcessor
+from utils.database import DatabaseManager, SchemaMismatch, row_hashes
+from utils.parallel import available_cores, running_job, share_cores
+from utils.readers import SniffResult, iter_chunks, read_csv, sniff_file
+from utils.sketch import column_sketches, sketches_to_dict
+
+
+def compute_file_fingerprint(file, block_size=8 * 1024 * 1024):
+    """Compute a content hash of an uploaded file without copying it"""
+    hasher = hashlib.blake2b(digest_size=16)
+
+    if hasattr(file, 'getbuffer'):
+        # In-memory uploads (Streamlit's UploadedFile is a BytesIO)
+        with file.getbuffer() as view:
+            hasher.update(view)
+    else:
+        position = file.tell()
+        file.seek(0)
+        for block in iter(lambda: file.read(block_size), b''):
+            hasher.update(block)
+        file.seek(position)
+
+    return hasher.hexdigest()
+
+
+class IngestionCache:
+    """Processed uploads keyed by content fingerprint and cleaning settings"""
+
+    def __init__(self):
+        self._entries = {}
+        self._fingerprints = {}
+
+    def fingerprint(self, file):
+        """Get the content fingerprint of a file, hashing each upload only once"""
+        file_id = getattr(file, 'file_id', None)
+        identity = (file_id, file.name, getattr(file, 'size', None))
+
+        if file_id is not None and identity in self._fingerprints:
+            return self._fingerprints[identity]
+
+        fingerprint = compute_file_fingerprint(file)
+        if file_id is not None:
+            self._fingerprints[identity] = fingerprint
+        return fingerprint
+
+    def make_key(self, file, settings_key):
+        """Build the cache key for a file under the given cleaning settings"""
+        return (file.name, self.fingerprint(file), settings_key)
+
+    def get(self, key):
+        """Return the cached entry for a key, or None"""
+        return self._entries.get(key)
+
+    def put(self, key, entry):
+        """Store a processed entry"""
+        self._entries[key] = entry
+
+    def retain(self, keys):
+        """Drop entries for files that are no longer uploaded"""
+        keys = set(keys)
+        self._entries = {k: v for k, v in self._entries.items() if k in keys}
+        live_fingerprints = {k[1] for k in keys}
+        self._fingerprints = {
+            k: v for k, v in self._fingerprints.items() if v in live_fingerprints
+        }
+
+    def clear(self):
+        """Remove all cached entries"""
+        self._entries.clear()
+        self._fingerprints.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def table_name_for(filename):
+    """Derive the SQLite table name for an uploaded file"""
+    return f"data_{filename.split('.')[0].lower()}"
+
+
+def should_stream(file):
+    """Whether a file is ingested in chunks
+
+    Files larger than the streaming threshold are cleaned chunk by chunk,
+    whatever their format; smaller ones are read whole and cleaned in memory.
+    """
+    return getattr(file, 'size', 0) > PERFORMANCE_CONFIG['streaming_threshold']
+
+
+# Shared by the processes of an ingestion pool; see table_writes
+_table_lock = None
+
+
+def init_ingest_worker(active_jobs=None, table_lock=None):
+    """Process-pool initializer for ingestion workers
+
+    `active_jobs` counts the jobs running across the pool. Column-parallel
+    cleaning inside a worker splits the cores among them, so one large
+    upload gets a nested column pool while a full pool cleans in-process
+    rather than starting up to cores * cores processes. `table_lock` is
+    held while a worker writes a table (see table_writes).
+    """
+    global _table_lock
+    share_cores(active_jobs)
+    _table_lock = table_lock
+
+
+def table_writes():
+    """Context in which an ingestion worker writes to the database
+
+    Workers store their own tables, so loads from several processes would
+    otherwise wait on SQLite's write lock and give up after its busy
+    timeout. Outside an ingestion pool this does nothing.
+    """
+    return _table_lock if _table_lock is not None else nullcontext()
+
+
+class SpooledUpload(io.BufferedReader):
+    """An upload spooled to disk, read under its original file name
+
+    Readers take the file type from the name and callers the size, as
+    they do from Streamlit's UploadedFile.
+    """
+
+    def __init__(self, path, name):
+        super().__init__(io.FileIO(path, 'rb'))
+        self._upload_name = name
+        self.size = os.path.getsize(path)
+
+    @property
+    def name(self):
+        return self._upload_name
+
+
+def spool_upload(file):
+    """Copy an upload to a temporary file and return its path
+
+    Background jobs get the path rather than the bytes, so the upload is
+    not pickled to a pool process; the caller removes the file.
+    """
+    fd, path = tempfile.mkstemp(prefix='medico-upload-')
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            file.seek(0)
+            while True:
+                block = file.read(8 * 1024 * 1024)
+                if not block:
+                    break
+                spool.write(block)
+    except BaseException:
+        os.unlink(path)
+        raise
+    finally:
+        file.seek(0)
+    return path
+
+
+def chunk_rows_for(file, sniff=None, chunk_bytes=None, probe_rows=1000):
+    """Rows per chunk for reading an upload in pieces of about `chunk_bytes`
+
+    Measured on the first rows of the file, as parsed text takes several
+    times its size on disk.
+    """
+    probe = next(iter_chunks(file, probe_rows, sniff), None)
+    if probe is None or len(probe) == 0:
+        return probe_rows
+    return frame_chunk_rows(probe, chunk_bytes)
+
+
+def frame_chunk_rows(df, chunk_bytes=None):
+    """Rows of a frame that take about `chunk_bytes` of memory"""
+    chunk_bytes = chunk_bytes or PERFORMANCE_CONFIG['chunk_bytes']
+    sample = df.head(1000)
+    row_bytes = sample.memory_usage(deep=True, index=False).sum() / max(len(sample), 1)
+    return max(1, int(chunk_bytes // max(row_bytes, 1)))
+
+
+def ingest_worker_count():
+    """Number of worker processes to use for ingestion"""
+    return PERFORMANCE_CONFIG.get('ingest_workers') or available_cores()
+
+
+def process_upload(file, data_processor, sniff=None, progress=None, db_manager=None,
+                   dataset_cache=None, source_key=None):
+    """Parse, clean and summarise one upload
+
+    Large uploads are cleaned in chunks (see clean_stream). With a
+    `db_manager`, their finished chunks are written to the table as they
+    come, and with a `dataset_cache` also to its entry under `source_key`;
+    the result then has no 'dataframe' and its 'stored' load statistics
+    and 'cached' flag say what was written. Keyed tables that already
+    exist, and every upload without a `db_manager`, keep the assembled
+    frame for store_processed. `progress`, if given, is called as
+    progress(rows_done, total_rows), and with a third argument 'storing'
+    once rows are being written.
+    """
+    sniff = sniff if isinstance(sniff, SniffResult) else sniff_file(file)
+    # The chunked path implements the default stage order only
+    streamed = should_stream(file) and data_processor.has_default_pipeline()
+    # Upserts compare raw rows, so keyed tables keep the hash of each source row
+    track_source = bool(INCREMENTAL_CONFIG['primary_keys'].get(table_name_for(file.name)))
+
+    if streamed:
+        return _process_stream(
+            file, data_processor, sniff, progress, track_source, db_manager, dataset_cache, source_key
+        )
+
+    if sniff.file_type == 'csv':
+        df = read_csv(file, sniff)
+    else:
+        df = pd.concat(iter_chunks(file, chunk_rows_for(file, sniff), sniff), ignore_index=True)
+    processed_df = data_processor.clean_and_process(
+        df, file.name, sniff.date_formats, track_source=track_source
+    )
+    if progress:
+        progress(len(df), len(df))
+
+    profile = data_processor.build_profile(processed_df, data_processor.row_hashes)
+    # Stored with the table for outlier counts and box plots (see get_sketches)
+    sketches = sketches_to_dict(data_processor.sketches or column_sketches(processed_df))
+
+    return {
+        'name': file.name,
+        'table': table_name_for(file.name),
+        'dataframe': processed_df,
+        'profile': profile,
+        'stats': data_processor.get_basic_stats(processed_df, profile=profile),
+        'row_hashes': data_processor.row_hashes,
+        'source_hashes': data_processor.source_hashes,
+        'sketches': sketches,
+        'processing_log': data_processor.get_processing_log(),
+        'stage_metrics': data_processor.get_stage_metrics(),
+        'streamed': False
+    }
+
+
+def _process_stream(file, data_processor, sniff, progress, track_source, db_manager, dataset_cache, source_key):
+    """The streamed branch of process_upload"""
+    table = table_name_for(file.name)
+    key_columns = INCREMENTAL_CONFIG['primary_keys'].get(table)
+    store = db_manager is not None and not (key_columns and db_manager.table_exists(table))
+    cache_writer = dataset_cache.writer(source_key) if store and dataset_cache and source_key else None
+    collected = []
+    stored = None
+
+    def passed_on(chunks):
+        start = 0
+        for chunk in chunks:
+            end = start + len(chunk)
+            if cache_writer is not None:
+                source_hashes = data_processor.source_hashes
+                cache_writer.write(
+                    chunk, data_processor.row_hashes[start:end],
+                    source_hashes[start:end] if source_hashes is not None else None
+                )
+            if not store:
+                collected.append(chunk)
+            start = end
+            yield chunk
+
+    def write(chunks):
+        nonlocal stored
+        chunks = passed_on(chunks)
+        if not store:
+            for _ in chunks:
+                pass
+            return
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError("File contains no data")
+        chunks = itertools.chain([first], chunks)
+        hashes = data_processor.row_hashes
+        if db_manager.is_stored(first.iloc[:0], table, hashes):
+            # Still read through for the cache entry and the profile
+            for _ in chunks:
+                pass
+            stored = {'rows': len(hashes), 'skipped': True}
+            return
+        if progress:
+            progress(0, len(hashes), 'storing')
+        with table_writes():
+            stored = db_manager.store_dataframe_chunks(
+                chunks, table, file.name, hashes=hashes,
+                sketches=sketches_to_dict(data_processor.sketches),
+                source_hashes=data_processor.source_hashes
+            )
+        if stored is False:
+            raise ValueError(f"Could not store {table}")
+
+    try:
+        profile = clean_stream(
+            file, data_processor, write, sniff=sniff, progress=progress, track_source=track_source
+        )
+        result = {
+            'name': file.name,
+            'table': table,
+            'dataframe': pd.concat(collected, ignore_index=True) if not store else None,
+            'profile': profile,
+            'stats': data_processor.get_basic_stats(None, profile=profile),
+            'row_hashes': data_processor.row_hashes,
+            'source_hashes': data_processor.source_hashes,
+            'sketches': sketches_to_dict(data_processor.sketches),
+            'processing_log': data_processor.get_processing_log(),
+            'stage_metrics': data_processor.get_stage_metrics(),
+            'streamed': True
+        }
+        if stored:
+            result['processing_log'].append(_stored_message(table, stored))
+            with table_writes():
+                db_manager.store_profile(table, profile)
+            result['stored'] = stored
+        if cache_writer is not None:
+            result['cached'] = cache_writer.close(result)
+        return result
+    finally:
+        if cache_writer is not None:
+            cache_writer.abort()
+
+
+def ingest_upload(file, data_processor, db_manager, dataset_cache=None, source_key=None,
+                  sniff=None, progress=None):
+    """Process an upload, store its table and cache it, as a background job does
+
+    Streamed uploads are written while they are cleaned (see
+    process_upload); the rest are stored whole with store_processed, which
+    also upserts into keyed tables. Returns the entry without its frame
+    and hash arrays, so only the small part crosses back from a pool
+    process: if 'cached' is set the full entry is in `dataset_cache` under
+    `source_key`, otherwise it is read back from the table.
+    """
+    result = process_upload(file, data_processor, sniff, progress, db_manager, dataset_cache, source_key)
+    if not result.get('stored'):
+        if progress:
+            progress(0, len(result['dataframe']), 'storing')
+        with table_writes():
+            result = store_processed({**result, 'streamed': True}, db_manager)
+        result['cached'] = bool(dataset_cache and source_key and dataset_cache.store(source_key, result))
+    return {
+        key: value for key, value in result.items()
+        if key not in ('dataframe', 'row_hashes', 'source_hashes')
+    }
+
+
+def store_processed(result, db_manager, chunk_rows=None, progress=None):
+    """Write a processed upload to SQLite and return its session entry
+
+    Tables with a declared primary key that already exist are upserted;
+    the entry then carries the whole merged table. If the upload's columns
+    no longer match the table, the table is rebuilt from its stored rows
+    merged with the upload instead. Raises ValueError if the table could
+    not be written.
+    """
+    df = result['dataframe']
+    key_columns = INCREMENTAL_CONFIG['primary_keys'].get(result['table'])
+
+    if key_columns and db_manager.table_exists(result['table']):
+        result.pop('streamed', None)
+        try:
+            counts = db_manager.upsert_dataframe(
+                df, result['table'], key_columns, result['name'], result.get('source_hashes')
+            )
+            message = (
+                f"Upserted into {result['table']}: {counts['inserted']} new, "
+                f"{counts['updated']} changed, {counts['unchanged']} unchanged rows"
+            )
+        except SchemaMismatch:
+            message = reload_merged(result, db_manager, key_columns)
+        result['processing_log'] = result.get('processing_log', []) + [message]
+
+        # The table keeps its stored dtypes, row hashes and sketches up to
+        # date, so the merged entry is read back rather than recomputed
+        data_processor = DataProcessor()
+        result['dataframe'] = db_manager.read_table(result['table'])
+        result['row_hashes'] = db_manager.get_row_hashes(result['table'])
+        result['source_hashes'] = db_manager.get_source_hashes(result['table'])
+        result['sketches'] = db_manager.get_sketches(result['table']) or None
+        # Unchanged contents keep their fingerprint, and with it the stored profile
+        result['profile'] = db_manager.get_profile(result['table']) or data_processor.build_profile(
+            result['dataframe'], result['row_hashes'], result['sketches']
+        )
+        db_manager.store_profile(result['table'], result['profile'])
+        result['stats'] = data_processor.get_basic_stats(result['dataframe'], profile=result['profile'])
+        return result
+
+    streamed = result.pop('streamed', False)
+    if streamed and db_manager.is_stored(df, result['table'], result.get('row_hashes')):
+        stored = {'rows': len(df), 'skipped': True}
+    elif streamed:
+        chunk_rows = chunk_rows or frame_chunk_rows(df)
+        chunks = (df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows))
+        stored = db_manager.store_dataframe_chunks(
+            chunks, result['table'], result['name'], progress=progress,
+            hashes=result.get('row_hashes'), sketches=result.get('sketches'),
+            source_hashes=result.get('source_hashes')
+        )
+    else:
+        stored = db_manager.store_dataframe(
+            df, result['table'], result['name'], result.get('row_hashes'), result.get('sketches'),
+            result.get('source_hashes')
+        )
+    if not stored:
+        raise ValueError(f"Could not store {result['table']}")
+    result['processing_log'] = result.get('processing_log', []) + [_stored_message(result['table'], stored)]
+    if result.get('profile'):
+        db_manager.store_profile(result['table'], result['profile'])
+
+    return result
+
+
+def _stored_message(table, stored):
+    """Processing log line for the load statistics of a stored table"""
+    if stored['skipped']:
+        return f"{table} already holds these {stored['rows']:,} rows; reload skipped"
+    return (
+        f"Stored {stored['rows']:,} rows in {table} in {stored['seconds']:.2f}s "
+        f"({stored['rows_per_second']:,.0f} rows/s)"
+    )
+
+
+def reload_merged(result, db_manager, key_columns):
+    """Replace a keyed table with its stored rows merged with an upload
+
+    Used when the upload's columns differ from the table's, so rows cannot
+    be upserted in place. The merged table has the columns of both; rows
+    of the upload replace stored rows with the same key. Returns a line
+    for the processing log.
+    """
+    table = result['table']
+    stored = db_manager.read_table(table)
+    stored_sources = db_manager.get_source_hashes(table)
+    merged = pd.concat([stored, result['dataframe']], ignore_index=True)
+    latest = ~merged.duplicated(subset=key_columns, keep='last').to_numpy()
+    merged = merged[latest].reset_index(drop=True)
+
+    source_hashes = None
+    # Rows deleted outside the app leave the stored hashes out of step
+    if stored_sources is not None and len(stored_sources) != len(stored):
+        stored_sources = None
+    if stored_sources is not None and result.get('source_hashes') is not None:
+        source_hashes = np.concatenate([stored_sources, result['source_hashes']])[latest]
+    if db_manager.store_dataframe(merged, table, result['name'], source_hashes=source_hashes) is False:
+        raise ValueError(f"Could not rebuild {table} with the columns of {result['name']}")
+
+    added = sorted(set(result['dataframe'].columns) - set(stored.columns))
+    missing = sorted(set(stored.columns) - set(result['dataframe'].columns))
+    return (
+        f"Columns changed (added: {', '.join(added) or 'none'}; missing: {', '.join(missing) or 'none'}); "
+        f"rebuilt {table} with {len(merged)} rows from the stored rows and the upload"
+    )
+
+
+def with_sketches(entry, db_manager):
+    """Give a full dataset entry its table's column sketches if it has none
+
+    Entries cached before sketches were kept with them get the stored ones,
+    built from the table on first request (see get_sketches).
+    """
+    if not entry.get('sketches') and not entry.get('sampled'):
+        entry['sketches'] = db_manager.get_sketches(entry['table']) or None
+    return entry
+
+
+def ensure_table(entry, db_manager, source_key):
+    """Reload a cached dataset into SQLite unless its table already holds it"""
+    if db_manager.get_source(entry['table']) == source_key:
+        return
+    store_processed({**entry, 'streamed': True}, db_manager)
+    db_manager.record_source(entry['table'], source_key)
+
+
+def clean_stream(file, data_processor, write, chunk_rows=None, sniff=None, progress=None,
+                 track_source=False):
+    """Chunked cleaning for CSV, Excel and JSON uploads in bounded memory
+
+    The first pass over the file gathers mergeable summaries into a
+    cleaning plan; the second fills and converts each chunk with it and
+    spools the result to a temporary file. Duplicates, outliers and
+    dtypes are planned from two passes over the spool, and a last one
+    finishes each chunk and hands it on: `write` is called once with an
+    iterator of the finished chunks and must consume it. Only one chunk is
+    held at a time, so memory does not grow with the file; chunks have
+    `chunk_rows` rows, by default as many as fit PERFORMANCE_CONFIG
+    ['chunk_bytes']. data_processor.row_hashes, sketches and (with
+    `track_source`) source_hashes describe the finished rows by the time
+    `write` is called. Returns their profile (see build_profile).
+    """
+    chunk_rows = chunk_rows or chunk_rows_for(file, sniff)
+
+    def read_chunks():
+        return iter_chunks(file, chunk_rows, sniff)
+
+    date_formats = sniff.date_formats if sniff else None
+    plan = data_processor.plan_chunked_cleaning(read_chunks(), date_formats)
+
+    total_rows = plan['row_count']
+    with _ChunkSpool() as spool:
+        chunk_hashes = []
+        source_hashes = []
+        offset = 0
+        for chunk in read_chunks():
+            if track_source:
+                source_hashes.append(row_hashes(chunk))
+            cleaned = data_processor.apply_cleaning_plan(chunk, plan)
+            chunk_hashes.append(row_hashes(cleaned))
+            spool.append(cleaned)
+            offset += len(chunk)
+            if progress:
+                progress(offset, total_rows)
+
+        finish = data_processor.plan_chunked_finish(spool, chunk_hashes)
+        del chunk_hashes
+        if track_source:
+            data_processor.source_hashes = np.concatenate(source_hashes)[finish['positions']]
+        else:
+            data_processor.source_hashes = None
+
+        def finished_chunks():
+            start = 0
+            for chunk in spool:
+                yield data_processor.apply_chunked_finish(chunk, start, finish)
+                start += len(chunk)
+
+        write(finished_chunks())
+
+    return data_processor.complete_chunked_cleaning(finish)
+
+
+class _ChunkSpool:
+    """Frames written once to a temporary file and read back in order, as often as needed"""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(prefix='medico-spool-')
+        self._count = 0
+
+    def append(self, chunk):
+        pickle.dump(chunk, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._count += 1
+
+    def __iter__(self):
+        self._file.seek(0)
+        for _ in range(self._count):
+            yield pickle.load(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+
+def should_sample(file):
+    """Whether an upload is large enough to get a sample before the full load"""
+    return getattr(file, 'size', 0) > PERFORMANCE_CONFIG['sample_threshold']
+
+
+def sample_upload(file, data_processor, sniff=None, sample_rows=None, seed=None):
+    """Uniform random sample of an upload, cleaned like the full dataset
+
+    Every row gets a random key and the rows with the smallest keys are
+    kept (bottom-k sampling, equivalent to a reservoir sample). Once the
+    sample is full only rows under the current k-th key are considered, so
+    a pass costs little more than reading the file.
+    """
+    sample_rows = sample_rows or PERFORMANCE_CONFIG['sample_rows']
+    sniff = sniff if isinstance(sniff, SniffResult) else sniff_file(file)
+    rng = np.random.default_rng(seed)
+
+    kept = []
+    kept_rows = 0
+    threshold = 1.0
+    total_rows = 0
+
+    for chunk in iter_chunks(file, chunk_rows_for(file, sniff), sniff):
+        keys = rng.random(len(chunk))
+        candidates = keys < threshold
+        total_rows += len(chunk)
+        if not candidates.any():
+            continue
+
+        # Remember file positions so the sample keeps the original row order
+        positions = np.flatnonzero(candidates) + (total_rows - len(chunk))
+        kept.append(chunk[candidates].assign(_sample_key=keys[candidates], _sample_row=positions))
+        kept_rows += int(candidates.sum())
+
+        # Compact once the candidates are well over the sample size
+        if kept_rows >= 2 * sample_rows:
+            sample = pd.concat(kept, ignore_index=True).nsmallest(sample_rows, '_sample_key')
+            threshold = sample['_sample_key'].iloc[-1]
+            kept = [sample]
+            kept_rows = len(sample)
+
+    if not kept:
+        raise ValueError("File contains no data")
+
+    sample = pd.concat(kept, ignore_index=True).nsmallest(sample_rows, '_sample_key')
+    sample = sample.sort_values('_sample_row').drop(columns=['_sample_key', '_sample_row'])
+    sample = sample.reset_index(drop=True)
+    processed_df = data_processor.clean_and_process(sample, file.name, sniff.date_formats)
+    profile = data_processor.build_profile(processed_df, data_processor.row_hashes)
+
+    return {
+        'name': file.name,
+        'table': table_name_for(file.name),
+        'dataframe': processed_df,
+        'profile': profile,
+        'stats': data_processor.get_basic_stats(processed_df, profile=profile),
+        'row_hashes': data_processor.row_hashes,
+        'sketches': sketches_to_dict(data_processor.sketches or {}) or None,
+        'processing_log': data_processor.get_processing_log(),
+        'sampled': True,
+        'total_rows': total_rows
+    }
+
+
+def _sample_upload_worker(path, name, settings, sniff):
+    """Process-pool entry point for sample_upload"""
+    with SpooledUpload(path, name) as file, running_job():
+        return sample_upload(file, DataProcessor(settings), sniff)
+
+
+def _ingest_upload_worker(path, name, settings, sniff, db_path, dataset_cache, source_key, progress=None):
+    """Process-pool entry point: open the spooled upload and processor, then ingest"""
+    with SpooledUpload(path, name) as file, running_job():
+        return ingest_upload(
+            file, DataProcessor(settings), DatabaseManager(db_path), dataset_cache, source_key,
+            sniff, progress
+        )
@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from utils.database import DatabaseManager
+from utils.dataset_cache import DatasetCache
+from utils.ingestion import (
+    _ingest_upload_worker, _sample_upload_worker, ingest_worker_count, init_ingest_worker,
+    should_sample, spool_upload, table_name_for
+)
+
+FINISHED_STATES = ('done', 'failed')
+
+
+class JobProgress:
+    """Picklable progress callback that writes to the ingestion job table
+
+    Runs inside pool processes, so it opens its own short-lived connection,
+    throttles updates and gives up immediately if the writer holds the lock.
+    """
+
+    def __init__(self, db_path, job_id, min_interval=0.5):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.started = time.time()
+        self._last_update = 0.0
+        self._state = None
+
+    def __call__(self, rows_done, total_rows=None, state='processing'):
+        now = time.time()
+        if now - self._last_update < self.min_interval and rows_done != total_rows \
+                and state == self._state:
+            return
+        self._last_update = now
+        self._state = state
+
+        try:
+            with sqlite3.connect(self.db_path, timeout=0.05) as conn:
+                conn.execute("""
+                UPDATE ingestion_jobs
+                SET state = ?, rows_processed = ?,
+                    total_rows = COALESCE(?, total_rows), elapsed = ?
+                WHERE id = ?
+                """, (state, rows_done, total_rows, now - self.started, self.job_id))
+                conn.commit()
+        except sqlite3.OperationalError:
+            pass  # Busy database; the next update will catch up
+
+
+class IngestionWorker:
+    """Background ingestion shared by all sessions of the app
+
+    Uploads are spooled to disk and ingested in a process pool: each job
+    parses, cleans and stores its table and dataset cache entry, with one
+    process writing a table at a time (see table_writes), and sends back
+    only the entry's metadata. A writer thread then loads the entry from
+    the cache and records state, rows and elapsed time in the
+    ingestion_jobs table for the UI to poll. Large uploads also get a quick
+    random sample that the UI can show while the full load is running.
+    """
+
+    def __init__(self, db_path, max_workers=None, result_ttl=600):
+        self.db_manager = DatabaseManager(db_path)
+        self.dataset_cache = DatasetCache()
+        self.max_workers = max_workers or ingest_worker_count()
+        self.result_ttl = result_ttl
+        # Jobs running in the pool, so workers can split the cores between them
+        self._active_jobs = multiprocessing.Value('i', 0)
+        self._table_lock = multiprocessing.Lock()
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._completed = queue.Queue()
+        self._results = {}
+        self._samples = {}
+        self._uploads = {}
+        self._results_lock = threading.Lock()
+
+        self._writer = threading.Thread(
+            target=self._run_writer, name="ingestion-writer", daemon=True
+        )
+        self._writer.start()
+
+    def submit(self, file, settings, sniff, source_key):
+        """Queue an upload for background ingestion and return its job id"""
+        table_name = table_name_for(file.name)
+        job_id = self.db_manager.create_ingestion_job(file.name, table_name, source_key)
+        path = spool_upload(file)
+        sampled = should_sample(file)
+        with self._results_lock:
+            self._uploads[job_id] = (path, 2 if sampled else 1)
+        args = (
+            path, file.name, settings, sniff, self.db_manager.db_path, self.dataset_cache, source_key,
+            JobProgress(self.db_manager.db_path, job_id)
+        )
+
+        if sampled:
+            # Submitted first so a free worker picks up the cheap pass early
+            sample_future = self._submit(_sample_upload_worker, path, file.name, settings, sniff)
+            sample_future.add_done_callback(
+                lambda f: self._store_sample(job_id, f)
+            )
+            sample_future.add_done_callback(
+                lambda f: self._release_upload(job_id)
+            )
+
+        future = self._submit(_ingest_upload_worker, *args)
+        future.add_done_callback(
+            lambda f: self._completed.put((job_id, source_key, args, f))
+        )
+        return job_id
+
+    def get_sample(self, job_id):
+        """Sampled entry for a job still loading, or None"""
+        with self._results_lock:
+            sample = self._samples.get(job_id)
+        return sample[1] if sample else None
+
+    def take_result(self, job_id, source_key=None):
+        """Hand over a finished job's entry, or None if it is not ready
+
+        A job's sample stays available until its full entry is handed over.
+        """
+        with self._results_lock:
+            result = self._results.pop(job_id, None)
+            if result is not None:
+                self._samples.pop(job_id, None)
+                return result[1]
+        if source_key is not None:
+            jobs = self.db_manager.get_ingestion_jobs([job_id])
+            if jobs and jobs[0]['state'] == 'done':
+                # Result was pruned; the dataset cache still has it
+                entry = self.dataset_cache.load(source_key)
+                if entry is not None:
+                    with self._results_lock:
+                        self._samples.pop(job_id, None)
+                return entry
+        return None
+
+    def _submit(self, fn, *args):
+        try:
+            return self._get_executor().submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._reset_executor()
+            return self._get_executor().submit(fn, *args)
+
+    def _store_sample(self, job_id, future):
+        """Keep a finished sample; runs on the pool's callback thread, not the writer"""
+        try:
+            sample = future.result()
+        except Exception as e:
+            # The full load still runs; the UI just waits for it
+            self.db_manager.log_error("ingestion_sample", str(e))
+            return
+
+        with self._results_lock:
+            if job_id in self._results:
+                return  # The full result won the race
+            self._samples[job_id] = (time.time(), sample)
+        self.db_manager.update_ingestion_job(
+            job_id, timeout=0.5, sample_rows=len(sample['dataframe'])
+        )
+
+    def _release_upload(self, job_id):
+        """Remove a job's spooled upload once no pass over it is left"""
+        with self._results_lock:
+            path, users = self._uploads.get(job_id, (None, 0))
+            if users > 1:
+                self._uploads[job_id] = (path, users - 1)
+                return
+            self._uploads.pop(job_id, None)
+        if path is not None:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=init_ingest_worker,
+                    initargs=(self._active_jobs, self._table_lock)
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            # A dead worker may never have counted its job off, or released the lock
+            self._active_jobs = multiprocessing.Value('i', 0)
+            self._table_lock = multiprocessing.Lock()
+
+    def _run_writer(self):
+        """Collect finished jobs one at a time and hand over their entries"""
+        while True:
+            job_id, source_key, args, future = self._completed.get()
+            started = time.time()
+
+            try:
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # The pool died; ingest this upload on the writer thread
+                    self._reset_executor()
+                    result = _ingest_upload_worker(*args)
+
+                progress = args[-1]
+                entry = self.dataset_cache.load(source_key) if result.pop('cached', False) else None
+                if entry is None:
+                    entry = self._read_entry(result)
+                self.db_manager.record_source(entry['table'], source_key)
+
+                with self._results_lock:
+                    self._results[job_id] = (time.time(), entry)
+                    self._samples.pop(job_id, None)
+                self.db_manager.update_ingestion_job(
+                    job_id, state='done', rows_processed=len(entry['dataframe']),
+                    total_rows=len(entry['dataframe']), finished_at=datetime.now().isoformat(),
+                    elapsed=time.time() - progress.started
+                )
+
+            except Exception as e:
+                self.db_manager.log_error("ingestion_job", str(e))
+                self.db_manager.update_ingestion_job(
+                    job_id, state='failed', error_message=str(e),
+                    finished_at=datetime.now().isoformat(),
+                    elapsed=time.time() - started
+                )
+
+            finally:
+                self._release_upload(job_id)
+
+            self._prune_results()
+
+    def _read_entry(self, result):
+        """Entry of a job missing from the dataset cache, with its frame and hashes read from its table"""
+        table = result['table']
+        result.pop('stored', None)
+        return {
+            **result,
+            'dataframe': self.db_manager.read_table(table),
+            'row_hashes': self.db_manager.get_row_hashes(table),
+            'source_hashes': self.db_manager.get_source_hashes(table)
+        }
+
+    def _prune_results(self):
+        """Forget results no session collected; they remain in the dataset cache"""
+        cutoff = time.time() - self.result_ttl
+        with self._results_lock:
+            for store in (self._results, self._samples):
+                for job_id in [k for k, (t, _) in store.items() if t < cutoff]:
+                    del store[job_id]
@@ -6,6 +6,8 @@ from datetime import datetime
 import os
 from typing import Dict, Any, Optional
 
+from utils.data_processor import DataProcessor
+
 class LLMHandler:
     """Advanced LLM handler with intelligent query processing"""
 
@@ -67,8 +69,12 @@ class LLMHandler:
             'trend': r'\b(trend|over time|timeline|change)\b'
         }
 
-    def process_natural_language_query(self, query: str, processed_data: list, db_manager) -> Dict[str, Any]:
-        """Process natural language query with intelligent understanding"""
+    def process_natural_language_query(self, query: str, processed_data: list, db_manager,
+                                       cancel_event=None) -> Dict[str, Any]:
+        """Process natural language query with intelligent understanding
+
+        Setting `cancel_event` interrupts the generated SQL while it runs.
+        """
 
         # Analyze query type
         query_type = self.classify_query(query)
@@ -81,7 +87,8 @@ class LLMHandler:
 
         # Execute query
         try:
-            results = db_manager.execute_query(sql_query)
+            # First rows for display; a longer result is marked truncated
+            results, _ = db_manager.preview_query(sql_query, cancel_event=cancel_event)
 
             # Generate natural language response
             response = self.generate_response(query, results, query_type, sql_query)
@@ -109,33 +116,36 @@ class LLMHandler:
         return "general"
 
     def build_data_context(self, processed_data: list) -> str:
-        """Build comprehensive data context for LLM"""
+        """Build comprehensive data context for LLM
+
+        Column details come from each dataset's ingest-time profile.
+        """
         context_parts = []
 
         for data in processed_data:
             df = data['dataframe']
             table_name = data['table']
+            profile = data.get('profile') or DataProcessor().build_profile(df, data.get('row_hashes'))
 
             # Basic info
             info = f"""
 Table: {table_name}
-Rows: {len(df)}
-Columns: {len(df.columns)}
+Rows: {profile['row_count']}
+Columns: {profile['column_count']}
 Column Details:
 """
 
             # Column information
-            for col in df.columns:
-                dtype = df[col].dtype
-                null_count = df[col].isnull().sum()
-                unique_count = df[col].nunique()
-
-                col_info = f"  - {col} ({dtype}): {unique_count} unique values, {null_count} null values"
+            for col, column in profile['columns'].items():
+                col_info = (
+                    f"  - {col} ({column['dtype']}): {column['distinct']} unique values, "
+                    f"{column['nulls']} null values"
+                )
 
                 # Add sample values for categorical columns
-                if dtype == 'object' and unique_count <= 10:
-                    unique_values = df[col].dropna().unique()[:5]
-                    col_info += f", examples: {list(unique_values)}"
+                if column['kind'] == 'categorical' and column['distinct'] <= 10:
+                    unique_values = [value for value, _ in column['top_values'][:5]]
+                    col_info += f", examples: {unique_values}"
 
                 info += col_info + "\n"
 
@@ -0,0 +1,154 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import PERFORMANCE_CONFIG
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional: without it column-parallel cleaning is disabled
+    pa = None
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+# Jobs running across the ingestion pool, set in its workers (see share_cores)
+_active_jobs = None
+
+
+def available_cores():
+    """Cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def column_worker_count():
+    """Processes to use for column-parallel cleaning; 1 means run in-process
+
+    Inside an ingestion pool worker the cores are shared with the jobs
+    running in the other workers, so a lone job gets them all and a full
+    pool cleans each job in-process.
+    """
+    if pa is None:
+        return 1
+    workers = PERFORMANCE_CONFIG.get('column_workers') or available_cores()
+    if _active_jobs is not None:
+        workers = min(workers, available_cores() // max(1, _active_jobs.value))
+    return max(1, workers)
+
+
+def share_cores(active_jobs):
+    """Size column pools by the cores left over by other running jobs
+
+    `active_jobs` is a multiprocessing.Value counting the jobs running in
+    the pool this process belongs to; see running_job.
+    """
+    global _active_jobs
+    _active_jobs = active_jobs
+
+
+class running_job:
+    """Context manager counting a job in the shared active-jobs counter
+
+    On exit the column pool is shut down, so idle workers of one job do
+    not hold on to processes the next job's budget may not allow.
+    """
+
+    def __enter__(self):
+        if _active_jobs is not None:
+            with _active_jobs.get_lock():
+                _active_jobs.value += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        if _active_jobs is not None:
+            with _active_jobs.get_lock():
+                _active_jobs.value -= 1
+            reset_column_pool()
+        return False
+
+
+def should_split_columns(df):
+    """Whether a frame is wide and large enough to clean column groups in parallel"""
+    return (
+        column_worker_count() > 1
+        and len(df.columns) >= PERFORMANCE_CONFIG['column_parallel_min_columns']
+        and len(df) * len(df.columns) >= PERFORMANCE_CONFIG['column_parallel_min_cells']
+    )
+
+
+def column_groups(columns, workers):
+    """Split columns into contiguous groups, two per worker to even out the load"""
+    count = min(len(columns), workers * 2)
+    return [list(group) for group in np.array_split(np.asarray(columns, dtype=object), count)]
+
+
+def get_column_pool():
+    """Process pool shared by column-parallel stages, created on first use"""
+    global _pool, _pool_workers
+    workers = column_worker_count()
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def reset_column_pool():
+    """Drop the shared pool, e.g. after a worker died; the next call starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def _shared_dir():
+    """Directory for frames handed between processes: RAM-backed where available"""
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def write_arrow_file(df):
+    """Write a frame to an Arrow IPC file for another process to map
+
+    Returns the path and the names of the frame's object columns; Arrow
+    reads text back as 'str', so those are listed to be restored. Only
+    the path crosses the pool's pipe. The reader removes the file.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fd, path = tempfile.mkstemp(prefix='medico-', suffix='.arrow', dir=_shared_dir())
+    try:
+        with os.fdopen(fd, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    except BaseException:
+        os.unlink(path)
+        raise
+    object_columns = [col for col in df.columns if df[col].dtype == object]
+    return path, object_columns
+
+
+def read_arrow_file(path, object_columns=()):
+    """Frame from write_arrow_file output, memory-mapped and then removed"""
+    try:
+        with pa.memory_map(path) as source:
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+    finally:
+        remove_arrow_file(path)
+    restore = [col for col in object_columns if col in df.columns and df[col].dtype != object]
+    if restore:
+        df = df.astype({col: object for col in restore})
+    return df
+
+
+def remove_arrow_file(path):
+    """Remove a file from write_arrow_file if it is still there"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,223 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import PERFORMANCE_CONFIG
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+_SQL_SPACING = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(?:\s|--[^\n]*|/\*.*?\*/)+", re.DOTALL)
+# Functions whose result changes between runs of the same statement
+_VOLATILE_FUNCTIONS = {
+    'random', 'randomblob', 'changes', 'total_changes', 'last_insert_rowid',
+    'current_timestamp', 'current_date', 'current_time'
+}
+# Date and time functions, with the positions of their time-value arguments
+_TIME_FUNCTIONS = {
+    'date': (0,), 'time': (0,), 'datetime': (0,), 'julianday': (0,), 'unixepoch': (0,),
+    'strftime': (1,), 'timediff': (0, 1)
+}
+_TIME_CALL = re.compile(rf"\b({'|'.join(_TIME_FUNCTIONS)})\s*\(", re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_CACHEABLE_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+if hasattr(sqlite3, 'SQLITE_RECURSIVE'):
+    _CACHEABLE_ACTIONS.add(sqlite3.SQLITE_RECURSIVE)
+
+
+def get_query_cache(db_path):
+    """Query result cache for a database file, shared by everything in this process"""
+    key = (os.getpid(), os.path.abspath(db_path))
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = QueryCache()
+        return cache
+
+
+def normalize_sql(query):
+    """SQL with comments removed and whitespace collapsed outside quoted text"""
+    text = _SQL_SPACING.sub(lambda match: match.group(1) or ' ', query)
+    return text.strip().rstrip(';').rstrip()
+
+
+def statement_tables(conn, query, params=None):
+    """Tables a read-only, repeatable statement reads, or None if it is neither
+
+    The statement is compiled, not run, under an authorizer that sees every
+    table it reads and every other action it would take. Date and time
+    functions only count as repeatable when called on literal times.
+    """
+    tables = set()
+    cacheable = True
+    uses_time = False
+
+    def authorize(action, arg1, arg2, database, source):
+        nonlocal cacheable, uses_time
+        if action not in _CACHEABLE_ACTIONS:
+            cacheable = False
+        elif action == sqlite3.SQLITE_READ:
+            tables.add(arg1)
+        elif action == sqlite3.SQLITE_FUNCTION:
+            name = (arg2 or '').lower()
+            if name in _VOLATILE_FUNCTIONS:
+                cacheable = False
+            elif name in _TIME_FUNCTIONS:
+                uses_time = True
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorize)
+    try:
+        conn.execute(f"EXPLAIN {query}", params or ())
+    finally:
+        conn.set_authorizer(None)
+    if uses_time and not literal_time_calls(query):
+        cacheable = False
+    return tables if cacheable and tables else None
+
+
+def literal_time_calls(query):
+    """Whether every date and time function call in a query is given a literal time
+
+    A missing time, 'now', a column or a parameter (either of which may
+    hold 'now') makes the result depend on when the query runs.
+    """
+    text = normalize_sql(query)
+    for match in _TIME_CALL.finditer(text):
+        arguments = _call_arguments(text, match.end())
+        for position in _TIME_FUNCTIONS[match.group(1).lower()]:
+            if position >= len(arguments):
+                return False
+            argument = arguments[position]
+            if not _LITERAL.fullmatch(argument) or argument.strip("'").lower() == 'now':
+                return False
+    return True
+
+
+def _call_arguments(text, start):
+    """Top-level arguments of the call whose opening parenthesis ends at `start`"""
+    arguments = []
+    depth = 0
+    quote = None
+    current = start
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')' and depth:
+            depth -= 1
+        elif char in ',)':
+            arguments.append(text[current:i].strip())
+            current = i + 1
+            if char == ')':
+                break
+    return [argument for argument in arguments if argument]
+
+
+class QueryCache:
+    """LRU cache of query results with a time-to-live
+
+    Keys hold the normalized SQL, its parameters and the fingerprints of
+    the tables it reads, so a result is never served once one of those
+    tables has changed. invalidate() also frees the entries of a table as
+    soon as it is rewritten. Results are copied in and out, so callers
+    may modify what they get.
+    """
+
+    def __init__(self, max_size=None, ttl=None, max_rows=None):
+        self.max_size = max_size or PERFORMANCE_CONFIG['max_cache_size']
+        self.ttl = ttl or PERFORMANCE_CONFIG['cache_ttl']
+        self.max_rows = max_rows or PERFORMANCE_CONFIG['query_cache_max_rows']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def make_key(self, conn, query, params=None):
+        """Cache key for a query, or None if its result should not be cached
+
+        Must be called inside the read transaction that runs the query, so
+        the fingerprints describe the data the query sees.
+        """
+        try:
+            tables = statement_tables(conn, query, params)
+            if tables is None:
+                return None
+            placeholders = ", ".join("?" for _ in tables)
+            fingerprints = dict(conn.execute(
+                f"SELECT table_name, file_hash FROM table_metadata WHERE table_name IN ({placeholders})",
+                sorted(tables)
+            ).fetchall())
+            if set(fingerprints) != tables or not all(fingerprints.values()):
+                return None  # Tables without a fingerprint cannot be tracked
+            if isinstance(params, dict):
+                params = tuple(sorted(params.items()))
+            key = (normalize_sql(query), tuple(params or ()), tuple(sorted(fingerprints.items())))
+            hash(key)
+            return key
+        except (sqlite3.Error, TypeError):
+            return None
+
+    def get(self, key):
+        """Copy of the cached result for a key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return result.copy()
+
+    def put(self, key, result):
+        if len(result) > self.max_rows:
+            return
+        result = result.copy()
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table_name):
+        """Drop every cached result that read a table"""
+        with self._lock:
+            stale = [key for key in self._entries if any(table == table_name for table, _ in key[2])]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,134 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from config import DATABASE_CONFIG
+from utils.connection_pool import get_pool
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_query_log(db_path):
+    """Query history writer for a database file, shared by everything in this process"""
+    key = (os.getpid(), os.path.abspath(db_path))
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = QueryLogWriter(db_path)
+        return writer
+
+
+class QueryLogWriter:
+    """Writes query_history rows in batches from a background thread
+
+    log() only queues the entry, so no commit sits on a query's latency
+    path. The thread writes a batch once `batch_rows` entries are waiting
+    or the oldest has waited `flush_ms`. If the queue is full the entry is
+    dropped and counted rather than blocking the caller. Pending entries
+    are flushed when the interpreter exits.
+    """
+
+    def __init__(self, db_path, batch_rows=None, flush_ms=None, max_queued=None):
+        self.pool = get_pool(db_path)
+        self.batch_rows = batch_rows or DATABASE_CONFIG['query_log_batch_rows']
+        self.flush_interval = (flush_ms or DATABASE_CONFIG['query_log_flush_ms']) / 1000
+        self._queue = queue.Queue(max_queued or DATABASE_CONFIG['query_log_max_queued'])
+        self._flushed = threading.Condition()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = False
+        self._counts_lock = threading.Lock()
+        self.accepted = 0
+        self._settled = 0  # accepted entries written or given up on
+        self.written = 0
+        self.dropped = 0
+
+    def log(self, entry):
+        """Queue a (query_text, execution_time, timestamp, success, error_message) row"""
+        self._ensure_thread()
+        with self._counts_lock:
+            try:
+                if self._stopping:
+                    raise queue.Full
+                self._queue.put_nowait(entry)
+                self.accepted += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def stats(self):
+        return {'queued': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped}
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written; False on timeout"""
+        target = self.accepted
+        with self._flushed:
+            return self._flushed.wait_for(
+                lambda: self._settled >= target or self._thread is None, timeout
+            )
+
+    def close(self, timeout=5.0):
+        """Write what is queued and stop the thread"""
+        with self._thread_lock, self._counts_lock:
+            thread, self._stopping = self._thread, True
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        stop = False
+        while not stop:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                entry = self._queue.get(timeout=timeout)
+                if entry is None:
+                    stop = True
+                else:
+                    batch.append(entry)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if batch and (stop or len(batch) >= self.batch_rows or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+                deadline = None
+
+        with self._flushed:
+            self._thread = None
+            self._flushed.notify_all()
+
+    def _write(self, batch):
+        try:
+            with self.pool.writer() as conn:
+                conn.executemany("""
+                INSERT INTO query_history
+                (query_text, execution_time, timestamp, success, error_message)
+                VALUES (?, ?, ?, ?, ?)
+                """, batch)
+        except Exception:
+            # Logging must never fail a query
+            with self._counts_lock:
+                self.dropped += len(batch)
+            with self._flushed:
+                self._settled += len(batch)
+                self._flushed.notify_all()
+            return
+        with self._flushed:
+            self.written += len(batch)
+            self._settled += len(batch)
+            self._flushed.notify_all()
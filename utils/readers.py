@@ -0,0 +1,475 @@
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y/%m/%d',
+    '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%m-%d-%Y', '%d.%m.%Y',
+    '%d/%m/%Y %H:%M', '%m/%d/%Y %H:%M'
+]
+
+# Integers float64 holds exactly, so pinned integer columns can be restored
+_FLOAT_INTEGER_LIMIT = 2 ** 53
+
+_DATE_PATTERNS = [r'\d{4}-\d{2}-\d{2}', r'\d{4}/\d{2}/\d{2}', r'\d{1,2}[/.-]\d{1,2}[/.-]\d{4}']
+
+_MAGIC_NUMBERS = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'PK\x03\x04', 'zip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz')
+]
+
+
+@dataclass
+class SniffResult:
+    """What a single look at the head of an upload tells the parser"""
+    file_type: str
+    delimiter: str = ','
+    encoding: str = 'utf-8'
+    header: int = 0
+    compression: str = None
+    dtypes: dict = field(default_factory=dict)
+    date_formats: dict = field(default_factory=dict)
+    sample_rows: int = 0
+
+    def read_csv_kwargs(self, pin_numeric=True):
+        """Arguments for pd.read_csv that reuse the sniffed findings
+
+        Text columns are pinned to their sniffed dtype, as a string dtype
+        can hold any later value. With `pin_numeric`, numeric columns are
+        read as float64 instead of being inferred again: float64 also holds
+        missing values, so only text in a numeric column fails to parse.
+        Readers then restore integer columns (see restore_int_columns) and
+        fall back to inference when a read fails.
+        """
+        dtypes = {
+            col: dtype for col, dtype in self.dtypes.items()
+            if dtype in ('object', 'str', 'string')
+        }
+        if pin_numeric:
+            dtypes.update({
+                col: 'float64' for col, dtype in self.dtypes.items()
+                if dtype in ('int64', 'float64')
+            })
+        kwargs = {
+            'sep': self.delimiter,
+            'encoding': self.encoding,
+            'header': self.header,
+            'compression': self.compression
+        }
+        if dtypes and self.header is not None:
+            kwargs['dtype'] = dtypes
+        return kwargs
+
+    def restore_int_columns(self, df):
+        """Give sniffed integer columns read as float64 the dtype inference would
+
+        Columns with only whole numbers and no missing values become int64;
+        the rest stay float64, as pandas infers them. Raises ValueError if
+        a value is too large for float64 to have held it exactly.
+        """
+        if self.header is None:
+            return df
+        for col, dtype in self.dtypes.items():
+            if dtype != 'int64' or col not in df.columns or df[col].dtype != 'float64' or len(df) == 0:
+                continue
+            values = df[col].to_numpy()
+            if np.isnan(values).any():
+                continue
+            if np.abs(values).max() >= _FLOAT_INTEGER_LIMIT:
+                raise ValueError(f"Integers in '{col}' are too large to read as float64")
+            if np.array_equal(values, np.round(values)):
+                df[col] = values.astype('int64')
+        return df
+
+
+def sniff_file(file, sample_size=64 * 1024):
+    """Inspect the head of an upload once and describe how to parse it"""
+    file_extension = Path(file.name).suffix.lower()
+    if file_extension != '.csv':
+        return SniffResult(file_type=file_extension.lstrip('.'))
+
+    file.seek(0)
+    head = file.read(sample_size)
+    file.seek(0)
+
+    compression = next(
+        (name for magic, name in _MAGIC_NUMBERS if head.startswith(magic)), None
+    )
+    if compression:
+        head = _decompressed_head(file, compression, sample_size)
+        file.seek(0)
+
+    encoding, text = _decode_sample(head)
+
+    # Only keep complete lines; the last one may be cut off
+    lines = text.splitlines()
+    if len(head) >= sample_size and len(lines) > 1:
+        lines = lines[:-1]
+    sample_text = "\n".join(lines)
+
+    try:
+        delimiter = csv.Sniffer().sniff(sample_text[:16 * 1024], delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+
+    header = 0 if lines and not _all_numeric(next(csv.reader([lines[0]], delimiter=delimiter), [])) else None
+    sample_df = pd.read_csv(io.StringIO(sample_text), sep=delimiter, header=header)
+
+    return SniffResult(
+        file_type='csv',
+        delimiter=delimiter,
+        encoding=encoding,
+        header=header,
+        compression=compression,
+        dtypes={col: str(dtype) for col, dtype in sample_df.dtypes.items()},
+        date_formats=infer_date_formats(sample_df),
+        sample_rows=len(sample_df)
+    )
+
+
+def infer_date_formats(df):
+    """Find an explicit datetime format for text columns that hold dates"""
+    formats = {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        date_format = infer_date_format(df[col].dropna().astype(str))
+        if date_format:
+            formats[col] = date_format
+    return formats
+
+
+def infer_date_format(values, min_share=1.0):
+    """The known date format that parses the most values, if it parses at least `min_share`"""
+    if len(values) == 0 or not looks_like_date(values.head(10)):
+        return None
+
+    best_format, best_share = None, 0.0
+    for date_format in DATE_FORMATS:
+        share = pd.to_datetime(values, format=date_format, errors='coerce').notna().mean()
+        if share > best_share:
+            best_format, best_share = date_format, share
+        if share == 1.0:
+            break
+    return best_format if best_share >= min_share else None
+
+
+def looks_like_date(values):
+    """Whether any value starts like a numeric date"""
+    values = values.astype(str)
+    return any(values.str.match(pattern).any() for pattern in _DATE_PATTERNS)
+
+
+def iter_chunks(file, chunk_size, sniff=None):
+    """Read an uploaded file as an iterator of DataFrame chunks
+
+    Each call starts from the beginning of the file, so callers can make
+    several passes over the same upload.
+    """
+    file.seek(0)
+    file_extension = Path(file.name).suffix.lower()
+
+    if file_extension == '.xlsx':
+        return iter_excel_chunks(file, chunk_size)
+    if file_extension == '.json':
+        return iter_json_chunks(file, chunk_size)
+    return iter_csv_chunks(file, chunk_size, sniff)
+
+
+def read_csv(file, sniff=None):
+    """Read a whole CSV file using the sniffed parser settings
+
+    If a value does not fit a pinned numeric dtype the file is read again
+    with pandas' own inference.
+    """
+    file.seek(0)
+    if sniff is None:
+        return pd.read_csv(file)
+    try:
+        return sniff.restore_int_columns(pd.read_csv(file, **sniff.read_csv_kwargs()))
+    except (ValueError, TypeError):
+        file.seek(0)
+        return pd.read_csv(file, **sniff.read_csv_kwargs(pin_numeric=False))
+
+
+def iter_csv_chunks(file, chunk_size, sniff=None):
+    """Read a CSV file in chunks
+
+    Chunks are parsed with the sniffed numeric dtypes pinned. From the
+    first chunk holding a value that does not fit them, the file is read
+    with pandas' own inference instead; the rows already returned are
+    parsed again but skipped.
+    """
+    file.seek(0)
+    # Readers are closed even when a caller stops early; an abandoned one
+    # closes the caller's file along with its text wrapper
+    if sniff is None:
+        with pd.read_csv(file, chunksize=chunk_size) as reader:
+            yield from reader
+        return
+
+    rows_read = 0
+    try:
+        with pd.read_csv(file, chunksize=chunk_size, **sniff.read_csv_kwargs()) as reader:
+            while True:
+                try:
+                    chunk = sniff.restore_int_columns(next(reader))
+                except StopIteration:
+                    return
+                rows_read += len(chunk)
+                yield chunk
+    except (ValueError, TypeError):
+        pass
+
+    file.seek(0)
+    skip = rows_read
+    with pd.read_csv(file, chunksize=chunk_size, **sniff.read_csv_kwargs(pin_numeric=False)) as reader:
+        for chunk in reader:
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            yield chunk.iloc[skip:]
+            skip = 0
+
+
+def iter_excel_chunks(file, chunk_size):
+    """Stream rows of the first worksheet in read-only mode
+
+    openpyxl's read-only mode parses the sheet XML lazily, so memory stays
+    bounded by the chunk size instead of the workbook size.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [
+            str(name) if name is not None else f"Unnamed_{i}"
+            for i, name in enumerate(header)
+        ]
+
+        batch = []
+        for row in rows:
+            # Read-only sheets often report trailing blank rows
+            if all(value is None for value in row):
+                continue
+            batch.append(row[:len(columns)])
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+
+    finally:
+        workbook.close()
+
+
+def iter_json_chunks(file, chunk_size, block_size=1024 * 1024):
+    """Incrementally parse a JSON array of records or NDJSON
+
+    Columns are fixed by the first batch of records, like a CSV header:
+    keys first seen later are ignored and missing keys become nulls.
+    Documents that are neither (e.g. a single columnar or nested object)
+    are loaded whole with pandas as a fallback; a lone object of scalars
+    is one record. A leading UTF-8 byte order mark is skipped.
+    """
+    stream = io.TextIOWrapper(file, encoding='utf-8-sig')
+    try:
+        first_char = _peek_first_char(stream)
+
+        if first_char == '[':
+            records = _iter_json_array(stream, block_size)
+        elif first_char == '{' and _is_ndjson(stream):
+            records = _iter_ndjson(stream)
+        else:
+            df = _read_json_document(stream)
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+            return
+
+        columns = None
+        batch = []
+        for record in records:
+            batch.append(_flatten_record(record))
+            if len(batch) >= chunk_size:
+                chunk = pd.DataFrame.from_records(batch, columns=columns)
+                columns = columns or chunk.columns.tolist()
+                yield chunk
+                batch = []
+
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+
+    finally:
+        # Leave the underlying upload open for later passes
+        stream.detach()
+
+
+def _peek_first_char(stream):
+    """First non-whitespace character of a text stream; rewinds the stream"""
+    stream.seek(0)
+    while True:
+        block = stream.read(4096)
+        if not block:
+            stream.seek(0)
+            return ''
+        stripped = block.lstrip()
+        if stripped:
+            stream.seek(0)
+            return stripped[0]
+
+
+def _is_ndjson(stream):
+    """Whether the first two non-blank lines each parse as a JSON object
+
+    A single line holding one object is a whole document (say columnar
+    {"a": [1, 2], "b": [3, 4]}), not a one-record NDJSON file.
+    """
+    stream.seek(0)
+    records = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            is_record = isinstance(json.loads(line), dict)
+        except json.JSONDecodeError:
+            is_record = False
+        if not is_record:
+            break
+        records += 1
+        if records == 2:
+            break
+    stream.seek(0)
+    return records == 2
+
+
+def _read_json_document(stream):
+    """Load a whole JSON document with pandas, or as one record if it is an object of scalars"""
+    stream.seek(0)
+    try:
+        return pd.read_json(stream)
+    except ValueError:
+        stream.seek(0)
+        document = json.load(stream)
+        if not isinstance(document, dict):
+            raise
+        return pd.DataFrame.from_records([_flatten_record(document)])
+
+
+def _iter_ndjson(stream):
+    """Yield one record per non-blank line"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _iter_json_array(stream, block_size):
+    """Yield the elements of a top-level JSON array, reading in blocks"""
+    decoder = json.JSONDecoder()
+    buffer = stream.read(block_size).lstrip()
+    pos = 1  # past the opening '['
+    eof = False
+
+    def refill():
+        nonlocal buffer, pos, eof
+        more = stream.read(block_size)
+        if more:
+            buffer = buffer[pos:] + more
+            pos = 0
+        else:
+            eof = True
+
+    while True:
+        # Skip separators between elements
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            refill()
+
+        if pos >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if buffer[pos] == ']':
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            refill()
+            continue
+
+        # A number at the very end of the buffer may continue in the next block
+        if end == len(buffer) and not eof:
+            refill()
+            continue
+
+        yield value
+        pos = end
+
+
+def _flatten_record(record):
+    """Turn one JSON value into a flat row, serialising nested values"""
+    if not isinstance(record, dict):
+        return {'value': record}
+    return {
+        key: json.dumps(value) if isinstance(value, (dict, list)) else value
+        for key, value in record.items()
+    }
+
+
+def _decompressed_head(file, compression, sample_size):
+    """Decompress just enough of a compressed upload to sniff it"""
+    file.seek(0)
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=file).read(sample_size)
+    if compression == 'bz2':
+        return bz2.BZ2File(file).read(sample_size)
+    if compression == 'xz':
+        return lzma.LZMAFile(file).read(sample_size)
+    with zipfile.ZipFile(file) as archive:
+        with archive.open(archive.namelist()[0]) as member:
+            return member.read(sample_size)
+
+
+def _decode_sample(head):
+    """Pick an encoding for a byte sample and return it with the decoded text"""
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig', head[3:].decode('utf-8', errors='ignore')
+    try:
+        return 'utf-8', head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the sample is still UTF-8
+        if e.start >= len(head) - 3:
+            return 'utf-8', head[:e.start].decode('utf-8')
+        return 'latin-1', head.decode('latin-1')
+
+
+def _all_numeric(fields):
+    """Whether every field of a row parses as a number"""
+    if not fields:
+        return False
+    try:
+        for value in fields:
+            float(value)
+    except ValueError:
+        return False
+    return True
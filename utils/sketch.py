@@ -0,0 +1,272 @@
+import numpy as np
+import pandas as pd
+
+from config import PERFORMANCE_CONFIG
+
+
+class QuantileSketch:
+    """Mergeable quantile summary of a numeric column
+
+    Holds exact value counts while the column has at most `max_exact`
+    distinct values, so codes, flags and ages give exact quantiles. Past
+    that the counts are compressed into a t-digest: weighted centroids
+    that stay small near the tails and grow towards the median, which
+    keeps quartiles and extreme quantiles accurate in bounded memory.
+    Sketches of separate chunks merge into the sketch of the whole column.
+    """
+
+    def __init__(self, compression=None, max_exact=None):
+        self.compression = compression or PERFORMANCE_CONFIG['sketch_compression']
+        self.max_exact = max_exact or PERFORMANCE_CONFIG['sketch_exact_values']
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.exact = True
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def add(self, values, weights=None):
+        """Add values (array or Series, missing values ignored), optionally weighted"""
+        if isinstance(values, pd.Series):
+            values = values.to_numpy(dtype='float64', na_value=np.nan)
+        values = np.atleast_1d(np.asarray(values, dtype='float64'))
+        weights = np.ones(len(values)) if weights is None \
+            else np.atleast_1d(np.asarray(weights, dtype='float64'))
+
+        finite = np.isfinite(values)
+        values, weights = values[finite], weights[finite]
+        if len(values) == 0:
+            return self
+
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._absorb(values, weights, exact=True)
+        return self
+
+    def remove(self, values):
+        """Take previously added values back out (array or Series, missing values ignored)
+
+        Exact while the sketch holds exact counts. Once compressed each
+        value's weight comes off the nearest centroid, so quantiles stay
+        approximate and min and max remain outer bounds.
+        """
+        if isinstance(values, pd.Series):
+            values = values.to_numpy(dtype='float64', na_value=np.nan)
+        values = np.atleast_1d(np.asarray(values, dtype='float64'))
+        values = values[np.isfinite(values)]
+        if len(values) == 0 or len(self.means) == 0:
+            return self
+
+        position = np.clip(np.searchsorted(self.means, values), 0, len(self.means) - 1)
+        if self.exact:
+            found = self.means[position] == values
+            position = position[found]
+        else:
+            left = np.maximum(position - 1, 0)
+            closer_left = np.abs(self.means[left] - values) < np.abs(self.means[position] - values)
+            position = np.where(closer_left, left, position)
+
+        weights = self.weights.copy()
+        np.subtract.at(weights, position, 1.0)
+        kept = weights > 0
+        self.means, self.weights = self.means[kept], weights[kept]
+        if len(self.means) == 0:
+            self.min, self.max = np.inf, -np.inf
+        elif self.exact:
+            self.min, self.max = float(self.means[0]), float(self.means[-1])
+        return self
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        if other.count == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._absorb(other.means, other.weights, exact=other.exact)
+        return self
+
+    def quantile(self, q):
+        """Linearly interpolated quantile(s), matching Series.quantile when exact"""
+        q = np.asarray(q, dtype='float64')
+        n = self.count
+        if n == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+
+        cumulative = np.cumsum(self.weights)
+        if self.exact:
+            position = q * (n - 1)
+            lower_rank = np.floor(position)
+            upper_rank = np.minimum(lower_rank + 1, n - 1)
+            lower = self.means[np.searchsorted(cumulative, lower_rank, side='right')]
+            upper = self.means[np.searchsorted(cumulative, upper_rank, side='right')]
+            # Interpolated from the nearer end, as numpy does, so results are identical
+            t = position - lower_rank
+            diff = upper - lower
+            result = np.where(t >= 0.5, upper - diff * (1 - t), lower + diff * t)
+        else:
+            # Centroid means sit at the middle of the ranks they cover; a
+            # single value at rank i covers [i, i + 1), as in Series.quantile
+            centres = cumulative - self.weights / 2
+            result = np.interp(
+                q * (n - 1) + 0.5,
+                np.concatenate([[0.0], centres, [n]]),
+                np.concatenate([[self.min], self.means, [self.max]])
+            )
+        return float(result) if result.ndim == 0 else result
+
+    def clip(self, lower, upper):
+        """Sketch of the same values clipped to [lower, upper], as capping leaves them
+
+        Exact while the sketch holds exact counts; once compressed a
+        centroid straddling a bound keeps its mean.
+        """
+        clipped = QuantileSketch(self.compression, self.max_exact)
+        if self.count == 0:
+            return clipped
+        clipped.min = float(np.clip(self.min, lower, upper))
+        clipped.max = float(np.clip(self.max, lower, upper))
+        means = np.clip(self.means, lower, upper)
+        if self.exact:
+            clipped.means, inverse = np.unique(means, return_inverse=True)
+            clipped.weights = np.bincount(inverse, weights=self.weights)
+        else:
+            clipped.exact = False
+            clipped.means, clipped.weights = means, self.weights.copy()
+        return clipped
+
+    def count_outside(self, lower, upper):
+        """Number of values below `lower` or above `upper` (estimated once compressed)"""
+        if self.count == 0 or (lower <= self.min and upper >= self.max):
+            return 0
+        if self.exact:
+            return int(self.weights[(self.means < lower) | (self.means > upper)].sum())
+
+        n = self.count
+        centres = np.cumsum(self.weights) - self.weights / 2
+        xp = np.concatenate([[self.min], self.means, [self.max]])
+        fp = np.concatenate([[0.0], centres, [n]])
+        below = np.interp(lower, xp, fp) if lower > self.min else 0.0
+        above = n - np.interp(upper, xp, fp) if upper < self.max else 0.0
+        return int(round(below + above))
+
+    def box_stats(self):
+        """Quartiles and Tukey whisker ends, as accepted by plotly's go.Box"""
+        q1, median, q3 = (float(value) for value in self.quantile([0.25, 0.5, 0.75]))
+        iqr = q3 - q1
+        lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        if self.exact:
+            inside = self.means[(self.means >= lower) & (self.means <= upper)]
+            lower_fence, upper_fence = inside.min(), inside.max()
+        else:
+            lower_fence, upper_fence = max(lower, self.min), min(upper, self.max)
+        return {
+            'q1': q1, 'median': median, 'q3': q3,
+            'lowerfence': float(lower_fence), 'upperfence': float(upper_fence)
+        }
+
+    def to_dict(self):
+        return {
+            'compression': self.compression,
+            'max_exact': self.max_exact,
+            'exact': self.exact,
+            'min': self.min,
+            'max': self.max,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist()
+        }
+
+    @classmethod
+    def from_sorted(cls, values):
+        """Sketch of a sorted float array (NaN last, as np.sort leaves them)
+
+        Same result as add(), without the sort add() does to count values.
+        """
+        sketch = cls()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return sketch
+        starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+        means = values[starts]
+        weights = np.diff(np.append(starts, len(values))).astype('float64')
+        sketch.min, sketch.max = float(values[0]), float(values[-1])
+        if len(means) <= sketch.max_exact:
+            sketch.means, sketch.weights = means, weights
+        else:
+            sketch.exact = False
+            sketch.means, sketch.weights = sketch._compress(means, weights)
+        return sketch
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['compression'], data['max_exact'])
+        sketch.exact = data['exact']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch.means = np.asarray(data['means'], dtype='float64')
+        sketch.weights = np.asarray(data['weights'], dtype='float64')
+        return sketch
+
+    def _absorb(self, means, weights, exact):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+
+        if self.exact and exact:
+            values, inverse = np.unique(means, return_inverse=True)
+            weights = np.bincount(inverse, weights=weights)
+            if len(values) <= self.max_exact:
+                self.means, self.weights = values, weights
+                return
+            means = values
+        else:
+            order = np.argsort(means, kind='stable')
+            means, weights = means[order], weights[order]
+
+        self.exact = False
+        self.means, self.weights = self._compress(means, weights)
+
+    def _compress(self, means, weights):
+        """Merge sorted centroids that fall in the same unit of the t-digest scale
+
+        The arcsine scale function gives each centroid a quantile range of
+        about pi / compression near the median and far less near the tails.
+        """
+        cumulative = np.cumsum(weights)
+        middle = (cumulative - weights / 2) / cumulative[-1]
+        scale = self.compression / (2 * np.pi) * np.arcsin(2 * middle - 1)
+        bins = np.floor(scale)
+        starts = np.flatnonzero(np.concatenate([[True], bins[1:] != bins[:-1]]))
+
+        merged_weights = np.add.reduceat(weights, starts)
+        merged_means = np.add.reduceat(means * weights, starts) / merged_weights
+        # Rounding can nudge a mean past its neighbour; keep them sorted
+        return np.maximum.accumulate(merged_means), merged_weights
+
+
+def column_sketches(df, sketches=None, block_columns=64):
+    """Add the numeric columns of a frame to per-column sketches
+
+    Pass the result back in with the next chunk to sketch a file chunk by
+    chunk; returns the dict of QuantileSketch objects. Columns are sorted
+    `block_columns` at a time in one numpy call, which is much faster on
+    wide frames than sorting them one by one.
+    """
+    sketches = {} if sketches is None else sketches
+    numeric = df.select_dtypes(include=['number']).columns
+    for start in range(0, len(numeric), block_columns):
+        group = numeric[start:start + block_columns]
+        block = np.sort(df[group].to_numpy(dtype='float64', na_value=np.nan), axis=0)
+        for i, col in enumerate(group):
+            sketch = QuantileSketch.from_sorted(block[:, i])
+            if col in sketches:
+                sketches[col].merge(sketch)
+            else:
+                sketches[col] = sketch
+    return sketches
+
+
+def sketches_to_dict(sketches):
+    """JSON-ready form of column_sketches output, as kept in session entries"""
+    return {col: sketch.to_dict() for col, sketch in sketches.items()}
@@ -1,9 +1,14 @@
-import pandas as pd
 import streamlit as st
 from pathlib import Path
+from utils.readers import sniff_file
 
 def validate_csv_file(file):
-    """Validate uploaded CSV file"""
+    """Validate uploaded CSV file
+    
+    Returns the file's SniffResult when it is valid, so the parser can reuse
+    the delimiter, encoding, dtypes and date formats found here, and False
+    otherwise.
+    """
     
     try:
         # Check file size (max 200MB)
@@ -17,25 +22,21 @@ def validate_csv_file(file):
             st.error(f"Unsupported file type: {file_extension}")
             return False
         
-        # Try to read a sample of the file
+        # Sniff the head of the file once; the result is reused by the parser
+        sniff = sniff_file(file)
+        
         if file_extension == '.csv':
-            # Read first few rows to validate
-            sample_df = pd.read_csv(file, nrows=5)
-            
-            # Reset file pointer
-            file.seek(0)
-            
             # Check if DataFrame is empty
-            if sample_df.empty:
+            if sniff.sample_rows == 0:
                 st.error(f"File {file.name} appears to be empty.")
                 return False
             
             # Check minimum columns
-            if len(sample_df.columns) < 1:
+            if len(sniff.dtypes) < 1:
                 st.error(f"File {file.name} must have at least 1 column.")
                 return False
             
-        return True
+        return sniff
         
     except Exception as e:
         st.error(f"Error validating file {file.name}: {str(e)}")